@@ -0,0 +1,103 @@
+"""Benchmark per-canvas normalization cost and byte savings.
+
+Times the submission-side image work (decode, fingerprints, crop +
+quantize + re-encode) for PNG and lossless WebP output on synthetic
+canvases: a faded background with either a small local sketch or strokes
+spread over the whole canvas.
+
+Usage: python benchmarks/bench_canvas_normalize.py [--sizes 800x600 1600x1200] [--repeat 10]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ta_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from core.canvas import load_canvas_image, normalize_canvas, perceptual_hashes, pixel_hash  # noqa: E402
+
+
+def make_canvas(width, height, spread):
+    """PNG bytes of a canvas with a faded background and black strokes"""
+    rng = np.random.default_rng(width * height)
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    y = np.linspace(0, 255, height, dtype=np.uint8)
+    background = np.zeros((height, width, 4), dtype=np.uint8)
+    background[..., 0] = x[np.newaxis, :]
+    background[..., 1] = y[:, np.newaxis]
+    background[..., 2] = 200
+    background[..., 3] = 178
+    image = Image.fromarray(background, mode='RGBA')
+
+    draw = ImageDraw.Draw(image)
+    if spread:
+        area = (0, 0, width, height)
+    else:
+        area = (width // 3, height // 3, width // 2, height // 2)
+    for _ in range(25):
+        points = [
+            (int(rng.integers(area[0], area[2])), int(rng.integers(area[1], area[3])))
+            for _ in range(6)
+        ]
+        draw.line(points, fill=(0, 0, 0, 255), width=4)
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def timed(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', nargs='+', default=['800x600', '1155x866', '1633x1225', '2309x1732'])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    sizes = [tuple(int(value) for value in size.split('x')) for size in args.sizes]
+    # Sizes past the submission limits are measured too, to show how cost grows
+    settings.CANVAS_MAX_WIDTH = max(width for width, _ in sizes)
+    settings.CANVAS_MAX_HEIGHT = max(height for _, height in sizes)
+
+    print(
+        f"{'size':>10} {'drawing':<7} {'format':<6} {'in KiB':>7} {'out KiB':>8} {'saved':>6} "
+        f"{'decode ms':>10} {'hash ms':>8} {'normalize ms':>13}"
+    )
+    for size, (width, height) in zip(args.sizes, sizes):
+        for spread in (False, True):
+            raw = make_canvas(width, height, spread)
+            decode_ms, image = timed(lambda: load_canvas_image(raw), args.repeat)
+            hash_ms, _ = timed(lambda: (pixel_hash(image), perceptual_hashes(image)), args.repeat)
+
+            for storage_format in ('png', 'webp'):
+                settings.CANVAS_STORAGE_FORMAT = storage_format
+                normalize_ms, normalized = timed(lambda: normalize_canvas(image, len(raw)), args.repeat)
+                out_size = normalized.content.size
+                print(
+                    f"{size:>10} {'spread' if spread else 'sketch':<7} {storage_format:<6} "
+                    f"{len(raw) / 1024:>7.0f} {out_size / 1024:>8.1f} {1 - out_size / len(raw):>6.0%} "
+                    f"{decode_ms:>10.1f} {hash_ms:>8.1f} {normalize_ms:>13.1f}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Benchmark submit_drawing body parsing: JSON data URL vs binary uploads.
+
+Each measurement runs in a fresh interpreter so peak RSS is not polluted by
+earlier cases. Reported per case: median parse time (request body to a
+canvas ready for hashing/storage), peak RSS of the process (the startup
+baseline is printed for reference) and the peak of Python allocations
+seen by tracemalloc.
+
+Usage: python benchmarks/bench_canvas_upload.py [--megapixels 1 2 3 4] [--repeat 5]
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ta_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+from django.core.handlers.wsgi import WSGIRequest  # noqa: E402
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+
+from core.canvas import decode_canvas_data  # noqa: E402
+from core.parsers import CanvasMultiPartParser, PNGUploadParser  # noqa: E402
+
+CASES = {
+    'json': 'application/json',
+    'multipart': MULTIPART_CONTENT,
+    'raw': 'image/png',
+}
+
+
+def make_canvas(megapixels):
+    """PNG bytes of a 4:3 canvas with a faded background and some strokes"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(megapixels)
+
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    background = np.zeros((height, width, 4), dtype=np.uint8)
+    background[..., 0] = gradient
+    background[..., 1] = gradient[::-1]
+    background[..., 2] = rng.integers(0, 32, size=(height, width), dtype=np.uint8) + 160
+    background[..., 3] = 178
+    image = Image.fromarray(background, mode='RGBA')
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        points = [tuple(point) for point in rng.integers(0, [width, height], size=(8, 2))]
+        draw.line(points, fill=(0, 0, 0, 255), width=4)
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def write_body(case, png_bytes, path):
+    if case == 'json':
+        data_url = 'data:image/png;base64,' + base64.b64encode(png_bytes).decode('ascii')
+        body = json.dumps({'canvas_data': data_url, 'time_spent': 30}).encode('utf-8')
+    elif case == 'multipart':
+        body = encode_multipart(BOUNDARY, {'canvas': BytesIO(png_bytes), 'time_spent': '30'})
+    else:
+        body = png_bytes
+    path.write_bytes(body)
+    return len(body)
+
+
+def parse_body(case, body_path):
+    """Parse a request body the way submit_drawing does, returning the canvas"""
+    size = body_path.stat().st_size
+    with open(body_path, 'rb') as body:
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/api/topic/1/submit/',
+            'QUERY_STRING': 'time_spent=30',
+            'CONTENT_TYPE': CASES[case],
+            'CONTENT_LENGTH': str(size),
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'wsgi.input': body,
+        }
+        request = Request(
+            WSGIRequest(environ),
+            parsers=[JSONParser(), CanvasMultiPartParser(), PNGUploadParser()]
+        )
+        canvas = request.FILES.get('canvas')
+        if canvas is None:
+            canvas = decode_canvas_data(request.data['canvas_data'])
+        return canvas
+
+
+def peak_rss_kb():
+    """High-water RSS of this process in KiB
+
+    VmHWM is used where available because ru_maxrss survives exec on Linux
+    and would report the parent's peak.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(case, body_path):
+    body_path = Path(body_path)
+    baseline_kb = peak_rss_kb()
+
+    started = time.perf_counter()
+    canvas = parse_body(case, body_path)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    peak_kb = peak_rss_kb()
+    del canvas
+
+    tracemalloc.start()
+    canvas = parse_body(case, body_path)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({'ms': elapsed_ms, 'baseline_kb': baseline_kb, 'rss_kb': peak_kb, 'traced': traced_peak}))
+
+
+def measure(case, body_path, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', case, str(body_path)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'ms': statistics.median(run['ms'] for run in runs),
+        'baseline_kb': statistics.median(run['baseline_kb'] for run in runs),
+        'rss_kb': statistics.median(run['rss_kb'] for run in runs),
+        'traced': statistics.median(run['traced'] for run in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--megapixels', type=int, nargs='+', default=[1, 2, 3, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', nargs=2, metavar=('CASE', 'BODY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    print(f"{'MP':>3} {'path':<10} {'PNG KiB':>8} {'body KiB':>9} {'parse ms':>9} {'peak RSS MiB':>13} {'(startup)':>10} {'py peak MiB':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for megapixels in args.megapixels:
+            png_bytes = make_canvas(megapixels)
+            for case in CASES:
+                body_path = Path(workdir) / f'{megapixels}-{case}.body'
+                body_size = write_body(case, png_bytes, body_path)
+                result = measure(case, body_path, args.repeat)
+                print(
+                    f"{megapixels:>3} {case:<10} {len(png_bytes) / 1024:>8.0f} {body_size / 1024:>9.0f} "
+                    f"{result['ms']:>9.2f} {result['rss_kb'] / 1024:>13.1f} {result['baseline_kb'] / 1024:>10.1f} {result['traced'] / 2 ** 20:>12.1f}"
+                )
+
+
+if __name__ == '__main__':
+    main()
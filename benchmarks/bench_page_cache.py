@@ -0,0 +1,105 @@
+"""Benchmark home and topic_detail throughput with and without the page cache.
+
+Runs against a throwaway test database seeded with one student in several
+groups of topics, and drives the views through the Django test client
+(session and auth included, no network). Reported per page: requests/s
+and median latency with PAGE_CACHE_ENABLED off and on, plus the hit rate
+counted by the cache.
+
+Usage: python benchmarks/bench_page_cache.py [--groups 5] [--topics 40] [--requests 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ta_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from core import metrics  # noqa: E402
+from core.models import Group, Topic  # noqa: E402
+
+
+def seed(group_count, topic_count):
+    """One student in group_count groups of topic_count topics each"""
+    teacher = User.objects.create_user(username='teacher', password='bench', is_staff=True)
+    student = User.objects.create_user(username='student', password='bench')
+    for number in range(group_count):
+        group = Group.objects.create(name=f'Group {number}', created_by=teacher)
+        group.members.add(student)
+        Topic.objects.bulk_create([
+            Topic(
+                title=f'Topic {number}-{topic}',
+                prompt='Benchmark prompt',
+                instructional_text='Draw the shape described here.',
+                group=group,
+                created_by=teacher,
+                content_generated=True
+            )
+            for topic in range(topic_count)
+        ])
+    return student, Topic.objects.filter(group__members=student).first()
+
+
+def measure(client, url, requests):
+    timings = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - request_started) * 1000)
+        assert response.status_code == 200, response.status_code
+    elapsed = time.perf_counter() - started
+    return requests / elapsed, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--groups', type=int, default=5)
+    parser.add_argument('--topics', type=int, default=40, help='topics per group')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        student, topic = seed(args.groups, args.topics)
+        client = Client()
+        client.force_login(student)
+        pages = {
+            'home': reverse('home'),
+            'topic': reverse('topic_detail', args=[topic.id]),
+        }
+
+        print(f"{args.groups} groups x {args.topics} topics, {args.requests} requests per case")
+        print(f"{'page':<6} {'cache':<5} {'req/s':>8} {'median ms':>10} {'hit rate':>9}")
+        for page, url in pages.items():
+            for enabled in (False, True):
+                settings.PAGE_CACHE_ENABLED = enabled
+                metrics.reset()
+                client.get(url)
+                rate, median_ms = measure(client, url, args.requests)
+                hit_rate = metrics.hit_rate(f'page_cache.{page}')
+                print(
+                    f"{page:<6} {'on' if enabled else 'off':<5} {rate:>8.0f} {median_ms:>10.2f} "
+                    f"{'-' if hit_rate is None else f'{hit_rate:.0%}':>9}"
+                )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
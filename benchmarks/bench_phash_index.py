@@ -0,0 +1,50 @@
+"""Benchmark perceptual-hash lookups over a large per-topic index.
+
+Usage: python benchmarks/bench_phash_index.py [--size 100000] [--lookups 2000]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ta_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from core.canvas import to_signed64  # noqa: E402
+from core.phash_index import PerceptualHashIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    hashes = rng.integers(0, np.iinfo(np.uint64).max, size=args.size, dtype=np.uint64, endpoint=True)
+    index = PerceptualHashIndex(hashes, range(args.size))
+
+    queries = [to_signed64(int(value)) for value in rng.choice(hashes, size=args.lookups)]
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.nearest(query)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings = np.array(timings)
+    print(f'index size: {len(index)} hashes ({hashes.nbytes / 1024:.0f} KiB)')
+    print(f'lookups:    {args.lookups}')
+    print(f'p50: {np.percentile(timings, 50):.3f} ms')
+    print(f'p99: {np.percentile(timings, 99):.3f} ms')
+    print(f'max: {timings.max():.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Benchmark submission write throughput under concurrent writers on SQLite.
+
+Each writer thread plays one student submitting to the same topic in a
+loop: reserve_attempt, record_evaluation and a generation log insert,
+the write path of one submission. Jobs are written as AIJob rows (as with
+AI_TASK_BACKEND = 'db') and never run. Reader threads meanwhile load a
+student's progress rows. Runs against a throwaway file-backed test
+database under three profiles:
+
+  rollback   SQLite defaults (rollback journal, synchronous=FULL)
+  wal        the settings profile (WAL, synchronous=NORMAL, busy_timeout, mmap, cache)
+  wal+lane   the settings profile with SQLITE_WRITE_LANE serializing the writes
+
+Reported per profile and writer count: submissions/s, p50/p95 submission
+latency, p95 read latency and submissions that failed (e.g. "database is
+locked").
+
+Usage: python benchmarks/bench_sqlite_writers.py [--writers 1 4 8 16] [--seconds 3] [--readers 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ta_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection, connections, OperationalError  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from core.canvas import StoredCanvas  # noqa: E402
+from core.models import AIGenerationLog, Group, Topic, UserTopicProgress  # noqa: E402
+from core.services import SubmissionService  # noqa: E402
+from core.write_lane import run_serialized  # noqa: E402
+
+PROFILES = {
+    'rollback': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_BUSY_TIMEOUT_MS': '',
+        'SQLITE_MMAP_SIZE': 0,
+        'SQLITE_CACHE_SIZE_KB': '',
+        'SQLITE_WRITE_LANE': False,
+    },
+    'wal': {'SQLITE_WRITE_LANE': False},
+    'wal+lane': {'SQLITE_WRITE_LANE': True},
+}
+CANVAS = StoredCanvas('canvases/00/bench.png', '0' * 64, 1024, 4096)
+
+
+def seed(student_count):
+    teacher = User.objects.create_user(username='teacher', is_staff=True)
+    students = User.objects.bulk_create([User(username=f'student{number}') for number in range(student_count)])
+    group = Group.objects.create(name='Bench Group', created_by=teacher)
+    group.members.add(*students)
+    topic = Topic.objects.create(title='Bench Topic', prompt='Benchmark prompt', group=group, created_by=teacher)
+    return list(User.objects.filter(username__startswith='student')), topic
+
+
+def submit(student, topic):
+    attempt = SubmissionService.reserve_attempt(student, topic, CANVAS, 30)
+    SubmissionService.record_evaluation(attempt, {'score': 10, 'is_correct': False, 'feedback': 'Try again'})
+    run_serialized(
+        AIGenerationLog.objects.create,
+        generation_type='evaluation',
+        prompt='Benchmark prompt',
+        attempt=attempt,
+        success=True
+    )
+
+
+def writer(student, topic, deadline, latencies, errors):
+    try:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                submit(student, topic)
+            except OperationalError:
+                errors.append(1)
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        connections.close_all()
+
+
+def reader(student, deadline, latencies):
+    try:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            list(UserTopicProgress.objects.filter(user=student).order_by())
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        connections.close_all()
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(students, topic, writer_count, reader_count, seconds):
+    latencies, read_latencies, errors = [], [], []
+    deadline = time.monotonic() + seconds
+    threads = [
+        threading.Thread(target=writer, args=(students[number], topic, deadline, latencies, errors))
+        for number in range(writer_count)
+    ] + [
+        threading.Thread(target=reader, args=(students[number], deadline, read_latencies))
+        for number in range(reader_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'rate': len(latencies) / seconds,
+        'p50': statistics.median(latencies) if latencies else float('nan'),
+        'p95': percentile(latencies, 0.95),
+        'read_p95': percentile(read_latencies, 0.95),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    settings.AI_TASK_BACKEND = 'db'
+    settings.AI_TASKS_EAGER = False
+    defaults = {name: getattr(settings, name) for name in PROFILES['rollback']}
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        students, topic = seed(max(args.writers + [args.readers]))
+        print(f"{'profile':<9} {'writers':>7} {'subs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'read p95 ms':>12} {'errors':>7}")
+        for profile, overrides in PROFILES.items():
+            for name, value in {**defaults, **overrides}.items():
+                setattr(settings, name, value)
+            # Reconnect so the profile (and its journal mode) is applied
+            # before any worker connection is open
+            connections.close_all()
+            connection.ensure_connection()
+            for writer_count in args.writers:
+                result = run(students, topic, writer_count, args.readers, args.seconds)
+                print(
+                    f"{profile:<9} {writer_count:>7} {result['rate']:>8.0f} {result['p50']:>8.1f} "
+                    f"{result['p95']:>8.1f} {result['read_p95']:>12.2f} {result['errors']:>7}"
+                )
+    finally:
+        for name, value in defaults.items():
+            setattr(settings, name, value)
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import get_object_or_404
+from .models import Topic
+from .page_cache import cache_ttl
+
+MEMBERSHIP_KEY = 'access:groups:{}'
+
+
+class TopicAccess:
+    """Topic authorization backed by a per-user cache of group memberships
+
+    A user's group IDs are loaded once and kept in the page cache alias
+    until Group.members changes for them (see signals) or
+    MEMBERSHIP_CACHE_TTL passes, so a warm access check costs no query.
+    With a per-process cache the TTL is capped at LOCAL_CACHE_MAX_TTL, as
+    other processes never see the invalidation.
+    """
+
+    @staticmethod
+    def cache():
+        return caches[settings.PAGE_CACHE_ALIAS]
+
+    @staticmethod
+    def group_ids(user):
+        """frozenset of the IDs of the groups the user is a member of"""
+        key = MEMBERSHIP_KEY.format(user.id)
+        group_ids = TopicAccess.cache().get(key)
+        if group_ids is None:
+            group_ids = frozenset(user.ta_groups.values_list('id', flat=True))
+            TopicAccess.cache().set(key, group_ids, cache_ttl(settings.MEMBERSHIP_CACHE_TTL))
+        return group_ids
+
+    @staticmethod
+    def can_access(user, topic):
+        return topic.group_id in TopicAccess.group_ids(user)
+
+    @staticmethod
+    def get_topic(user, topic_id):
+        """(topic with its group, whether the user may access it)
+
+        Raises Http404 if the topic does not exist.
+        """
+        topic = get_object_or_404(Topic.objects.select_related('group'), id=topic_id)
+        return topic, TopicAccess.can_access(user, topic)
+
+    @staticmethod
+    def invalidate(user_id):
+        TopicAccess.cache().delete(MEMBERSHIP_KEY.format(user_id))
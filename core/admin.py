@@ -1,8 +1,94 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Group, Topic, UserTopicProgress, Attempt, AIGenerationLog
+from django.utils import timezone
+from .models import Group, Topic, UserTopicProgress, Attempt, AIGenerationLog, AIJob, CachedAIResponse, ProgressAggregate
+
+# Large text columns no changelist displays
+TOPIC_HEAVY_FIELDS = ['description', 'prompt', 'instructional_text', 'generation_error']
+ATTEMPT_HEAVY_FIELDS = ['canvas_data', 'feedback', 'updated_instructional_text', 'evaluation_error']
+
+
+def related_fields(prefix, fields):
+    return [f'{prefix}__{field}' for field in fields]
+
+
+def count_subquery(queryset, field):
+    """Correlated count of the queryset rows whose field points at the outer row
+    
+    Unlike Count() over a join, several of these do not multiply each other's
+    rows, and the changelist's COUNT(*) leaves them out.
+    """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('*'))
+    return Coalesce(Subquery(counts.values('count')), 0)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips COUNT(*) on large unfiltered tables
+    
+    An unfiltered changelist takes the database's row estimate (the largest
+    rowid on SQLite, the planner statistics on PostgreSQL), which is exact
+    until rows are deleted; after deletions the last pages may come up
+    short. Filtered lists and tables below ADMIN_ESTIMATED_COUNT_THRESHOLD
+    rows are counted exactly.
+    """
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self.estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+    
+    @staticmethod
+    def estimated_count(model, using):
+        """Row estimate of a model's table, or None when the backend has none"""
+        connection = connections[using]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+        if not row or row[0] is None or row[0] < 0:
+            return None
+        return row[0]
+
+
+class DeferringChangeList(ChangeList):
+    """ChangeList that leaves the model admin's list_defer columns unloaded"""
+    
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.defer(*self.model_admin.list_defer)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin for tables that grow with every submission
+    
+    The changelist defers list_defer, estimates the total instead of
+    counting it (see EstimatedCountPaginator) and does not count the
+    unfiltered table next to a filtered one. Change forms load every column.
+    """
+    list_defer = []
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_changelist(self, request, **kwargs):
+        return DeferringChangeList
 
 
 @admin.register(Group)
@@ -12,14 +98,23 @@ class GroupAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     filter_horizontal = ['members']
     readonly_fields = ['created_at']
+    list_select_related = ['created_by']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            member_count=count_subquery(Group.members.through.objects, 'group'),
+            topic_count=count_subquery(Topic.objects, 'group')
+        )
     
     def member_count(self, obj):
-        return obj.members.count()
+        return obj.member_count
     member_count.short_description = 'Members'
+    member_count.admin_order_field = 'member_count'
     
     def topic_count(self, obj):
-        return obj.topics.count()
+        return obj.topic_count
     topic_count.short_description = 'Topics'
+    topic_count.admin_order_field = 'topic_count'
 
 
 @admin.register(Topic)
@@ -54,11 +149,13 @@ class TopicAdmin(admin.ModelAdmin):
 
 
 @admin.register(UserTopicProgress)
-class UserTopicProgressAdmin(admin.ModelAdmin):
+class UserTopicProgressAdmin(LargeTableAdmin):
     list_display = ['user', 'topic', 'completed', 'final_score', 'total_attempts', 'total_time_display']
     list_filter = ['completed', 'topic__group', 'first_attempt_at']
     search_fields = ['user__username', 'topic__title']
     readonly_fields = ['first_attempt_at', 'completed_at']
+    list_select_related = ['user', 'topic__group']
+    list_defer = related_fields('topic', TOPIC_HEAVY_FIELDS)
     
     def total_time_display(self, obj):
         if obj.total_time_spent:
@@ -70,22 +167,24 @@ class UserTopicProgressAdmin(admin.ModelAdmin):
 
 
 @admin.register(Attempt)
-class AttemptAdmin(admin.ModelAdmin):
+class AttemptAdmin(LargeTableAdmin):
     list_display = ['user', 'topic', 'attempt_number', 'score', 'is_correct', 'time_display', 'submitted_at']
-    list_filter = ['is_correct', 'evaluation_completed', 'submitted_at', 'topic__group']
+    list_filter = ['is_correct', 'evaluation_completed', 'evaluation_source', 'submitted_at', 'topic__group']
     search_fields = ['user__username', 'topic__title']
-    readonly_fields = ['id', 'submitted_at', 'evaluation_completed']
+    readonly_fields = ['id', 'submitted_at', 'evaluation_completed', 'canvas_sha256', 'canvas_bytes', 'canvas_original_bytes', 'canvas_savings_display']
+    list_select_related = ['user', 'topic__group']
+    list_defer = ATTEMPT_HEAVY_FIELDS + related_fields('topic', TOPIC_HEAVY_FIELDS)
     
     fieldsets = (
         ('Attempt Information', {
             'fields': ('user', 'topic', 'attempt_number', 'started_at', 'submitted_at')
         }),
         ('Canvas Data', {
-            'fields': ('canvas_data',),
+            'fields': ('canvas_file', 'canvas_sha256', 'canvas_bytes', 'canvas_original_bytes', 'canvas_savings_display'),
             'classes': ('collapse',)
         }),
         ('Evaluation Results', {
-            'fields': ('score', 'is_correct', 'feedback', 'evaluation_completed', 'evaluation_error')
+            'fields': ('score', 'is_correct', 'feedback', 'evaluation_completed', 'evaluation_error', 'evaluation_source')
         }),
         ('Updated Content', {
             'fields': ('updated_background_image', 'updated_instructional_text'),
@@ -100,18 +199,32 @@ class AttemptAdmin(admin.ModelAdmin):
             return f"{minutes}m {seconds}s"
         return "0s"
     time_display.short_description = 'Time Spent'
+    
+    def canvas_savings_display(self, obj):
+        if obj.canvas_original_bytes:
+            return f"{obj.canvas_bytes_saved} bytes ({obj.canvas_bytes_saved * 100 // obj.canvas_original_bytes}%)"
+        return "-"
+    canvas_savings_display.short_description = 'Normalization Savings'
 
 
 @admin.register(AIGenerationLog)
-class AIGenerationLogAdmin(admin.ModelAdmin):
-    list_display = ['generation_type', 'success', 'topic_link', 'attempt_link', 'created_at']
-    list_filter = ['generation_type', 'success', 'created_at']
-    search_fields = ['prompt', 'response', 'error_message']
-    readonly_fields = ['created_at']
+class AIGenerationLogAdmin(LargeTableAdmin):
+    list_display = ['generation_type', 'success', 'cache_hit', 'latency_ms', 'retry_count', 'topic_link', 'attempt_link', 'created_at']
+    list_filter = ['generation_type', 'success', 'cache_hit', 'created_at']
+    # Prompts and responses are too large to scan with LIKE; search the
+    # topic title and the (short) error message instead
+    search_fields = ['topic__title', 'error_message']
+    readonly_fields = ['created_at', 'latency_ms', 'retry_count', 'cache_hit']
+    list_select_related = ['topic', 'attempt']
+    list_defer = (
+        ['prompt', 'response', 'error_message']
+        + related_fields('topic', TOPIC_HEAVY_FIELDS)
+        + related_fields('attempt', ATTEMPT_HEAVY_FIELDS)
+    )
     
     fieldsets = (
         ('Generation Info', {
-            'fields': ('generation_type', 'success', 'created_at')
+            'fields': ('generation_type', 'success', 'created_at', 'latency_ms', 'retry_count', 'cache_hit')
         }),
         ('Content', {
             'fields': ('prompt', 'response', 'error_message')
@@ -127,20 +240,65 @@ class AIGenerationLogAdmin(admin.ModelAdmin):
     )
     
     def topic_link(self, obj):
-        if obj.topic:
-            url = reverse('admin:core_topic_change', args=[obj.topic.id])
+        if obj.topic_id:
+            url = reverse('admin:core_topic_change', args=[obj.topic_id])
             return format_html('<a href="{}">{}</a>', url, obj.topic.title)
         return '-'
     topic_link.short_description = 'Topic'
     
     def attempt_link(self, obj):
-        if obj.attempt:
-            url = reverse('admin:core_attempt_change', args=[obj.attempt.id])
+        if obj.attempt_id:
+            url = reverse('admin:core_attempt_change', args=[obj.attempt_id])
             return format_html('<a href="{}">{}</a>', url, f"Attempt {obj.attempt.attempt_number}")
         return '-'
     attempt_link.short_description = 'Attempt'
 
 
+@admin.register(AIJob)
+class AIJobAdmin(LargeTableAdmin):
+    list_display = ['id', 'job_type', 'priority', 'user', 'status', 'attempts', 'max_attempts', 'run_after', 'lease_owner',
+                    'created_at', 'started_at', 'finished_at']
+    list_filter = ['status', 'priority', 'job_type']
+    search_fields = ['=id', 'user__username', 'lease_owner']
+    readonly_fields = ['job_type', 'user', 'payload', 'attempts', 'lease_owner', 'lease_expires_at', 'last_error',
+                       'created_at', 'started_at', 'finished_at', 'topic', 'attempt']
+    list_select_related = ['user']
+    list_defer = ['payload', 'last_error']
+    actions = ['requeue_jobs']
+    
+    def requeue_jobs(self, request, queryset):
+        requeued = queryset.filter(status=AIJob.STATUS_FAILED).update(
+            status=AIJob.STATUS_QUEUED,
+            attempts=0,
+            run_after=timezone.now(),
+            finished_at=None
+        )
+        self.message_user(request, f'{requeued} jobs requeued')
+    requeue_jobs.short_description = 'Requeue selected failed jobs'
+
+
+@admin.register(CachedAIResponse)
+class CachedAIResponseAdmin(admin.ModelAdmin):
+    list_display = ['key', 'generation_type', 'size_bytes', 'hit_count', 'last_accessed_at', 'expires_at']
+    list_filter = ['generation_type']
+    search_fields = ['=key']
+    readonly_fields = ['key', 'generation_type', 'text_response', 'blob_name', 'size_bytes', 'hit_count',
+                       'created_at', 'last_accessed_at', 'expires_at']
+
+
+@admin.register(ProgressAggregate)
+class ProgressAggregateAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'group', 'topic', 'learners', 'completed_learners', 'mean_score_display', 'updated_at']
+    list_filter = ['group']
+    readonly_fields = ['group', 'topic', 'learners', 'completed_learners', 'total_attempts', 'total_time_spent',
+                       'scored_attempts', 'score_sum', 'score_histogram', 'updated_at']
+    
+    def mean_score_display(self, obj):
+        mean_score = obj.mean_score
+        return f"{mean_score:.1f}" if mean_score is not None else "-"
+    mean_score_display.short_description = 'Mean Score'
+
+
 # Customize admin site
 admin.site.site_header = "Teacher Assistant Admin"
 admin.site.site_title = "TA Admin"
@@ -0,0 +1,251 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import Attempt, ProgressAggregate, Topic, UserTopicProgress
+from .write_lane import serialized
+
+# Counters kept on every ProgressAggregate row
+COUNTER_FIELDS = [
+    'learners', 'completed_learners', 'total_attempts', 'total_time_spent', 'scored_attempts', 'score_sum'
+]
+
+
+def clamp_score(score):
+    """Integer score within 0-20, or None when the provider sent something else"""
+    try:
+        score = int(score)
+    except (TypeError, ValueError):
+        return None
+    return min(max(score, 0), ProgressAggregate.MAX_SCORE)
+
+
+def empty_histogram():
+    return [0] * (ProgressAggregate.MAX_SCORE + 1)
+
+
+def blank_values():
+    values = dict.fromkeys(COUNTER_FIELDS, 0)
+    values['score_histogram'] = empty_histogram()
+    return values
+
+
+def member_rows(model, group_id=None):
+    """Rows of model (with user and topic) that belong to members of the topic's group"""
+    rows = model.objects.filter(topic__group__members=F('user'))
+    if group_id is not None:
+        rows = rows.filter(topic__group_id=group_id)
+    return rows
+
+
+def stored_values(aggregate):
+    values = {field: getattr(aggregate, field) for field in COUNTER_FIELDS}
+    values['score_histogram'] = aggregate.score_histogram or empty_histogram()
+    return values
+
+
+class ProgressAggregates:
+    """Incremental maintenance of ProgressAggregate rows
+    
+    Every change is applied to the topic row and to the row of its group.
+    Counters are bumped with F() updates; the score histogram is
+    read-modify-written under select_for_update, so callers run inside the
+    submission transactions that already hold the write lock. A group row
+    counts each learner once, however many of its topics they tried.
+    
+    Deleted attempts and progress rows and membership changes cannot be
+    followed by bumps; they flag the group's rows stale and the group is
+    recomputed once the transaction commits.
+    """
+    
+    @staticmethod
+    def scopes(group_id, topic_id):
+        """(queryset, topic_id) for the topic row and the group row"""
+        return [
+            (ProgressAggregate.objects.filter(topic_id=topic_id), topic_id),
+            (ProgressAggregate.objects.filter(group_id=group_id, topic__isnull=True), None),
+        ]
+    
+    @staticmethod
+    def bump(group_id, topic_id, group_deltas=None, **deltas):
+        """Add deltas to the counters of both rows, creating them on first use
+        
+        group_deltas replace the deltas of the same name on the group row.
+        """
+        for rows, scope_topic_id in ProgressAggregates.scopes(group_id, topic_id):
+            scope_deltas = {**deltas, **(group_deltas or {})} if scope_topic_id is None else deltas
+            updates = {field: F(field) + delta for field, delta in scope_deltas.items()}
+            updates['updated_at'] = timezone.now()
+            if rows.update(**updates):
+                continue
+            try:
+                with transaction.atomic():
+                    ProgressAggregate.objects.create(
+                        group_id=group_id,
+                        topic_id=scope_topic_id,
+                        score_histogram=empty_histogram(),
+                        **scope_deltas
+                    )
+            except IntegrityError:
+                # Another submission created the row first
+                rows.update(**updates)
+    
+    @staticmethod
+    def record_attempt(topic, user_id, time_spent, first_attempt):
+        """Count a reserved attempt (and a new learner on their first one)"""
+        new_to_group = first_attempt and not UserTopicProgress.objects.filter(
+            user_id=user_id, topic__group_id=topic.group_id, total_attempts__gt=0
+        ).exclude(topic_id=topic.id).exists()
+        ProgressAggregates.bump(
+            topic.group_id, topic.id,
+            group_deltas={'learners': 1 if new_to_group else 0},
+            learners=1 if first_attempt else 0,
+            total_attempts=1,
+            total_time_spent=time_spent
+        )
+    
+    @staticmethod
+    def record_evaluation(group_id, topic_id, user_id, score, completed):
+        """Count an evaluated attempt and, if it completed the topic, a learner"""
+        score = clamp_score(score)
+        first_in_group = completed and not UserTopicProgress.objects.filter(
+            user_id=user_id, topic__group_id=group_id, completed=True
+        ).exclude(topic_id=topic_id).exists()
+        deltas = {'completed_learners': 1 if completed else 0}
+        if score is not None:
+            deltas.update(scored_attempts=1, score_sum=score)
+        ProgressAggregates.bump(
+            group_id, topic_id, group_deltas={'completed_learners': 1 if first_in_group else 0}, **deltas
+        )
+        
+        if score is None:
+            return
+        for rows, _ in ProgressAggregates.scopes(group_id, topic_id):
+            aggregate = rows.select_for_update().only('id', 'score_histogram').get()
+            histogram = aggregate.score_histogram or empty_histogram()
+            histogram[score] += 1
+            aggregate.score_histogram = histogram
+            aggregate.save(update_fields=['score_histogram'])
+    
+    @staticmethod
+    def compute(batch_size=1000, group_id=None):
+        """Recompute every aggregate (or one group's) from the source tables
+        
+        Only the progress and attempts of current group members count.
+        Progress rows and attempts are streamed in primary-key batches, so
+        memory grows with the number of topics rather than rows. Returns
+        {(group_id, topic_id or None): values}.
+        """
+        topics = Topic.objects.all() if group_id is None else Topic.objects.filter(group_id=group_id)
+        topic_groups = dict(topics.values_list('id', 'group_id'))
+        computed = {}
+        
+        def entries(topic_id):
+            group_id = topic_groups[topic_id]
+            for key in ((group_id, topic_id), (group_id, None)):
+                if key not in computed:
+                    computed[key] = blank_values()
+            return computed[(group_id, topic_id)], computed[(group_id, None)]
+        
+        started = member_rows(UserTopicProgress, group_id).filter(total_attempts__gt=0)
+        progress_rows = started.values_list('pk', 'topic_id', 'completed', 'total_attempts', 'total_time_spent')
+        for batch in ProgressAggregates.batches(progress_rows, batch_size):
+            for _, topic_id, completed, total_attempts, total_time_spent in batch:
+                topic_values, group_values = entries(topic_id)
+                topic_values['learners'] += 1
+                topic_values['completed_learners'] += 1 if completed else 0
+                for values in (topic_values, group_values):
+                    values['total_attempts'] += total_attempts
+                    values['total_time_spent'] += total_time_spent
+        
+        # Group rows count distinct learners rather than (learner, topic) pairs
+        group_learners = started.order_by().values('topic__group_id').annotate(
+            learners=Count('user', distinct=True),
+            completed_learners=Count('user', distinct=True, filter=Q(completed=True))
+        ).values_list('topic__group_id', 'learners', 'completed_learners')
+        for learners_group_id, learners, completed_learners in group_learners:
+            computed[(learners_group_id, None)].update(learners=learners, completed_learners=completed_learners)
+        
+        scores = member_rows(Attempt, group_id).filter(evaluation_completed=True, score__isnull=False).values_list(
+            'pk', 'topic_id', 'score'
+        )
+        for batch in ProgressAggregates.batches(scores, batch_size):
+            for _, topic_id, score in batch:
+                score = clamp_score(score)
+                if score is None:
+                    continue
+                for values in entries(topic_id):
+                    values['scored_attempts'] += 1
+                    values['score_sum'] += score
+                    values['score_histogram'][score] += 1
+        
+        return computed
+    
+    @staticmethod
+    def batches(rows, batch_size):
+        """Keyset-paginate a values_list queryset whose first column is pk"""
+        last_pk = None
+        while True:
+            batch = rows.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1][0]
+            yield batch
+    
+    @staticmethod
+    def drift(computed):
+        """[(key, field, stored, expected)] where stored rows differ from computed values"""
+        stored = {
+            (aggregate.group_id, aggregate.topic_id): stored_values(aggregate)
+            for aggregate in ProgressAggregate.objects.all()
+        }
+        differences = []
+        for key in sorted(computed.keys() | stored.keys(), key=str):
+            expected = computed.get(key) or blank_values()
+            actual = stored.get(key) or blank_values()
+            for field, value in expected.items():
+                if actual[field] != value:
+                    differences.append((key, field, actual[field], value))
+        return differences
+    
+    @staticmethod
+    def save(computed, group_id=None):
+        """Replace the stored aggregates (or one group's) with computed values"""
+        stored = ProgressAggregate.objects.all()
+        if group_id is not None:
+            stored = stored.filter(group_id=group_id)
+        with transaction.atomic():
+            unused = [
+                aggregate.pk for aggregate in stored.only('id', 'group_id', 'topic_id')
+                if (aggregate.group_id, aggregate.topic_id) not in computed
+            ]
+            ProgressAggregate.objects.filter(pk__in=unused).delete()
+            for (row_group_id, topic_id), values in computed.items():
+                ProgressAggregate.objects.update_or_create(
+                    group_id=row_group_id, topic_id=topic_id, defaults={**values, 'stale': False}
+                )
+    
+    @staticmethod
+    def invalidate(group_id, force=False):
+        """Recompute a group's rows once the current transaction commits
+        
+        The rows are flagged stale inside the transaction, so a rollback
+        drops the flag and a burst of deletions (a cascade) recomputes the
+        group once. force recomputes even a group without rows, as when a
+        member with earlier progress rejoins.
+        """
+        ProgressAggregate.objects.filter(group_id=group_id).update(stale=True)
+        transaction.on_commit(lambda: ProgressAggregates.refresh(group_id, force=force))
+    
+    @staticmethod
+    @serialized
+    def refresh(group_id, force=False):
+        """Recompute and store the rows of one group if they are flagged stale"""
+        with transaction.atomic():
+            rows = ProgressAggregate.objects.select_for_update().filter(group_id=group_id)
+            flags = list(rows.values_list('stale', flat=True))
+            if not any(flags) and not (force and not flags):
+                return
+            ProgressAggregates.save(ProgressAggregates.compute(group_id=group_id), group_id=group_id)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import AIGenerationLog, CachedAIResponse
+from .write_lane import run_serialized
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AIResponseCache:
+    """Content-addressed cache for image and text generation responses
+
+    Entries are keyed by a SHA-256 of the full request payload (model,
+    system prompt, user prompt and generation parameters). Text is kept in
+    the database; image bytes go to a blob directory under MEDIA_ROOT named
+    by their own hash, so identical images are stored once. The cache is
+    bounded by AI_CACHE_MAX_BYTES (least recently used entries are evicted
+    first) and entries expire after AI_CACHE_TTL seconds.
+    
+    The table is only summed every AI_CACHE_EVICT_INTERVAL inserts; in
+    between, a running estimate adds this process's inserts and evicts as
+    soon as it crosses the bound.
+    """
+
+    _estimated_bytes = None  # None until the table has been summed
+    _inserts_since_sum = 0
+    _estimate_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(payload):
+        """Hash a provider request payload"""
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def blob_name_for(data):
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{settings.AI_CACHE_DIR}/{digest[:2]}/{digest}.png"
+
+    @staticmethod
+    def get(key):
+        """Return the cached text or image bytes for key, or None"""
+        now = timezone.now()
+        entry = CachedAIResponse.objects.filter(key=key, expires_at__gt=now).first()
+        if entry is None:
+            return None
+
+        if entry.blob_name:
+            try:
+                with default_storage.open(entry.blob_name, 'rb') as blob:
+                    value = blob.read()
+            except (FileNotFoundError, OSError):
+                logger.warning(f"AI cache blob missing for {key}, dropping entry")
+                entry.delete()
+                return None
+        else:
+            value = entry.text_response
+
+        CachedAIResponse.objects.filter(pk=entry.pk).update(
+            hit_count=F('hit_count') + 1,
+            last_accessed_at=now
+        )
+        return value
+
+    @staticmethod
+    def set(key, generation_type, value):
+        """Store a response and evict entries beyond the size bound"""
+        now = timezone.now()
+        defaults = {
+            'generation_type': generation_type,
+            'last_accessed_at': now,
+            'expires_at': now + timezone.timedelta(seconds=settings.AI_CACHE_TTL),
+            'text_response': '',
+            'blob_name': '',
+        }
+
+        if isinstance(value, bytes):
+            blob_name = AIResponseCache.blob_name_for(value)
+            if not default_storage.exists(blob_name):
+                AIResponseCache.write_blob(blob_name, value)
+            defaults['blob_name'] = blob_name
+            defaults['size_bytes'] = len(value)
+        else:
+            defaults['text_response'] = value
+            defaults['size_bytes'] = len(value.encode('utf-8'))
+
+        # Single statements rather than update_or_create: its read-then-write
+        # transaction fails at once on SQLite when another writer commits
+        # in between, where a lone UPDATE or INSERT waits out the busy timeout
+        if not CachedAIResponse.objects.filter(key=key).update(**defaults):
+            try:
+                CachedAIResponse.objects.create(key=key, **defaults)
+            except IntegrityError:
+                CachedAIResponse.objects.filter(key=key).update(**defaults)
+        if AIResponseCache.needs_eviction(defaults['size_bytes']):
+            AIResponseCache.evict()
+
+    @staticmethod
+    def write_blob(blob_name, data):
+        """Write a blob to a temporary file and rename it into place
+        
+        Concurrent writers of the same blob each rename a complete file
+        over the other, so readers never see a partial one.
+        """
+        try:
+            path = default_storage.path(blob_name)
+        except NotImplementedError:
+            # Remote storages upload whole objects
+            default_storage.save(blob_name, ContentFile(data))
+            return
+        
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                os.chmod(temp_path, settings.FILE_UPLOAD_PERMISSIONS)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @staticmethod
+    def needs_eviction(size_bytes):
+        """Count an insert; True when the table is due a sum or the estimate is over the bound"""
+        with AIResponseCache._estimate_lock:
+            AIResponseCache._inserts_since_sum += 1
+            if (AIResponseCache._estimated_bytes is None
+                    or AIResponseCache._inserts_since_sum >= settings.AI_CACHE_EVICT_INTERVAL):
+                return True
+            AIResponseCache._estimated_bytes += size_bytes
+            return AIResponseCache._estimated_bytes > settings.AI_CACHE_MAX_BYTES
+
+    @staticmethod
+    def reset():
+        """Forget the size estimate, so the next insert sums the table"""
+        with AIResponseCache._estimate_lock:
+            AIResponseCache._estimated_bytes = None
+            AIResponseCache._inserts_since_sum = 0
+
+    @staticmethod
+    def evict():
+        """Drop expired entries, then least recently used ones over the size bound"""
+        expired = CachedAIResponse.objects.filter(expires_at__lte=timezone.now())
+        AIResponseCache._delete(expired)
+
+        total = CachedAIResponse.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+        excess = total - settings.AI_CACHE_MAX_BYTES
+        with AIResponseCache._estimate_lock:
+            AIResponseCache._estimated_bytes = total - max(excess, 0)
+            AIResponseCache._inserts_since_sum = 0
+        if excess <= 0:
+            return
+
+        victims = []
+        for pk, size_bytes in CachedAIResponse.objects.order_by('last_accessed_at').values_list('pk', 'size_bytes').iterator():
+            if excess <= 0:
+                break
+            victims.append(pk)
+            excess -= size_bytes
+        AIResponseCache._delete(CachedAIResponse.objects.filter(pk__in=victims))
+
+    @staticmethod
+    def _delete(entries):
+        blob_names = set(entries.exclude(blob_name='').values_list('blob_name', flat=True))
+        entries.delete()
+
+        # Blobs are shared between keys; only remove unreferenced ones
+        still_used = set(
+            CachedAIResponse.objects.filter(blob_name__in=blob_names).values_list('blob_name', flat=True)
+        )
+        for blob_name in blob_names - still_used:
+            default_storage.delete(blob_name)
+
+    @staticmethod
+    def log_hit(generation_type, prompt, response, topic=None, attempt=None):
+        """Record a cache hit in the generation log"""
+        return run_serialized(
+            AIGenerationLog.objects.create,
+            generation_type=generation_type,
+            prompt=prompt,
+            response=response,
+            success=True,
+            cache_hit=True,
+            latency_ms=0,
+            topic=topic,
+            attempt=attempt
+        )
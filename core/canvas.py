@@ -0,0 +1,221 @@
+import base64
+import hashlib
+from collections import namedtuple
+from io import BytesIO
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Student strokes are drawn fully opaque while the topic background is
+# composited at 70% alpha, so near-opaque pixels are treated as ink
+INK_ALPHA_THRESHOLD = 250
+
+# Searchable key: 64-bit dHash of the ink mask (8x8 horizontal gradients).
+# Detail hash, used to verify a key match: horizontal and vertical gradients
+# over a 16x16 grid on each RGB channel, so shape, orientation and colour count
+DHASH_SIZE = 8
+DETAIL_SIZE = 16
+DETAIL_BITS = 2 * 3 * DETAIL_SIZE * DETAIL_SIZE
+
+CANVAS_DIR = 'canvases'
+
+# Pillow encoder settings per stored canvas format. Both run in the request
+# path, so effort is kept moderate: zlib level 9 / optimize costs ~13x the
+# time of level 6 for ~8% smaller files (benchmarks/bench_canvas_normalize.py)
+CANVAS_ENCODERS = {
+    'png': ('PNG', {'compress_level': 6}),
+    'webp': ('WEBP', {'lossless': True, 'quality': 50, 'method': 1}),
+}
+
+
+class InvalidCanvas(ValueError):
+    """Raised for a submitted canvas that is not an image within the size limits"""
+
+
+StoredCanvas = namedtuple('StoredCanvas', ['name', 'sha256', 'size', 'original_size'])
+NormalizedCanvas = namedtuple('NormalizedCanvas', ['content', 'extension', 'original_size'])
+
+
+def decode_canvas_data(canvas_data):
+    """Return the PNG bytes of a canvas data URL (or bare base64 string)"""
+    if ',' in canvas_data:
+        canvas_data = canvas_data.split(',', 1)[1]
+    return base64.b64decode(canvas_data, validate=True)
+
+
+def load_canvas_image(canvas):
+    """Decode canvas image bytes (or an open image file) into an RGBA Pillow image
+    
+    Raises InvalidCanvas, before decoding any pixels, for images larger
+    than CANVAS_MAX_WIDTH x CANVAS_MAX_HEIGHT.
+    """
+    if isinstance(canvas, bytes):
+        canvas = BytesIO(canvas)
+    else:
+        canvas.seek(0)
+    image = Image.open(canvas)
+    if image.width > settings.CANVAS_MAX_WIDTH or image.height > settings.CANVAS_MAX_HEIGHT:
+        raise InvalidCanvas(
+            f"Canvas is {image.width}x{image.height}, over the "
+            f"{settings.CANVAS_MAX_WIDTH}x{settings.CANVAS_MAX_HEIGHT} limit"
+        )
+    return image.convert('RGBA')
+
+
+def pixel_hash(image):
+    """SHA-256 of the decoded pixels, independent of PNG encoder settings"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.width}x{image.height}".encode('ascii'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def ink_mask(image):
+    """Greyscale image that is white where the student drew"""
+    alpha = np.asarray(image.getchannel('A'))
+    return Image.fromarray(np.where(alpha >= INK_ALPHA_THRESHOLD, 255, 0).astype(np.uint8), mode='L')
+
+
+def perceptual_hashes(image):
+    """(64-bit key, detail hex) perceptual hashes of the ink drawn on a canvas
+    
+    The ink is cropped to a square around its bounding box, so position and
+    scale do not matter but aspect ratio does. The key is a dHash of the ink
+    mask, compact enough to scan a whole topic per lookup. The detail hash
+    (DETAIL_BITS / 4 hex digits) takes horizontal and vertical gradients of
+    each RGB channel of the ink over white, so mirrored, rotated or
+    recoloured drawings that share a key still hash apart.
+    """
+    mask = ink_mask(image)
+    bbox = mask.getbbox()
+    
+    small = ink_square(mask, bbox, fill=0).resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    key = int.from_bytes(np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes(), 'big')
+    
+    inked = np.asarray(mask)[:, :, None] > 0
+    rgb = Image.fromarray(np.where(inked, np.asarray(image.convert('RGB')), 255).astype(np.uint8), mode='RGB')
+    bits = []
+    for channel in ink_square(rgb, bbox).split():
+        wide = np.asarray(channel.resize((DETAIL_SIZE + 1, DETAIL_SIZE), Image.Resampling.BOX), dtype=np.int16)
+        tall = np.asarray(channel.resize((DETAIL_SIZE, DETAIL_SIZE + 1), Image.Resampling.BOX), dtype=np.int16)
+        bits.append(wide[:, 1:] > wide[:, :-1])
+        bits.append(tall[1:, :] > tall[:-1, :])
+    detail = np.packbits(np.concatenate([grid.ravel() for grid in bits])).tobytes().hex()
+    return key, detail
+
+
+def detail_distance(first, second):
+    """Hamming distance between two detail hashes"""
+    return bin(int(first, 16) ^ int(second, 16)).count('1')
+
+
+def to_signed64(value):
+    """Store an unsigned 64-bit hash in a signed BIGINT column"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned64(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def ink_square(image, bbox, fill=(255, 255, 255)):
+    """The bbox region of image centred on a square of fill (all of it when bbox is None)"""
+    if bbox is None:
+        return image
+    crop = image.crop(bbox)
+    side = max(crop.width, crop.height)
+    square = Image.new(image.mode, (side, side), fill)
+    square.paste(crop, ((side - crop.width) // 2, (side - crop.height) // 2))
+    return square
+
+
+def ink_bbox(image, margin):
+    """Box around the drawn ink plus a margin, clamped to the image
+    
+    Falls back to the non-transparent area (or the whole image) when
+    nothing was drawn.
+    """
+    bbox = ink_mask(image).getbbox() or image.getbbox()
+    if bbox is None:
+        return (0, 0, image.width, image.height)
+    left, top, right, bottom = bbox
+    return (
+        max(0, left - margin),
+        max(0, top - margin),
+        min(image.width, right + margin),
+        min(image.height, bottom + margin),
+    )
+
+
+def normalize_canvas(image, original_size):
+    """Crop a decoded canvas to its ink, quantize it and re-encode it compactly"""
+    image = image.crop(ink_bbox(image, settings.CANVAS_CROP_MARGIN))
+    
+    # Size the palette to the colors actually used so small drawings do not
+    # carry a full 256-entry PLTE/tRNS
+    used_colors = image.getcolors(settings.CANVAS_PALETTE_COLORS)
+    image = image.quantize(
+        colors=len(used_colors) if used_colors else settings.CANVAS_PALETTE_COLORS,
+        method=Image.Quantize.FASTOCTREE,
+        dither=Image.Dither.NONE
+    )
+    
+    extension = settings.CANVAS_STORAGE_FORMAT
+    encoder, options = CANVAS_ENCODERS[extension]
+    buffer = BytesIO()
+    image.save(buffer, format=encoder, **options)
+    return NormalizedCanvas(ContentFile(buffer.getvalue()), extension, original_size)
+
+
+def prepare_canvas(canvas):
+    """Decode a submitted canvas once and derive what is stored for it
+    
+    Returns (pixel hash, signed perceptual key, perceptual detail,
+    NormalizedCanvas). Hashes
+    are taken before normalization so reuse lookups see the canvas as
+    drawn. Raises InvalidCanvas for undecodable or oversized canvases.
+    """
+    if isinstance(canvas, bytes):
+        canvas = ContentFile(canvas)
+    try:
+        image = load_canvas_image(canvas)
+    except (ValueError, UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        logger.warning(f"Rejected canvas: {str(e)}")
+        raise InvalidCanvas(str(e)) from e
+    
+    key, detail = perceptual_hashes(image)
+    hashes = pixel_hash(image), to_signed64(key), detail
+    if not settings.CANVAS_NORMALIZE:
+        return (*hashes, NormalizedCanvas(canvas, 'png', canvas.size))
+    
+    normalized = normalize_canvas(image, canvas.size)
+    logger.debug(f"Normalized canvas {canvas.size} -> {normalized.content.size} bytes")
+    return (*hashes, normalized)
+
+
+def store_canvas(canvas, extension='png', original_size=None):
+    """Save canvas bytes (or an uploaded file) under a content-addressed name
+    
+    Identical canvases map to the same file, which is written only once.
+    Files are hashed and copied in chunks rather than read into memory.
+    ``original_size`` is the size as submitted, before normalization.
+    """
+    if isinstance(canvas, bytes):
+        canvas = ContentFile(canvas)
+    sha256 = hashlib.sha256()
+    for chunk in canvas.chunks():
+        sha256.update(chunk)
+    digest = sha256.hexdigest()
+    name = f"{CANVAS_DIR}/{digest[:2]}/{digest}.{extension}"
+    if not default_storage.exists(name):
+        saved_name = default_storage.save(name, canvas)
+        if saved_name != name:
+            # Lost a race with a concurrent writer of the same content
+            default_storage.delete(saved_name)
+    return StoredCanvas(name, digest, canvas.size, original_size or canvas.size)
@@ -0,0 +1,102 @@
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one AI provider
+
+    After AI_CIRCUIT_FAILURE_THRESHOLD consecutive failed calls the circuit
+    opens and calls fail at once for AI_CIRCUIT_RESET_TIMEOUT seconds. It
+    then half-opens and lets AI_CIRCUIT_HALF_OPEN_PROBES calls through: a
+    success closes it, a failure opens it again. State is per process.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probes = 0
+        self.opened_at = None  # monotonic, for the reset timeout
+        self.opened_since = None  # wall clock, for display
+        self.last_error = ''
+
+    def before_call(self):
+        """Admit a call, or raise CircuitOpenError"""
+        with self.lock:
+            if self.state == self.OPEN:
+                if self._retry_in() > 0:
+                    metrics.increment(f'circuit.{self.name}.rejected')
+                    raise CircuitOpenError(f"{self.name} provider circuit open after {self.failures} failures: {self.last_error}")
+                self.state = self.HALF_OPEN
+                self.probes = 0
+                logger.warning(f"{self.name} provider circuit half-open, sending probe requests")
+            if self.state == self.HALF_OPEN:
+                if self.probes >= settings.AI_CIRCUIT_HALF_OPEN_PROBES:
+                    metrics.increment(f'circuit.{self.name}.rejected')
+                    raise CircuitOpenError(f"{self.name} provider circuit half-open, waiting on probe requests")
+                self.probes += 1
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.warning(f"{self.name} provider circuit closed")
+                metrics.increment(f'circuit.{self.name}.closed')
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= settings.AI_CIRCUIT_FAILURE_THRESHOLD
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.opened_since = timezone.now()
+                metrics.increment(f'circuit.{self.name}.opened')
+                logger.error(f"{self.name} provider circuit opened after {self.failures} failures: {self.last_error}")
+
+    def release(self):
+        """Hand back an admitted call that ended without reaching the provider"""
+        with self.lock:
+            if self.state == self.HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def allows_calls(self):
+        """Whether a call made now could be admitted"""
+        with self.lock:
+            if self.state == self.OPEN:
+                return self._retry_in() <= 0
+            if self.state == self.HALF_OPEN:
+                return self.probes < settings.AI_CIRCUIT_HALF_OPEN_PROBES
+            return True
+
+    def status(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'opened_at': self.opened_since if self.state != self.CLOSED else None,
+                'retry_in_s': round(self._retry_in(), 1) if self.state == self.OPEN else None,
+                'last_error': self.last_error,
+            }
+
+    def _retry_in(self):
+        return max(0.0, self.opened_at + settings.AI_CIRCUIT_RESET_TIMEOUT - time.monotonic())
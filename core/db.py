@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas():
+    """(name, value) pairs of the configured SQLite connection profile
+
+    busy_timeout comes first so the other statements wait out a writer.
+    """
+    pragmas = [
+        ('busy_timeout', settings.SQLITE_BUSY_TIMEOUT_MS),
+        ('journal_mode', settings.SQLITE_JOURNAL_MODE),
+        ('synchronous', settings.SQLITE_SYNCHRONOUS),
+        ('mmap_size', settings.SQLITE_MMAP_SIZE),
+        # Negative cache_size is in KiB rather than pages
+        ('cache_size', -settings.SQLITE_CACHE_SIZE_KB if settings.SQLITE_CACHE_SIZE_KB else ''),
+    ]
+    return [(name, value) for name, value in pragmas if value not in ('', None)]
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply the SQLite profile when Django opens a connection
+
+    Statements go to the raw connection so they are not counted as queries.
+    The journal mode is stored in the database file, so it is only switched
+    when it differs; a switch that cannot get its lock is retried by the
+    next connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    raw = connection.connection
+    for name, value in sqlite_pragmas():
+        if name == 'journal_mode':
+            if raw.execute('PRAGMA journal_mode').fetchone()[0].lower() == str(value).lower():
+                continue
+            try:
+                raw.execute(f'PRAGMA journal_mode = {value}')
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Could not switch SQLite journal mode to {value}: {str(e)}")
+            continue
+        raw.execute(f'PRAGMA {name} = {value}')
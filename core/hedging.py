@@ -0,0 +1,194 @@
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+import math
+import threading
+import time
+from django.conf import settings
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor():
+    """Return the executor that runs both legs of hedged requests"""
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=settings.AI_HEDGE_WORKERS,
+                thread_name_prefix='ai-hedge'
+            )
+        return _hedge_executor
+
+
+class LatencyHistogram:
+    """Rolling histogram of the last `window` latencies
+
+    Latencies fall into log-spaced buckets 10% wide, so percentiles are
+    accurate to about 10% whatever the spread, and the oldest sample leaves
+    the histogram as each new one arrives.
+    """
+
+    GROWTH = 1.1
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = deque()  # bucket of each sample, oldest first
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms):
+        bucket = int(math.log(max(latency_ms, 1), self.GROWTH))
+        with self.lock:
+            self.samples.append(bucket)
+            self.counts[bucket] += 1
+            if len(self.samples) > self.window:
+                oldest = self.samples.popleft()
+                self.counts[oldest] -= 1
+                if not self.counts[oldest]:
+                    del self.counts[oldest]
+
+    def percentile(self, fraction):
+        """Upper bound in ms of the bucket holding the given percentile, or None when empty"""
+        with self.lock:
+            rank = math.ceil(len(self.samples) * fraction)
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    return round(self.GROWTH ** (bucket + 1), 1)
+        return None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.samples)
+
+
+class Hedger:
+    """Hedged requests for one kind of provider call
+
+    A call that has not answered by the AI_HEDGE_PERCENTILE latency of the
+    recent calls (at least AI_HEDGE_MIN_DELAY) gets a second, identical
+    call, and the first successful response wins. Every call earns
+    AI_HEDGE_MAX_RATE of a hedge and every hedge spends one, which keeps
+    hedges to that share of calls. A losing call that has not started is
+    cancelled; one already waiting on the provider cannot be interrupted,
+    so it runs out on its thread and its response is discarded.
+    """
+
+    _hedgers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self.histogram = LatencyHistogram(settings.AI_HEDGE_WINDOW)
+        self.credit = 0.0
+        self.credit_lock = threading.Lock()
+
+    @classmethod
+    def for_operation(cls, name):
+        """Return the shared hedger for an operation ('evaluation')"""
+        with cls._lock:
+            hedger = cls._hedgers.get(name)
+            if hedger is None:
+                hedger = cls._hedgers[name] = cls(name)
+            return hedger
+
+    @classmethod
+    def reset(cls):
+        """Forget all latency history and hedge credit"""
+        with cls._lock:
+            cls._hedgers = {}
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None when not hedging"""
+        if not settings.AI_EVALUATION_HEDGING or len(self.histogram) < settings.AI_HEDGE_MIN_SAMPLES:
+            return None
+        return max(settings.AI_HEDGE_MIN_DELAY, self.histogram.percentile(settings.AI_HEDGE_PERCENTILE) / 1000)
+
+    def call(self, send):
+        """Return send()'s response, hedged with a second send() if it is slow
+
+        send must return a ProviderClient response (with ``latency_ms``).
+        The winner's ``latency_ms`` is the time from the first send.
+        """
+        delay = self.hedge_delay()
+        self.earn()
+        if delay is None:
+            return self.timed(send)
+
+        executor = _get_hedge_executor()
+        started = time.monotonic()
+        primary = executor.submit(self.timed, send)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+
+        if not self.spend():
+            metrics.increment(f'hedge.{self.name}.over_budget')
+            return primary.result()
+        metrics.increment(f'hedge.{self.name}.sent')
+        hedge = executor.submit(self.timed, send)
+
+        winner = None
+        pending = [primary, hedge]
+        while pending and winner is None:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in [future for future in pending if future in done]:
+                pending.remove(future)
+                if winner is None and future.exception() is None and future.result().status_code == 200:
+                    winner = future
+        if winner is None:
+            # Both failed; report the first call's outcome as an unhedged call would
+            winner = primary
+        elif winner is hedge:
+            metrics.increment(f'hedge.{self.name}.won')
+
+        for future in (primary, hedge):
+            if future is not winner:
+                future.cancel()
+                future.add_done_callback(discard_response)
+
+        response = winner.result()
+        response.latency_ms = int((time.monotonic() - started) * 1000)
+        return response
+
+    def timed(self, send):
+        response = send()
+        self.histogram.record(response.latency_ms)
+        return response
+
+    def earn(self):
+        with self.credit_lock:
+            # A quiet spell banks at most about a hundred calls' worth of hedges
+            self.credit = min(max(1.0, settings.AI_HEDGE_MAX_RATE * 100), self.credit + settings.AI_HEDGE_MAX_RATE)
+
+    def spend(self):
+        with self.credit_lock:
+            if self.credit < 1:
+                return False
+            self.credit -= 1
+            return True
+
+    def status(self):
+        delay = self.hedge_delay()
+        return {
+            'enabled': settings.AI_EVALUATION_HEDGING,
+            'samples': len(self.histogram),
+            'p50_ms': self.histogram.percentile(0.50),
+            'p95_ms': self.histogram.percentile(0.95),
+            'p99_ms': self.histogram.percentile(0.99),
+            'hedge_after_ms': round(delay * 1000) if delay is not None else None,
+            'hedge_credit': round(self.credit, 2),
+        }
+
+
+def discard_response(future):
+    """Close the response of a losing call once it finishes"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,188 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils import timezone
+from .circuit_breaker import CircuitBreaker
+from .rate_limit import ProviderRateLimiter, estimate_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Settings holding the endpoint URL of each provider
+PROVIDER_URL_SETTINGS = {
+    'text': 'TEXT_API_URL',
+    'image': 'IMAGE_API_URL',
+}
+
+
+class ProviderClient:
+    """Pooled keep-alive HTTP client for one AI provider endpoint
+
+    One client (and one requests.Session) is shared per provider across all
+    threads. Every request gets connect/read timeouts and is retried with
+    jittered exponential backoff on 429/5xx, honouring Retry-After.
+    Responses carry ``latency_ms`` and ``retries`` for AIGenerationLog.
+
+    Calls to the provider's API pass through its circuit breaker, which
+    fails them fast while the provider is down, and its rate limiter,
+    which paces every attempt (retries included) to the configured
+    requests and tokens per minute.
+    """
+
+    _clients = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings.AI_HTTP_POOL_SIZE,
+            pool_maxsize=settings.AI_HTTP_POOL_SIZE,
+            max_retries=0
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breaker = CircuitBreaker(name)
+        self.limiter = ProviderRateLimiter(name)
+
+    @classmethod
+    def for_provider(cls, name):
+        """Return the shared client for a provider ('text' or 'image')"""
+        url = getattr(settings, PROVIDER_URL_SETTINGS[name])
+        with cls._lock:
+            client = cls._clients.get(name)
+            if client is None or client.url != url:
+                client = cls(name, url)
+                cls._clients[name] = client
+            return client
+
+    @classmethod
+    def reset(cls):
+        """Close and forget all pooled sessions"""
+        with cls._lock:
+            for client in cls._clients.values():
+                client.session.close()
+            cls._clients = {}
+
+    @classmethod
+    def status(cls):
+        """Circuit and rate limit state of every provider in this process"""
+        return {
+            name: {**client.breaker.status(), 'rate_limits': client.limiter.status()}
+            for name, client in ((name, cls.for_provider(name)) for name in PROVIDER_URL_SETTINGS)
+        }
+
+    def post(self, url=None, **kwargs):
+        return self.request('POST', url or self.url, **kwargs)
+
+    def get(self, url, **kwargs):
+        # Downloads of generated files, not calls to the provider's API
+        return self.request('GET', url, guarded=False, **kwargs)
+
+    def request(self, method, url, guarded=True, **kwargs):
+        """Send a request with timeouts and retries
+
+        Guarded requests go through the circuit breaker and rate limiter,
+        and raise CircuitOpenError or RateLimitExceeded instead of waiting
+        on a provider that is down or over its limits.
+        """
+        if not guarded:
+            return self._send(method, url, **kwargs)
+
+        self.breaker.before_call()
+        try:
+            response = self._send(method, url, tokens=estimate_tokens(kwargs.get('json')), **kwargs)
+        except requests.RequestException as e:
+            self.breaker.record_failure(f'{type(e).__name__}: {str(e)}')
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            self.breaker.record_failure(f'HTTP {response.status_code}')
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _send(self, method, url, tokens=None, **kwargs):
+        """Send with retries; each attempt is rate limited when tokens is given"""
+        kwargs.setdefault('timeout', (settings.AI_HTTP_CONNECT_TIMEOUT, settings.AI_HTTP_READ_TIMEOUT))
+        max_retries = settings.AI_HTTP_MAX_RETRIES
+        started = time.monotonic()
+        retries = 0
+
+        while True:
+            if tokens is not None:
+                reserved = self.limiter.acquire(tokens)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectTimeout:
+                if tokens is not None:
+                    self.limiter.settle(reserved, 0)
+                # The request never reached the provider, so it is safe to resend
+                if retries >= max_retries:
+                    raise
+                delay = self.backoff_delay(retries)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or retries >= max_retries:
+                    break
+                delay = self.retry_after_delay(response)
+                if delay is None:
+                    delay = self.backoff_delay(retries)
+                elif delay > settings.AI_HTTP_BACKOFF_MAX:
+                    # Provider asked us to wait longer than we are willing to block
+                    break
+                if tokens is not None:
+                    # Rejected attempts use no tokens
+                    self.limiter.settle(reserved, 0)
+                response.close()
+
+            retries += 1
+            logger.warning(f"{self.name} provider retry {retries}/{max_retries} for {url} in {delay:.2f}s")
+            time.sleep(delay)
+
+        if tokens is not None:
+            self.limiter.settle(reserved, self.tokens_used(response))
+        response.latency_ms = int((time.monotonic() - started) * 1000)
+        response.retries = retries
+        return response
+
+    def tokens_used(self, response):
+        """Total tokens a response reports using, when a token limit needs it"""
+        if 'tokens_per_minute' not in self.limiter.buckets:
+            return None
+        if response.status_code != 200:
+            return 0
+        try:
+            return int(response.json()['usage']['total_tokens'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def backoff_delay(retries):
+        """Full-jitter exponential backoff"""
+        ceiling = min(settings.AI_HTTP_BACKOFF_MAX, settings.AI_HTTP_BACKOFF_BASE * (2 ** retries))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def retry_after_delay(response):
+        """Seconds requested by a Retry-After header, if any"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+        except (TypeError, ValueError):
+            return None
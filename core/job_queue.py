@@ -0,0 +1,312 @@
+from collections import OrderedDict
+from datetime import timedelta
+import random
+import threading
+from django.conf import settings
+from django.db.models import Count, F, Min, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThan
+from django.dispatch import Signal
+from django.utils import timezone
+from .http_client import ProviderClient
+from .models import AIJob
+from .write_lane import serialized
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sent with job and error once a job has failed for good (no retries left)
+job_failed = Signal()
+
+# Providers each job type calls; a job counts against every one of them
+JOB_PROVIDERS = {
+    AIJob.TYPE_TOPIC_GENERATION: ('image', 'text'),
+    AIJob.TYPE_EVALUATION: ('text',),
+    AIJob.TYPE_CORRECTION: ('image', 'text'),
+}
+
+
+class FairShareScheduler:
+    """Deficit round-robin over the users with due jobs in a scheduling class
+
+    Each visit to a user adds their weight (AI_JOB_USER_WEIGHTS, default 1)
+    to their deficit, and every job taken costs 1, so over a busy period
+    users get jobs in proportion to their weights however many they queued.
+    A user whose backlog empties drops out and loses their deficit. The
+    rotation lives in this process; each worker process is fair on its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rotations = {}  # priority -> OrderedDict of user key -> deficit
+
+    def pick(self, priority, users):
+        """Choose the next user key from users ({key: username}) with a backlog"""
+        with self.lock:
+            rotation = self.rotations.setdefault(priority, OrderedDict())
+            for key in [key for key in rotation if key not in users]:
+                del rotation[key]
+            for key in users:
+                rotation.setdefault(key, 0.0)
+            while True:
+                key, deficit = next(iter(rotation.items()))
+                if deficit >= 1:
+                    rotation[key] = deficit - 1
+                    return key
+                rotation[key] = deficit + self.weight(users[key])
+                rotation.move_to_end(key)
+
+    def refund(self, priority, key):
+        """Give back the share of a pick whose job could not be claimed"""
+        with self.lock:
+            rotation = self.rotations.get(priority, {})
+            if key in rotation:
+                rotation[key] += 1
+
+    @staticmethod
+    def weight(username):
+        # A zero or negative weight would never reach a whole job
+        return max(0.01, settings.AI_JOB_USER_WEIGHTS.get(username, 1.0))
+
+
+class AIJobQueue:
+    """Lease-based job queue on the AIJob table
+
+    Works on any database, SQLite included: a worker claims a job with a
+    conditional UPDATE that only one worker can win, and holds it under a
+    lease it renews while the job runs. Jobs whose worker died are put back
+    in the queue once their lease expires.
+
+    Classes are served strictly by priority (interactive evaluation, then
+    corrections, then batch topic generation); users share each class
+    through the FairShareScheduler, and a job is only claimed while every
+    provider it calls is below its AI_PROVIDER_CONCURRENCY cap and has
+    its circuit closed in this worker.
+    """
+
+    scheduler = FairShareScheduler()
+
+    # Claims lost to other workers before giving up on a class until the next poll
+    CLAIM_RETRIES = 3
+
+    @staticmethod
+    def enqueue(job_type, topic=None, attempt=None, **payload):
+        """Queue a job; called inside a transaction it commits with it"""
+        if attempt is not None:
+            user_id = attempt.user_id
+        elif topic is not None:
+            user_id = topic.created_by_id
+        else:
+            user_id = None
+        return AIJob.objects.create(
+            job_type=job_type,
+            priority=AIJob.JOB_PRIORITIES[job_type],
+            user_id=user_id,
+            topic=topic,
+            attempt=attempt,
+            payload=payload,
+            max_attempts=settings.AI_JOB_MAX_ATTEMPTS
+        )
+
+    @staticmethod
+    @serialized
+    def claim(owner):
+        """Lease the next due job to owner; returns the job or None"""
+        now = timezone.now()
+        due = AIJob.objects.filter(status=AIJob.STATUS_QUEUED, run_after__lte=now)
+        # Jobs would only fail fast and spend an attempt while a provider's circuit is open
+        blocked = [
+            job_type for job_type, providers in JOB_PROVIDERS.items()
+            if not all(ProviderClient.for_provider(provider).breaker.allows_calls() for provider in providers)
+        ]
+        if blocked:
+            due = due.exclude(job_type__in=blocked)
+        for priority, _ in AIJob.PRIORITIES:
+            for _ in range(AIJobQueue.CLAIM_RETRIES):
+                # The oldest due job of every user with a backlog in this class
+                heads = {
+                    row['user_id']: row
+                    for row in due.filter(priority=priority).order_by().values('user_id', 'user__username').annotate(head=Min('id'))
+                }
+                if not heads:
+                    break
+                user_id = AIJobQueue.scheduler.pick(priority, {key: row['user__username'] for key, row in heads.items()})
+                job = AIJobQueue._claim_job(due, heads[user_id]['head'], owner, now)
+                if job is not None:
+                    return job
+                AIJobQueue.scheduler.refund(priority, user_id)
+                if AIJobQueue._at_capacity(priority):
+                    break
+        return None
+
+    @staticmethod
+    def _claim_job(due, job_id, owner, now):
+        job_type = due.filter(id=job_id).values_list('job_type', flat=True).first()
+        if job_type is None:
+            return None
+        claimable = due.filter(id=job_id)
+        for provider in JOB_PROVIDERS[job_type]:
+            # Checked in the UPDATE itself, so the cap holds across workers
+            claimable = claimable.filter(LessThan(running_count(provider), settings.AI_PROVIDER_CONCURRENCY[provider]))
+        # Only one worker's UPDATE still finds the job queued
+        claimed = claimable.update(
+            status=AIJob.STATUS_RUNNING,
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=settings.AI_JOB_LEASE_SECONDS),
+            started_at=now,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return AIJob.objects.get(id=job_id)
+        return None
+
+    @staticmethod
+    def _at_capacity(priority):
+        """Whether a provider used by the class has no free slot"""
+        providers = {
+            provider
+            for job_type, job_priority in AIJob.JOB_PRIORITIES.items() if job_priority == priority
+            for provider in JOB_PROVIDERS[job_type]
+        }
+        running = AIJob.objects.filter(status=AIJob.STATUS_RUNNING).values('job_type').annotate(count=Count('id'))
+        counts = {row['job_type']: row['count'] for row in running}
+        return any(
+            sum(count for job_type, count in counts.items() if provider in JOB_PROVIDERS[job_type])
+            >= settings.AI_PROVIDER_CONCURRENCY[provider]
+            for provider in providers
+        )
+
+    @staticmethod
+    @serialized
+    def renew_leases(owner, job_ids):
+        """Extend the leases owner holds on job_ids; returns how many it still holds"""
+        if not job_ids:
+            return 0
+        return AIJob.objects.filter(id__in=job_ids, status=AIJob.STATUS_RUNNING, lease_owner=owner).update(
+            lease_expires_at=timezone.now() + timedelta(seconds=settings.AI_JOB_LEASE_SECONDS)
+        )
+
+    @staticmethod
+    @serialized
+    def complete(job):
+        """Mark a job as succeeded unless its lease was lost"""
+        return bool(AIJobQueue._leased(job).update(
+            status=AIJob.STATUS_SUCCEEDED,
+            lease_owner='',
+            lease_expires_at=None,
+            finished_at=timezone.now()
+        ))
+
+    @staticmethod
+    @serialized
+    def fail(job, error):
+        """Record a failed run and retry it after a backoff, or give up"""
+        error = str(error)
+        if job.attempts < job.max_attempts:
+            delay = AIJobQueue.backoff_delay(job.attempts)
+            logger.warning(f"AI job {job.id} ({job.job_type}) failed, retry {job.attempts}/{job.max_attempts - 1} in {delay:.0f}s: {error}")
+            fields = {
+                'status': AIJob.STATUS_QUEUED,
+                'run_after': timezone.now() + timedelta(seconds=delay),
+            }
+        else:
+            logger.error(f"AI job {job.id} ({job.job_type}) failed after {job.attempts} attempts: {error}")
+            fields = {
+                'status': AIJob.STATUS_FAILED,
+                'finished_at': timezone.now(),
+            }
+        updated = bool(AIJobQueue._leased(job).update(last_error=error, lease_owner='', lease_expires_at=None, **fields))
+        if updated and fields['status'] == AIJob.STATUS_FAILED:
+            job_failed.send(sender=AIJob, job=job, error=error)
+        return updated
+
+    @staticmethod
+    @serialized
+    def requeue_expired():
+        """Put running jobs whose lease has expired back in the queue
+
+        The crashed run counts as an attempt; jobs that have used up their
+        attempts are failed instead. Returns the number of jobs touched.
+        """
+        now = timezone.now()
+        expired = AIJob.objects.filter(status=AIJob.STATUS_RUNNING, lease_expires_at__lt=now)
+        exhausted = list(expired.filter(attempts__gte=F('max_attempts')))
+        failed = expired.filter(id__in=[job.id for job in exhausted]).update(
+            status=AIJob.STATUS_FAILED,
+            last_error='Lease expired',
+            lease_owner='',
+            lease_expires_at=None,
+            finished_at=now
+        )
+        requeued = expired.update(
+            status=AIJob.STATUS_QUEUED,
+            last_error='Lease expired',
+            lease_owner='',
+            lease_expires_at=None,
+            run_after=now
+        )
+        if failed or requeued:
+            logger.warning(f"Requeued {requeued} and failed {failed} AI jobs with expired leases")
+        for job in exhausted:
+            job_failed.send(sender=AIJob, job=job, error='Lease expired')
+        return failed + requeued
+
+    @staticmethod
+    def backoff_delay(attempts):
+        """Jittered exponential backoff (between half and all of the ceiling) after a failed run"""
+        ceiling = min(settings.AI_JOB_BACKOFF_MAX, settings.AI_JOB_BACKOFF_BASE * (2 ** (attempts - 1)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    @staticmethod
+    def stats():
+        """Depth and wait-time percentiles of each scheduling class
+
+        Waits run from when a job became due to when its latest run
+        started, over the AI_JOB_STATS_SAMPLE most recently started jobs.
+        """
+        now = timezone.now()
+        active = AIJob.objects.filter(status__in=[AIJob.STATUS_QUEUED, AIJob.STATUS_RUNNING]).order_by()
+        counts = {
+            (row['priority'], row['status']): row['count']
+            for row in active.values('priority', 'status').annotate(count=Count('id'))
+        }
+        due = active.filter(status=AIJob.STATUS_QUEUED, run_after__lte=now)
+        oldest_due = dict(due.values('priority').annotate(oldest=Min('run_after')).values_list('priority', 'oldest'))
+
+        classes = {}
+        for priority, name in AIJob.PRIORITIES:
+            started = AIJob.objects.filter(priority=priority, started_at__isnull=False).order_by('-started_at')
+            waits = sorted(
+                max(0.0, (started_at - run_after).total_seconds() * 1000)
+                for run_after, started_at in started.values_list('run_after', 'started_at')[:settings.AI_JOB_STATS_SAMPLE]
+            )
+            classes[name.lower()] = {
+                'queued': counts.get((priority, AIJob.STATUS_QUEUED), 0),
+                'running': counts.get((priority, AIJob.STATUS_RUNNING), 0),
+                'oldest_due_age_s': round((now - oldest_due[priority]).total_seconds(), 1) if priority in oldest_due else None,
+                'wait_ms': {
+                    'samples': len(waits),
+                    'p50': percentile(waits, 0.50),
+                    'p95': percentile(waits, 0.95),
+                    'p99': percentile(waits, 0.99),
+                },
+            }
+        return classes
+
+    @staticmethod
+    def _leased(job):
+        return AIJob.objects.filter(id=job.id, status=AIJob.STATUS_RUNNING, lease_owner=job.lease_owner)
+
+
+def running_count(provider):
+    """Expression counting the running jobs that call provider"""
+    job_types = [job_type for job_type, providers in JOB_PROVIDERS.items() if provider in providers]
+    running = AIJob.objects.filter(status=AIJob.STATUS_RUNNING, job_type__in=job_types).order_by()
+    return Coalesce(Subquery(running.values('status').annotate(count=Count('id')).values('count')), 0)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values, or None when empty"""
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 1)
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from core.canvas import decode_canvas_data, store_canvas
 from core.models import Group, Topic, UserTopicProgress, Attempt
 from django.utils import timezone
 import random
@@ -171,6 +172,9 @@ The centroid divides each median in a 2:1 ratio!'''
                 self.stdout.write(f'Created topic: {topic.title}')
         
         # Create some sample progress and attempts
+        sample_canvas = store_canvas(decode_canvas_data(
+            'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='  # 1x1 transparent PNG
+        ))
         topics = Topic.objects.all()
         students = [u for u in created_users if not u.is_staff and not u.is_superuser]
         
@@ -203,7 +207,10 @@ The centroid divides each median in a 2:1 ratio!'''
                                 topic=topic,
                                 attempt_number=attempt_num,
                                 defaults={
-                                    'canvas_data': 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==',  # 1x1 transparent PNG
+                                    'canvas_file': sample_canvas.name,
+                                    'canvas_sha256': sample_canvas.sha256,
+                                    'canvas_bytes': sample_canvas.size,
+                                    'canvas_original_bytes': sample_canvas.original_size,
                                     'score': random.randint(8, 20),
                                     'is_correct': progress.completed and attempt_num == progress.total_attempts,
                                     'feedback': 'Sample feedback for demonstration purposes.',
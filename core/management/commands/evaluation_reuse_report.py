@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from core.models import Attempt
+
+
+class Command(BaseCommand):
+    help = 'Report how often stored evaluations were reused instead of calling the provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topic', type=int, help='Only report on this topic id')
+
+    def handle(self, *args, **options):
+        attempts = Attempt.objects.filter(evaluation_completed=True)
+        if options['topic']:
+            attempts = attempts.filter(topic_id=options['topic'])
+        
+        counts = dict(
+            attempts.order_by().values_list('evaluation_source').annotate(total=Count('id'))
+        )
+        total = sum(counts.values())
+        if not total:
+            self.stdout.write('No evaluated attempts yet.')
+            return
+        
+        labels = dict(Attempt.EVALUATION_SOURCES)
+        for source, label in labels.items():
+            count = counts.get(source, 0)
+            self.stdout.write(f'{label}: {count} ({count * 100 / total:.1f}%)')
+        
+        saved = total - counts.get(Attempt.SOURCE_PROVIDER, 0)
+        self.stdout.write(
+            self.style.SUCCESS(f'Provider calls saved: {saved} of {total} ({saved * 100 / total:.1f}%)')
+        )
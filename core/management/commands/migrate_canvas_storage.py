@@ -0,0 +1,67 @@
+import binascii
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.canvas import decode_canvas_data, store_canvas
+from core.models import Attempt
+
+
+class Command(BaseCommand):
+    help = 'Move base64 canvas_data rows into content-addressed canvas files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of attempts loaded and updated per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be migrated without writing anything')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        
+        pending = Attempt.objects.filter(canvas_file='').exclude(canvas_data='')
+        self.stdout.write(f'{pending.count()} attempts to migrate')
+        
+        migrated = failed = bytes_before = bytes_after = 0
+        last_pk = None
+        while True:
+            # Keyset pagination: only one batch of canvas_data is in memory
+            batch = pending.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            rows = list(batch.values_list('pk', 'canvas_data')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            
+            updates = []
+            for pk, canvas_data in rows:
+                try:
+                    canvas_bytes = decode_canvas_data(canvas_data)
+                except (binascii.Error, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f'Attempt {pk}: cannot decode canvas ({e})')
+                    continue
+                
+                migrated += 1
+                bytes_before += len(canvas_data)
+                bytes_after += len(canvas_bytes)
+                if not dry_run:
+                    updates.append((pk, store_canvas(canvas_bytes)))
+            
+            with transaction.atomic():
+                for pk, stored_canvas in updates:
+                    Attempt.objects.filter(pk=pk).update(
+                        canvas_file=stored_canvas.name,
+                        canvas_sha256=stored_canvas.sha256,
+                        canvas_bytes=stored_canvas.size,
+                        canvas_original_bytes=stored_canvas.original_size,
+                        canvas_data=''
+                    )
+            
+            self.stdout.write(f'... {migrated} migrated, {failed} failed')
+        
+        verb = 'Would migrate' if dry_run else 'Migrated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {migrated} attempts ({bytes_before} bytes of base64 -> {bytes_after} bytes of PNG), '
+            f'{failed} failed'
+        ))
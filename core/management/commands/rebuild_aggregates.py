@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.aggregates import ProgressAggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-topic and per-group progress aggregates and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of progress rows / attempts read per batch')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift; exit with an error if any is found')
+
+    def handle(self, *args, **options):
+        computed = ProgressAggregates.compute(batch_size=options['batch_size'])
+        differences = ProgressAggregates.drift(computed)
+        
+        for (group_id, topic_id), field, stored, expected in differences[:50]:
+            scope = f'topic {topic_id}' if topic_id else f'group {group_id}'
+            self.stdout.write(f'Drift in {scope}: {field} is {stored}, expected {expected}')
+        if len(differences) > 50:
+            self.stdout.write(f'... and {len(differences) - 50} more')
+        
+        if options['check']:
+            if differences:
+                raise CommandError(f'{len(differences)} aggregate values have drifted')
+            self.stdout.write(self.style.SUCCESS(f'{len(computed)} aggregates checked, no drift'))
+            return
+        
+        ProgressAggregates.save(computed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(computed)} aggregates ({len(differences)} drifted values corrected)'
+        ))
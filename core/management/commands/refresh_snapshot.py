@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from core.snapshot import SnapshotDatabase
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary database into the read-only snapshot used by admin views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep refreshing every this many seconds (default: refresh once)')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            SnapshotDatabase.refresh()
+            self.stdout.write(self.style.SUCCESS(
+                f'Snapshot refreshed in {time.monotonic() - started:.2f}s'
+            ))
+            if not options['interval']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,100 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import os
+import signal
+import socket
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.job_queue import AIJobQueue
+from core.tasks import execute_job_task, job_task_payload
+
+
+class Command(BaseCommand):
+    help = 'Run queued AI jobs (AI_TASK_BACKEND = "db") until stopped with SIGTERM or Ctrl-C'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.AI_TASK_WORKERS,
+                            help='Jobs run at the same time (default: AI_TASK_WORKERS)')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs on threads (default) or on separate processes')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue has no due jobs left')
+
+    def handle(self, *args, **options):
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.signals = 0
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        concurrency = max(1, options['concurrency'])
+        if options['pool'] == 'process':
+            # Children must not share the parent's database connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=concurrency)
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-worker')
+
+        self.stdout.write(f'AI worker {self.owner} running {concurrency} {options["pool"]} slots')
+        running = {}
+        completed = 0
+        lease_check_interval = max(1, settings.AI_JOB_LEASE_SECONDS / 3)
+        next_lease_check = 0
+        try:
+            while not self.stopping.is_set():
+                if time.monotonic() >= next_lease_check:
+                    AIJobQueue.requeue_expired()
+                    AIJobQueue.renew_leases(self.owner, [job.id for job in running.values()])
+                    next_lease_check = time.monotonic() + lease_check_interval
+
+                completed += self.reap(running)
+
+                claimed = False
+                while len(running) < concurrency and not self.stopping.is_set():
+                    job = AIJobQueue.claim(self.owner)
+                    if job is None:
+                        break
+                    claimed = True
+                    running[executor.submit(execute_job_task, job.job_type, job_task_payload(job))] = job
+
+                if options['burst'] and not running and not claimed:
+                    break
+                if running:
+                    wait(running, timeout=settings.AI_JOB_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    self.stopping.wait(settings.AI_JOB_POLL_INTERVAL)
+
+            # Graceful shutdown: finish the jobs in flight, keeping their leases
+            while running and self.signals < 2:
+                self.stdout.write(f'Waiting for {len(running)} running jobs (signal again to abandon them)')
+                wait(running, timeout=lease_check_interval, return_when=FIRST_COMPLETED)
+                completed += self.reap(running)
+                AIJobQueue.renew_leases(self.owner, [job.id for job in running.values()])
+        finally:
+            # Abandoned jobs are requeued by another worker when their lease expires
+            executor.shutdown(wait=not running, cancel_futures=True)
+            connections.close_all()
+
+        self.stdout.write(self.style.SUCCESS(f'AI worker {self.owner} stopped after {completed} jobs'))
+
+    def request_stop(self, signum, frame):
+        self.signals += 1
+        self.stopping.set()
+
+    def reap(self, running):
+        """Record the outcome of finished jobs; returns how many finished"""
+        finished = [future for future in running if future.done()]
+        for future in finished:
+            job = running.pop(future)
+            try:
+                succeeded = future.result()
+            except Exception as e:
+                AIJobQueue.fail(job, f'{type(e).__name__}: {str(e)}')
+                continue
+            if succeeded is False:
+                AIJobQueue.fail(job, f'{job.get_job_type_display()} task reported a failure')
+            else:
+                AIJobQueue.complete(job)
+        return len(finished)
@@ -0,0 +1,36 @@
+import threading
+from collections import defaultdict
+
+_counters = defaultdict(int)
+_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    """Add to an in-process counter"""
+    with _lock:
+        _counters[name] += amount
+
+
+def value(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """Copy of all counters in this process"""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def hit_rate(prefix):
+    """hits / (hits + misses) for counters named <prefix>.hit and <prefix>.miss"""
+    with _lock:
+        hits = _counters.get(f'{prefix}.hit', 0)
+        misses = _counters.get(f'{prefix}.miss', 0)
+    total = hits + misses
+    return hits / total if total else None
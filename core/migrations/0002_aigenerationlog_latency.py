@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aigenerationlog',
+            name='latency_ms',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aigenerationlog',
+            name='retry_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
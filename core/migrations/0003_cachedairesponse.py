@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_aigenerationlog_latency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAIResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('generation_type', models.CharField(choices=[('image', 'Image Generation'), ('text', 'Text Generation'), ('evaluation', 'Evaluation')], max_length=20)),
+                ('text_response', models.TextField(blank=True)),
+                ('blob_name', models.CharField(blank=True, max_length=255)),
+                ('size_bytes', models.IntegerField(default=0)),
+                ('hit_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(db_index=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['-last_accessed_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='aigenerationlog',
+            name='cache_hit',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
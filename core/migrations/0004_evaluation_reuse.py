@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_cachedairesponse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='content_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='evaluation_source',
+            field=models.CharField(choices=[('provider', 'Provider evaluation'), ('exact', 'Reused from identical canvas')], default='provider', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='pixel_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
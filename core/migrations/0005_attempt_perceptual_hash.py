@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_evaluation_reuse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='attempt',
+            name='evaluation_source',
+            field=models.CharField(choices=[('provider', 'Provider evaluation'), ('exact', 'Reused from identical canvas'), ('similar', 'Reused from near-identical canvas')], default='provider', max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attempt_perceptual_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='canvas_bytes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='canvas_file',
+            field=models.FileField(blank=True, max_length=255, upload_to='canvases/'),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='canvas_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='attempt',
+            name='canvas_data',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_attempt_canvas_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='canvas_original_bytes',
+            field=models.IntegerField(default=0),
+        ),
+    ]
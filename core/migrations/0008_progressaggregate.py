@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_attempt_canvas_original_bytes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('learners', models.IntegerField(default=0)),
+                ('completed_learners', models.IntegerField(default=0)),
+                ('total_attempts', models.IntegerField(default=0)),
+                ('total_time_spent', models.IntegerField(default=0)),
+                ('scored_attempts', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+                ('score_histogram', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_aggregates', to='core.group')),
+                ('topic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='progress_aggregates', to='core.topic')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('topic',), name='unique_topic_progress_aggregate'), models.UniqueConstraint(condition=models.Q(('topic__isnull', True)), fields=('group',), name='unique_group_progress_aggregate')],
+            },
+        ),
+    ]
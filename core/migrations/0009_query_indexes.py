@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_progressaggregate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aigenerationlog',
+            index=models.Index(fields=['-created_at', '-id'], name='ailog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aigenerationlog',
+            index=models.Index(fields=['generation_type', '-created_at', '-id'], name='ailog_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['-submitted_at', '-id'], name='attempt_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['topic', 'content_version', '-submitted_at'], name='attempt_topic_version_idx'),
+        ),
+    ]
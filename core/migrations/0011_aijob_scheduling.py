@@ -0,0 +1,51 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_priorities(apps, schema_editor):
+    """Classify jobs queued before scheduling classes existed"""
+    AIJob = apps.get_model('core', 'AIJob')
+    AIJob.objects.filter(job_type='evaluation').update(priority=0)
+    AIJob.objects.filter(job_type='correction').update(priority=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_aijob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='aijob',
+            name='aijob_claim_idx',
+        ),
+        migrations.AddField(
+            model_name='aijob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Interactive'), (1, 'Correction'), (2, 'Batch')], default=2),
+        ),
+        migrations.AddField(
+            model_name='aijob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='aijob',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='aijob',
+            index=models.Index(fields=['status', 'priority', 'user', 'run_after'], name='aijob_claim_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aijob',
+            index=models.Index(fields=['priority', '-started_at'], name='aijob_started_idx'),
+        ),
+        migrations.RunPython(set_priorities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_aijob_scheduling'),
+    ]
+
+    # 64-bit hashes are not comparable with the new ones, so they are dropped
+    # rather than converted; those attempts are no longer similar-match candidates
+    operations = [
+        migrations.RemoveField(
+            model_name='attempt',
+            name='perceptual_hash',
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, max_length=384, null=True),
+        ),
+    ]
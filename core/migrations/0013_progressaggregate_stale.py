@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-17 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_attempt_perceptual_hash_v2'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='progressaggregate',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_progressaggregate_stale'),
+    ]
+
+    # The wide hashes become the detail hash; attempts stored before the
+    # 64-bit key existed have none and are not similar-match candidates
+    operations = [
+        migrations.RenameField(
+            model_name='attempt',
+            old_name='perceptual_hash',
+            new_name='perceptual_detail',
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+import base64
+import mimetypes
 import uuid
 
 
@@ -38,6 +40,9 @@ class Topic(models.Model):
     content_generated = models.BooleanField(default=False)
     generation_error = models.TextField(blank=True)
     
+    # Bumped whenever prompt or instructional text changes (see core.signals)
+    content_version = models.PositiveIntegerField(default=1)
+    
     def __str__(self):
         return f"{self.title} ({self.group.name})"
     
@@ -66,13 +71,35 @@ class UserTopicProgress(models.Model):
 
 class Attempt(models.Model):
     """Individual attempts on topics"""
+    STATUS_PENDING = 'pending'
+    STATUS_CORRECTING = 'correcting'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    
+    SOURCE_PROVIDER = 'provider'
+    SOURCE_EXACT = 'exact'
+    SOURCE_SIMILAR = 'similar'
+    EVALUATION_SOURCES = [
+        (SOURCE_PROVIDER, 'Provider evaluation'),
+        (SOURCE_EXACT, 'Reused from identical canvas'),
+        (SOURCE_SIMILAR, 'Reused from near-identical canvas'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
     attempt_number = models.IntegerField()
     
-    # Canvas data
-    canvas_data = models.TextField()  # Base64 encoded PNG
+    # Canvas data, stored as a normalized, content-addressed image file
+    canvas_file = models.FileField(upload_to='canvases/', max_length=255, blank=True)
+    canvas_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    canvas_bytes = models.IntegerField(default=0)
+    canvas_original_bytes = models.IntegerField(default=0)  # Size as submitted, before normalization
+    canvas_data = models.TextField(blank=True)  # Legacy base64 PNG, emptied by migrate_canvas_storage
+    pixel_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of decoded pixels
+    perceptual_hash = models.BigIntegerField(null=True, blank=True)  # 64-bit dHash key of the ink, stored signed
+    perceptual_detail = models.CharField(max_length=384, null=True, blank=True)  # Detail dHash verifying key matches, hex
+    content_version = models.PositiveIntegerField(null=True, blank=True)  # Topic.content_version at submission
     
     # Evaluation results
     score = models.IntegerField(null=True, blank=True)  # 0-20
@@ -91,13 +118,122 @@ class Attempt(models.Model):
     # AI processing status
     evaluation_completed = models.BooleanField(default=False)
     evaluation_error = models.TextField(blank=True)
+    evaluation_source = models.CharField(max_length=20, choices=EVALUATION_SOURCES, default=SOURCE_PROVIDER)
     
     class Meta:
         ordering = ['-submitted_at']
         unique_together = ['user', 'topic', 'attempt_number']
+        indexes = [
+            # Newest-first listings (admin changelist, with the pk tiebreak it adds)
+            models.Index(fields=['-submitted_at', '-id'], name='attempt_submitted_idx'),
+            # Evaluation reuse lookups on one topic version, newest first
+            models.Index(fields=['topic', 'content_version', '-submitted_at'], name='attempt_topic_version_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.topic.title} - Attempt {self.attempt_number}"
+    
+    def read_canvas(self):
+        """Image bytes of the canvas, from storage or the legacy base64 column"""
+        if self.canvas_file:
+            with self.canvas_file.open('rb') as canvas_file:
+                return canvas_file.read()
+        return base64.b64decode(self.canvas_data.split(',', 1)[-1])
+    
+    @property
+    def canvas_content_type(self):
+        if self.canvas_file:
+            return mimetypes.guess_type(self.canvas_file.name)[0] or 'image/png'
+        return 'image/png'
+    
+    @property
+    def canvas_bytes_saved(self):
+        """Bytes saved by normalizing the submitted canvas"""
+        return max(0, self.canvas_original_bytes - self.canvas_bytes)
+    
+    @property
+    def evaluation_status(self):
+        """Processing state derived from the evaluation fields"""
+        if not self.evaluation_completed:
+            return self.STATUS_FAILED if self.evaluation_error else self.STATUS_PENDING
+        if self.is_correct or self.evaluation_error:
+            return self.STATUS_COMPLETED
+        if self.updated_background_image or self.updated_instructional_text:
+            return self.STATUS_COMPLETED
+        return self.STATUS_CORRECTING
+
+
+class ProgressAggregate(models.Model):
+    """Denormalized progress statistics for one topic, or a whole group when topic is null
+    
+    Counters are bumped by SubmissionService as attempts are reserved,
+    evaluated and completed; rebuild_aggregates recomputes them. Only
+    current group members count, and a group row counts each learner once.
+    """
+    MAX_SCORE = 20
+    
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='progress_aggregates')
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, null=True, blank=True, related_name='progress_aggregates')
+    
+    learners = models.IntegerField(default=0)  # Members with at least one attempt
+    completed_learners = models.IntegerField(default=0)
+    total_attempts = models.IntegerField(default=0)
+    total_time_spent = models.IntegerField(default=0)  # seconds
+    scored_attempts = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    score_histogram = models.JSONField(default=list)  # Evaluated attempts per score 0-20
+    stale = models.BooleanField(default=False)  # Awaiting recomputation after deletions or membership changes
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['topic'], name='unique_topic_progress_aggregate'),
+            models.UniqueConstraint(
+                fields=['group'],
+                condition=models.Q(topic__isnull=True),
+                name='unique_group_progress_aggregate'
+            ),
+        ]
+    
+    def __str__(self):
+        if self.topic_id:
+            return f"Topic {self.topic_id} progress"
+        return f"Group {self.group_id} progress"
+    
+    @property
+    def completion_rate(self):
+        return self.completed_learners / self.learners if self.learners else None
+    
+    @property
+    def mean_score(self):
+        return self.score_sum / self.scored_attempts if self.scored_attempts else None
+    
+    @property
+    def median_score(self):
+        """Median attempt score, read off the histogram"""
+        if not self.scored_attempts:
+            return None
+        
+        def nth(position):
+            seen = 0
+            for score, count in enumerate(self.score_histogram):
+                seen += count
+                if seen > position:
+                    return score
+            return len(self.score_histogram) - 1
+        
+        middle = self.scored_attempts // 2
+        if self.scored_attempts % 2:
+            return nth(middle)
+        return (nth(middle - 1) + nth(middle)) / 2
+    
+    @property
+    def mean_attempts(self):
+        return self.total_attempts / self.learners if self.learners else None
+    
+    @property
+    def mean_time_spent(self):
+        return self.total_time_spent / self.learners if self.learners else None
 
 
 class AIGenerationLog(models.Model):
@@ -114,6 +250,9 @@ class AIGenerationLog(models.Model):
     success = models.BooleanField(default=False)
     error_message = models.TextField(blank=True)
     api_cost = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
+    latency_ms = models.IntegerField(null=True, blank=True)  # including retries
+    retry_count = models.IntegerField(default=0)
+    cache_hit = models.BooleanField(null=True, blank=True)  # None when the cache was bypassed
     created_at = models.DateTimeField(auto_now_add=True)
     
     # Related objects
@@ -122,6 +261,112 @@ class AIGenerationLog(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Newest-first listings, with the pk tiebreak the admin adds
+            models.Index(fields=['-created_at', '-id'], name='ailog_created_idx'),
+            # Admin filters by type (and outcome), newest first. success is
+            # left out: boolean filters compile to a bare column test that
+            # SQLite cannot seek on, and it would break the sort order
+            models.Index(fields=['generation_type', '-created_at', '-id'], name='ailog_type_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.generation_type} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class AIJob(models.Model):
+    """Durable unit of background AI work, run by the run_ai_workers command"""
+    TYPE_TOPIC_GENERATION = 'topic_generation'
+    TYPE_EVALUATION = 'evaluation'
+    TYPE_CORRECTION = 'correction'
+    JOB_TYPES = [
+        (TYPE_TOPIC_GENERATION, 'Topic Generation'),
+        (TYPE_EVALUATION, 'Attempt Evaluation'),
+        (TYPE_CORRECTION, 'Correction Generation'),
+    ]
+    
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    # Scheduling classes, served strictly in this order
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_CORRECTION = 1
+    PRIORITY_BATCH = 2
+    PRIORITIES = [
+        (PRIORITY_INTERACTIVE, 'Interactive'),
+        (PRIORITY_CORRECTION, 'Correction'),
+        (PRIORITY_BATCH, 'Batch'),
+    ]
+    JOB_PRIORITIES = {
+        TYPE_EVALUATION: PRIORITY_INTERACTIVE,
+        TYPE_CORRECTION: PRIORITY_CORRECTION,
+        TYPE_TOPIC_GENERATION: PRIORITY_BATCH,
+    }
+    
+    job_type = models.CharField(max_length=20, choices=JOB_TYPES)
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_QUEUED)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITIES, default=PRIORITY_BATCH)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)  # Whose fair share the job uses
+    payload = models.JSONField(default=dict, blank=True)  # Keyword arguments of the task
+    
+    # Retries
+    attempts = models.IntegerField(default=0)  # Runs started, including one in progress
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    
+    # Lease held by the worker running the job; an expired lease is requeued
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)  # Start of the latest run
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    # Related objects
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, null=True, blank=True)
+    attempt = models.ForeignKey(Attempt, on_delete=models.CASCADE, null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Claiming: the oldest due job of each user in a class
+            models.Index(fields=['status', 'priority', 'user', 'run_after'], name='aijob_claim_idx'),
+            # Wait-time statistics over recently started jobs
+            models.Index(fields=['priority', '-started_at'], name='aijob_started_idx'),
+            # Requeueing running jobs whose lease has expired
+            models.Index(fields=['status', 'lease_expires_at'], name='aijob_lease_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.job_type} #{self.id} ({self.status})"
+
+
+class CachedAIResponse(models.Model):
+    """Cached provider response keyed by a hash of the request"""
+    key = models.CharField(max_length=64, unique=True)  # SHA-256 of model, prompts and parameters
+    generation_type = models.CharField(max_length=20, choices=AIGenerationLog.GENERATION_TYPES)
+    
+    # Text responses live in the row, image bytes in a content-addressed blob
+    text_response = models.TextField(blank=True)
+    blob_name = models.CharField(max_length=255, blank=True)
+    size_bytes = models.IntegerField(default=0)
+    
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        ordering = ['-last_accessed_at']
     
     def __str__(self):
-        return f"{self.generation_type} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.generation_type} - {self.key[:12]}"
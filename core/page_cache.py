@@ -0,0 +1,82 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from . import metrics
+
+USER_VERSION_KEY = 'pages:user:{}:version'
+CONTENT_VERSION_KEY = 'pages:content:version'
+
+# Backends that keep entries in the memory of a single process
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_ttl(ttl):
+    """ttl, capped at LOCAL_CACHE_MAX_TTL when the page cache alias is per process
+    
+    Invalidations only reach the cache of the process that handled the
+    change, so entries other processes hold must age out within seconds.
+    """
+    if settings.CACHES[settings.PAGE_CACHE_ALIAS]['BACKEND'] in PROCESS_LOCAL_BACKENDS:
+        return min(ttl, settings.LOCAL_CACHE_MAX_TTL)
+    return ttl
+
+
+class PageCache:
+    """Per-user cache of the data behind the home and topic pages
+    
+    Keys embed a per-user version and a site-wide content version. Bumping
+    a version orphans every entry built from it (they then age out by
+    PAGE_CACHE_TTL), so invalidation never has to enumerate keys. Versions
+    are timestamps rather than counters so a version lost to eviction can
+    never collide with a stale entry. Bumps made in another process only
+    reach a shared backend, so a per-process cache keeps entries for at
+    most LOCAL_CACHE_MAX_TTL.
+    """
+    
+    @staticmethod
+    def cache():
+        return caches[settings.PAGE_CACHE_ALIAS]
+    
+    @staticmethod
+    def versions(user_id):
+        """(user version, content version), initialising missing ones"""
+        cache = PageCache.cache()
+        names = [USER_VERSION_KEY.format(user_id), CONTENT_VERSION_KEY]
+        found = cache.get_many(names)
+        for name in names:
+            if name not in found:
+                cache.add(name, time.time_ns(), None)
+                found[name] = cache.get(name)
+        return found[names[0]], found[names[1]]
+    
+    @staticmethod
+    def key(page, user_id, *parts):
+        """Versioned cache key for one user's view of a page"""
+        user_version, content_version = PageCache.versions(user_id)
+        suffix = ':'.join(str(part) for part in parts)
+        return f'pages:{page}:{user_id}:{suffix}:{user_version}:{content_version}'
+    
+    @staticmethod
+    def get(page, key):
+        """Cached page data, or None; counts hits and misses per page"""
+        if not settings.PAGE_CACHE_ENABLED:
+            return None
+        data = PageCache.cache().get(key)
+        metrics.increment(f'page_cache.{page}.{"miss" if data is None else "hit"}')
+        return data
+    
+    @staticmethod
+    def set(key, data):
+        if settings.PAGE_CACHE_ENABLED:
+            PageCache.cache().set(key, data, cache_ttl(settings.PAGE_CACHE_TTL))
+    
+    @staticmethod
+    def invalidate_user(user_id):
+        PageCache.cache().set(USER_VERSION_KEY.format(user_id), time.time_ns(), None)
+    
+    @staticmethod
+    def invalidate_content():
+        PageCache.cache().set(CONTENT_VERSION_KEY, time.time_ns(), None)
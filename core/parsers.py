@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser, DataAndFiles, MultiPartParser
+
+# Read size for streaming raw canvas bodies to disk
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class CanvasTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Canvas upload is too large.'
+    default_code = 'canvas_too_large'
+
+
+def check_declared_length(request):
+    """Reject bodies whose Content-Length is already over the canvas cap"""
+    try:
+        declared = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        declared = 0
+    if declared > settings.CANVAS_UPLOAD_MAX_BYTES:
+        raise CanvasTooLarge()
+
+
+class CanvasUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploaded files straight to a temp file, enforcing the canvas cap"""
+
+    def new_file(self, *args, **kwargs):
+        self.received = 0
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.CANVAS_UPLOAD_MAX_BYTES:
+            self.file.close()
+            raise CanvasTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class CanvasMultiPartParser(MultiPartParser):
+    """Multipart parser for ``canvas.toBlob`` form uploads
+
+    Files always go to disk through CanvasUploadHandler instead of the
+    project-wide upload handlers, so a canvas is never held in memory.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        check_declared_length(request)
+
+        try:
+            parser = DjangoMultiPartParser(meta, stream, [CanvasUploadHandler()], encoding)
+            data, files = parser.parse()
+            return DataAndFiles(data, files)
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+
+
+class PNGUploadParser(BaseParser):
+    """Parser for a raw ``image/png`` request body
+
+    The body is copied to a temp file in chunks and exposed as
+    ``request.FILES['canvas']``; other fields come from the query string.
+    """
+    media_type = 'image/png'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        check_declared_length(request)
+
+        upload = TemporaryUploadedFile('canvas.png', self.media_type, 0, None)
+        received = 0
+        try:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > settings.CANVAS_UPLOAD_MAX_BYTES:
+                    raise CanvasTooLarge()
+                upload.write(chunk)
+        except Exception:
+            upload.close()
+            raise
+
+        upload.size = received
+        upload.seek(0)
+        return DataAndFiles({}, {'canvas': upload})
@@ -0,0 +1,89 @@
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from .canvas import to_unsigned64
+from .models import Attempt
+
+
+class PerceptualHashIndex:
+    """In-memory index of perceptual hashes for one topic version
+
+    Hashes live in a packed uint64 array so a lookup is one vectorized
+    XOR + popcount over every stored hash. Indexes are built lazily from
+    the database per process and rebuilt after PHASH_INDEX_TTL seconds so
+    evaluations finished by other processes are picked up.
+    """
+
+    _indexes = {}
+    _lock = threading.Lock()
+
+    def __init__(self, hashes=(), attempt_ids=()):
+        self._lock = threading.Lock()
+        self._hashes = np.array(hashes, dtype=np.uint64)
+        self._attempt_ids = list(attempt_ids)
+        self._size = len(self._attempt_ids)
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def for_topic(cls, topic_id, content_version):
+        """Return the shared index for a topic version, building it if stale"""
+        key = (topic_id, content_version)
+        with cls._lock:
+            index = cls._indexes.get(key)
+            if index is None or time.monotonic() - index.loaded_at > settings.PHASH_INDEX_TTL:
+                index = cls.load(topic_id, content_version)
+                cls._indexes[key] = index
+            return index
+
+    @classmethod
+    def load(cls, topic_id, content_version):
+        """Build an index from finished attempts stored in the database"""
+        finished = Q(is_correct=True) | ~Q(updated_background_image='') | ~Q(updated_instructional_text='')
+        rows = Attempt.objects.filter(
+            finished,
+            topic_id=topic_id,
+            content_version=content_version,
+            perceptual_hash__isnull=False,
+            evaluation_source=Attempt.SOURCE_PROVIDER,
+            evaluation_completed=True,
+            evaluation_error=''
+        ).values_list('id', 'perceptual_hash').iterator()
+
+        attempt_ids = []
+        hashes = []
+        for attempt_id, signed_hash in rows:
+            attempt_ids.append(attempt_id)
+            hashes.append(to_unsigned64(signed_hash))
+        return cls(hashes, attempt_ids)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._indexes = {}
+
+    def add(self, attempt_id, signed_hash):
+        """Append a hash, growing the backing array geometrically"""
+        with self._lock:
+            if self._size == len(self._hashes):
+                grown = np.zeros(max(16, self._size * 2), dtype=np.uint64)
+                grown[:self._size] = self._hashes[:self._size]
+                self._hashes = grown
+            self._hashes[self._size] = to_unsigned64(signed_hash)
+            self._attempt_ids.append(attempt_id)
+            self._size += 1
+
+    def nearest(self, signed_hash):
+        """(attempt_id, Hamming distance) of the closest stored hash, or None"""
+        with self._lock:
+            if not self._size:
+                return None
+            hashes = self._hashes[:self._size]
+            attempt_ids = self._attempt_ids
+        distances = np.bitwise_count(hashes ^ np.uint64(to_unsigned64(signed_hash)))
+        position = int(distances.argmin())
+        return attempt_ids[position], int(distances[position])
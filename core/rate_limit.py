@@ -0,0 +1,129 @@
+import threading
+import time
+from django.conf import settings
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rough input cost of an image part in a chat request; corrected from the
+# response's usage once it arrives
+IMAGE_PART_TOKENS = 1000
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a provider call would wait too long for rate limit capacity"""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously, holding at most a minute's worth
+
+    Callers reserve tokens up front and may take the bucket into debt; the
+    debt is the time they have to wait, so waiting callers are served in
+    the order they arrived.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # tokens per second
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Take amount tokens; returns the seconds to wait before using them"""
+        with self.lock:
+            self._refill()
+            # A request larger than the bucket could otherwise never run
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        """Give back tokens reserved for a call that was not made, or overestimated"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    def available(self):
+        with self.lock:
+            self._refill()
+            return max(0.0, self.tokens)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class ProviderRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one provider
+
+    Limits come from AI_PROVIDER_RATE_LIMITS (0 leaves that dimension
+    unlimited). Buckets live in this process, so the configured limits
+    apply to each process calling the provider.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        limits = settings.AI_PROVIDER_RATE_LIMITS.get(name, {})
+        self.buckets = {
+            dimension: TokenBucket(limits[dimension])
+            for dimension in ('requests_per_minute', 'tokens_per_minute')
+            if limits.get(dimension)
+        }
+
+    def acquire(self, tokens=0):
+        """Wait for capacity for one request of about tokens tokens
+
+        Raises RateLimitExceeded, without taking anything, when the wait
+        would be longer than AI_RATE_LIMIT_MAX_WAIT seconds. Returns the
+        tokens reserved, to be passed to settle() once the real usage is
+        known.
+        """
+        amounts = {'requests_per_minute': 1, 'tokens_per_minute': tokens}
+        reserved = {dimension: amounts[dimension] for dimension in self.buckets if amounts[dimension]}
+        delay = max([self.buckets[dimension].reserve(amount) for dimension, amount in reserved.items()], default=0.0)
+        if delay > settings.AI_RATE_LIMIT_MAX_WAIT:
+            for dimension, amount in reserved.items():
+                self.buckets[dimension].refund(amount)
+            metrics.increment(f'rate_limit.{self.name}.rejected')
+            raise RateLimitExceeded(f"{self.name} provider rate limit reached; next slot in {delay:.1f}s")
+        if delay > 0:
+            metrics.increment(f'rate_limit.{self.name}.delayed')
+            logger.warning(f"{self.name} provider rate limited, waiting {delay:.2f}s")
+            time.sleep(delay)
+        return reserved.get('tokens_per_minute', 0)
+
+    def settle(self, reserved, used):
+        """Correct a token reservation with the tokens the provider reported"""
+        bucket = self.buckets.get('tokens_per_minute')
+        if bucket is None or used is None:
+            return
+        if used < reserved:
+            bucket.refund(reserved - used)
+        elif used > reserved:
+            bucket.reserve(used - reserved)
+
+    def status(self):
+        """Limit and currently available capacity of each configured bucket"""
+        return {
+            dimension: {'limit': int(bucket.capacity), 'available': int(bucket.available())}
+            for dimension, bucket in self.buckets.items()
+        }
+
+
+def estimate_tokens(payload):
+    """Approximate tokens a chat request uses: ~4 characters per input token plus max_tokens"""
+    if not isinstance(payload, dict):
+        return 0
+    characters = 0
+    images = 0
+    for message in payload.get('messages', []):
+        content = message.get('content', '')
+        parts = content if isinstance(content, list) else [{'type': 'text', 'text': content}]
+        for part in parts:
+            if part.get('type') == 'text':
+                characters += len(part.get('text') or '')
+            else:
+                images += 1
+    return characters // 4 + images * IMAGE_PART_TOKENS + payload.get('max_tokens', 0)
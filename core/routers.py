@@ -0,0 +1,24 @@
+from .snapshot import SNAPSHOT_ALIAS, reading_snapshot
+
+
+class SnapshotRouter:
+    """Send reads inside snapshot_reads() to the snapshot, everything else to default
+
+    Writes always go to the primary, including saves of objects that were
+    loaded from the snapshot.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_snapshot.get():
+            return SNAPSHOT_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The snapshot is a byte copy of the primary, schema included
+        return db != SNAPSHOT_ALIAS
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Group, Topic, UserTopicProgress, Attempt
+from .models import Group, Topic, UserTopicProgress, Attempt, ProgressAggregate
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -45,4 +45,20 @@ class AttemptSerializer(serializers.ModelSerializer):
 
 class SubmissionSerializer(serializers.Serializer):
     canvas_data = serializers.CharField()
-    time_spent = serializers.IntegerField(min_value=0)
\ No newline at end of file
+    time_spent = serializers.IntegerField(min_value=0)
+
+
+class ProgressAggregateSerializer(serializers.ModelSerializer):
+    completion_rate = serializers.FloatField(read_only=True)
+    mean_score = serializers.FloatField(read_only=True)
+    median_score = serializers.FloatField(read_only=True)
+    mean_attempts = serializers.FloatField(read_only=True)
+    mean_time_spent = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = ProgressAggregate
+        fields = [
+            'group', 'topic', 'learners', 'completed_learners', 'completion_rate',
+            'mean_score', 'median_score', 'mean_attempts', 'mean_time_spent',
+            'total_attempts', 'scored_attempts', 'score_histogram', 'updated_at'
+        ]
@@ -1,12 +1,27 @@
-import requests
 import base64
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from PIL import Image
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-from .models import AIGenerationLog, Topic, Attempt
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .aggregates import ProgressAggregates
+from .ai_cache import AIResponseCache
+from .canvas import detail_distance
+from .hedging import Hedger
+from .http_client import ProviderClient
+from .models import AIGenerationLog, Group, Topic, Attempt, UserTopicProgress
+from .phash_index import PerceptualHashIndex
+from .single_flight import run_once
+from .snapshot import reading_snapshot
+from .write_lane import run_serialized, serialized
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,8 +31,13 @@ class AIService:
     """Service class for AI API interactions"""
     
     @staticmethod
-    def generate_image(prompt, topic=None, attempt=None):
-        """Generate image using AI API"""
+    def generate_image(prompt, topic=None, attempt=None, use_cache=True):
+        """Generate image using AI API
+        
+        Identical requests are answered from AIResponseCache unless
+        use_cache is False, and concurrent ones are sent only once (see
+        single_flight.run_once).
+        """
         try:
             headers = {
                 'Authorization': f'Bearer {settings.IMAGE_GENERATION_API_KEY}',
@@ -45,18 +65,43 @@ class AIService:
                 }
             }
 
+            cache_key = AIResponseCache.make_key(payload)
+            caching = use_cache and settings.AI_CACHE_ENABLED
+            cached = lambda: AIService._cached_response('image', cache_key, prompt, topic, attempt)
+            if caching:
+                cached_image = cached()
+                if cached_image is not None:
+                    return cached_image
 
-
-
+            return run_once(
+                'image',
+                cache_key,
+                lambda: AIService._request_image(prompt, headers, payload, cache_key, caching, topic, attempt),
+                cached=cached if caching else None
+            )
+                
+        except Exception as e:
+            logger.error(f"Image generation error: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _request_image(prompt, headers, payload, cache_key, caching, topic=None, attempt=None):
+        """Send an image generation request, logging and caching the result"""
+        try:
             # Log the request
-            log_entry = AIGenerationLog.objects.create(
+            log_entry = run_serialized(
+                AIGenerationLog.objects.create,
                 generation_type='image',
                 prompt=prompt,
                 topic=topic,
-                attempt=attempt
+                attempt=attempt,
+                cache_hit=False if caching else None
             )
 
-            response = requests.post(settings.IMAGE_API_URL, headers=headers, json=payload)
+            client = ProviderClient.for_provider('image')
+            response = client.post(headers=headers, json=payload)
+            log_entry.latency_ms = response.latency_ms
+            log_entry.retry_count = response.retries
 
             if response.status_code == 200:
                 result = response.json()
@@ -76,16 +121,22 @@ class AIService:
                                 log_entry.response = json.dumps(result)  # قبلاً اشتباه JSON می‌ذاشتی
                                 log_entry.save()
 
+                                if caching:
+                                    AIResponseCache.set(cache_key, 'image', image_bytes)
                                 return image_bytes
 
                             else:
                                 # حالت URL عادی
-                                img_response = requests.get(image_url)
+                                img_response = client.get(image_url)
+                                log_entry.latency_ms += img_response.latency_ms
+                                log_entry.retry_count += img_response.retries
                                 if img_response.status_code == 200:
                                     log_entry.success = True
                                     log_entry.response = json.dumps(result)
                                     log_entry.save()
 
+                                    if caching:
+                                        AIResponseCache.set(cache_key, 'image', img_response.content)
                                     return img_response.content
                                 else:
                                     raise Exception(f"Failed to download image: {img_response.status_code}")
@@ -98,15 +149,19 @@ class AIService:
                 raise Exception(error_msg)
                 
         except Exception as e:
-            logger.error(f"Image generation error: {str(e)}")
             if 'log_entry' in locals():
                 log_entry.error_message = str(e)
                 log_entry.save()
             raise
     
     @staticmethod
-    def generate_text(prompt, topic=None, attempt=None):
-        """Generate instructional text using AI API"""
+    def generate_text(prompt, topic=None, attempt=None, use_cache=True):
+        """Generate instructional text using AI API
+        
+        Identical requests are answered from AIResponseCache unless
+        use_cache is False, and concurrent ones are sent only once (see
+        single_flight.run_once).
+        """
         try:
             headers = {
                 'Authorization': f'Bearer {settings.TEXT_GENERATION_API_KEY}',
@@ -129,15 +184,42 @@ class AIService:
                 'temperature': 0.7
             }
             
+            cache_key = AIResponseCache.make_key(payload)
+            caching = use_cache and settings.AI_CACHE_ENABLED
+            cached = lambda: AIService._cached_response('text', cache_key, prompt, topic, attempt)
+            if caching:
+                cached_text = cached()
+                if cached_text is not None:
+                    return cached_text
+            
+            return run_once(
+                'text',
+                cache_key,
+                lambda: AIService._request_text(prompt, headers, payload, cache_key, caching, topic, attempt),
+                cached=cached if caching else None
+            )
+                
+        except Exception as e:
+            logger.error(f"Text generation error: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _request_text(prompt, headers, payload, cache_key, caching, topic=None, attempt=None):
+        """Send a text generation request, logging and caching the result"""
+        try:
             # Log the request
-            log_entry = AIGenerationLog.objects.create(
+            log_entry = run_serialized(
+                AIGenerationLog.objects.create,
                 generation_type='text',
                 prompt=prompt,
                 topic=topic,
-                attempt=attempt
+                attempt=attempt,
+                cache_hit=False if caching else None
             )
             
-            response = requests.post(settings.TEXT_API_URL, headers=headers, json=payload)
+            response = ProviderClient.for_provider('text').post(headers=headers, json=payload)
+            log_entry.latency_ms = response.latency_ms
+            log_entry.retry_count = response.retries
             
             if response.status_code == 200:
                 data = response.json()
@@ -148,6 +230,8 @@ class AIService:
                 log_entry.response = generated_text
                 log_entry.save()
                 
+                if caching:
+                    AIResponseCache.set(cache_key, 'text', generated_text)
                 return generated_text
             else:
                 error_msg = f"Text generation failed: {response.status_code} - {response.text}"
@@ -156,15 +240,27 @@ class AIService:
                 raise Exception(error_msg)
                 
         except Exception as e:
-            logger.error(f"Text generation error: {str(e)}")
             if 'log_entry' in locals():
                 log_entry.error_message = str(e)
                 log_entry.save()
             raise
     
+    @staticmethod
+    def _cached_response(generation_type, cache_key, prompt, topic=None, attempt=None):
+        """Cached image bytes or text for a request, logged as a hit, or None"""
+        value = AIResponseCache.get(cache_key)
+        if value is not None:
+            logged = AIResponseCache.blob_name_for(value) if isinstance(value, bytes) else value
+            AIResponseCache.log_hit(generation_type, prompt, logged, topic, attempt)
+        return value
+    
     @staticmethod
     def evaluate_drawing(canvas_data, topic_prompt, instructional_text, background_description, attempt=None):
-        """Evaluate user drawing and provide feedback"""
+        """Evaluate user drawing and provide feedback
+        
+        Slow requests are hedged when AI_EVALUATION_HEDGING is on (see
+        hedging.Hedger).
+        """
         try:
             evaluation_prompt = f"""
             You are an educational evaluator. A student has completed a drawing exercise.
@@ -173,7 +269,7 @@ class AIService:
             Instructional Text: {instructional_text}
             Background Description: {background_description}
             
-            The student has submitted a drawing (canvas data provided as base64 PNG).
+            The student's drawing is attached as an image, cropped to the area they drew on.
             
             Please evaluate the drawing and provide:
             1. A score from 0-20 (20 being perfect)
@@ -188,8 +284,6 @@ class AIService:
                 "feedback": "<detailed explanation>",
                 "corrections_needed": "<specific corrections if incorrect>"
             }}
-            
-            Canvas Data: {canvas_data[:100]}... (truncated for brevity)
             """
             
             headers = {
@@ -206,7 +300,10 @@ class AIService:
                     },
                     {
                         'role': 'user',
-                        'content': evaluation_prompt
+                        'content': [
+                            {'type': 'text', 'text': evaluation_prompt},
+                            {'type': 'image_url', 'image_url': {'url': canvas_data}}
+                        ]
                     }
                 ],
                 'max_tokens': 800,
@@ -214,13 +311,17 @@ class AIService:
             }
             
             # Log the request
-            log_entry = AIGenerationLog.objects.create(
+            log_entry = run_serialized(
+                AIGenerationLog.objects.create,
                 generation_type='evaluation',
                 prompt=evaluation_prompt,
                 attempt=attempt
             )
             
-            response = requests.post(settings.TEXT_API_URL, headers=headers, json=payload)
+            client = ProviderClient.for_provider('text')
+            response = Hedger.for_operation('evaluation').call(lambda: client.post(headers=headers, json=payload))
+            log_entry.latency_ms = response.latency_ms
+            log_entry.retry_count = response.retries
             
             if response.status_code == 200:
                 data = response.json()
@@ -258,26 +359,64 @@ class AIService:
             raise
 
 
+_generation_executor = None
+_generation_executor_lock = threading.Lock()
+
+
+def _get_generation_executor():
+    """Return the bounded executor shared by concurrent generation legs"""
+    global _generation_executor
+    with _generation_executor_lock:
+        if _generation_executor is None:
+            _generation_executor = ThreadPoolExecutor(
+                max_workers=settings.AI_GENERATION_WORKERS,
+                thread_name_prefix='ai-generation'
+            )
+        return _generation_executor
+
+
+def _run_leg(func):
+    try:
+        return func()
+    finally:
+        connections.close_all()
+
+
+def run_generation_legs(**legs):
+    """Run independent provider calls concurrently
+    
+    Returns (results, errors), both keyed by leg name, so one failed leg
+    does not discard the output of the others.
+    """
+    executor = _get_generation_executor()
+    futures = {name: executor.submit(_run_leg, func) for name, func in legs.items()}
+    
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+    return results, errors
+
+
+def format_leg_errors(errors):
+    return '; '.join(f"{name}: {error}" for name, error in errors.items())
+
+
 class TopicContentGenerator:
     """Service for generating topic content"""
     
     @staticmethod
     def generate_topic_content(topic):
-        """Generate background image and instructional text for a topic"""
+        """Generate background image and instructional text for a topic
+        
+        The image and text calls run concurrently and whichever succeeds is
+        saved even if the other fails.
+        """
         try:
-            # Generate background image
             image_prompt = f"Educational illustration: {topic.prompt}. Create a clear, simple diagram suitable for student interaction."
-            image_data = AIService.generate_image(image_prompt, topic=topic)
-            
-            # Save image
-            image_file = ContentFile(image_data)
-            topic.background_image.save(
-                f'topic_{topic.id}_background.png',
-                image_file,
-                save=False
-            )
-            
-            # Generate instructional text
             text_prompt = f"""
             Create clear, step-by-step instructional text for students working on this topic:
             {topic.prompt}
@@ -289,11 +428,31 @@ class TopicContentGenerator:
             4. Be suitable for interactive canvas drawing
             """
             
-            instructional_text = AIService.generate_text(text_prompt, topic=topic)
-            topic.instructional_text = instructional_text
+            results, errors = run_generation_legs(
+                image=lambda: AIService.generate_image(image_prompt, topic=topic),
+                text=lambda: AIService.generate_text(text_prompt, topic=topic)
+            )
+            
+            if 'image' in results:
+                # Save image
+                topic.background_image.save(
+                    f'topic_{topic.id}_background.png',
+                    ContentFile(results['image']),
+                    save=False
+                )
+            
+            if 'text' in results:
+                topic.instructional_text = results['text']
+            
+            if errors:
+                topic.generation_error = format_leg_errors(errors)
+                topic.save()
+                logger.error(f"Topic content generation failed for topic {topic.id}: {topic.generation_error}")
+                return False
             
             # Mark as generated
             topic.content_generated = True
+            topic.generation_error = ''
             topic.save()
             
             return True
@@ -309,13 +468,18 @@ class FeedbackGenerator:
     """Service for generating updated content based on feedback"""
     
     @staticmethod
-    def generate_corrected_content(attempt, evaluation_result):
-        """Generate corrected image and text for incorrect attempts"""
+    def generate_corrected_content(attempt, evaluation_result, record_failure=True):
+        """Generate corrected image and text for incorrect attempts
+        
+        Both provider calls run concurrently; each leg's output is kept
+        independently of the other's failure. With record_failure False
+        (the job will be retried) a failure raises instead of being stored
+        in evaluation_error.
+        """
         try:
             if evaluation_result['is_correct']:
                 return True
             
-            # Generate corrected image
             corrections = evaluation_result.get('corrections_needed', '')
             corrected_image_prompt = f"""
             Based on the original topic: {attempt.topic.prompt}
@@ -327,18 +491,6 @@ class FeedbackGenerator:
             
             Make it educational and visually clear for the student to understand their mistakes.
             """
-            
-            image_data = AIService.generate_image(corrected_image_prompt, attempt=attempt)
-            
-            # Save corrected image
-            image_file = ContentFile(image_data)
-            attempt.updated_background_image.save(
-                f'attempt_{attempt.id}_corrected.png',
-                image_file,
-                save=False
-            )
-            
-            # Generate updated instructional text
             text_prompt = f"""
             The student made some mistakes in their drawing. Generate encouraging, specific instructions:
             
@@ -352,14 +504,305 @@ class FeedbackGenerator:
             4. Encourages them to try again
             """
             
-            updated_text = AIService.generate_text(text_prompt, attempt=attempt)
-            attempt.updated_instructional_text = updated_text
-            attempt.save()
+            results, errors = run_generation_legs(
+                image=lambda: AIService.generate_image(corrected_image_prompt, attempt=attempt),
+                text=lambda: AIService.generate_text(text_prompt, attempt=attempt)
+            )
+            
+            if 'image' in results:
+                # Save corrected image
+                attempt.updated_background_image.save(
+                    f'attempt_{attempt.id}_corrected.png',
+                    ContentFile(results['image']),
+                    save=False
+                )
+            
+            if 'text' in results:
+                attempt.updated_instructional_text = results['text']
             
+            # A successful retry clears the error of an earlier run
+            attempt.evaluation_error = format_leg_errors(errors) if errors and record_failure else ''
+            attempt.save()
+            if errors:
+                raise Exception(format_leg_errors(errors))
             return True
             
         except Exception as e:
-            attempt.evaluation_error = str(e)
-            attempt.save()
             logger.error(f"Corrected content generation failed for attempt {attempt.id}: {str(e)}")
-            return False
\ No newline at end of file
+            if not record_failure:
+                raise
+            if not attempt.evaluation_error:
+                attempt.evaluation_error = str(e)
+                attempt.save()
+            return False
+
+
+class SubmissionService:
+    """Short database transactions around a drawing submission"""
+    
+    @staticmethod
+    @serialized
+    def reserve_attempt(user, topic, canvas, time_spent, pixel_hash='', perceptual_hash=None, perceptual_detail=None):
+        """Reserve the next attempt number and record the attempt
+        
+        The progress counters are bumped with a single UPDATE before anything
+        is read, so the row lock (or SQLite's write lock) is taken up front and
+        concurrent submissions cannot hand out the same attempt_number. The
+        attempt's evaluation job is scheduled in the same transaction, so
+        it exists exactly when the attempt does.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            progress_rows = UserTopicProgress.objects.filter(user=user, topic=topic)
+            updated = progress_rows.update(
+                total_attempts=F('total_attempts') + 1,
+                total_time_spent=F('total_time_spent') + time_spent
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        UserTopicProgress.objects.create(
+                            user=user,
+                            topic=topic,
+                            total_attempts=1,
+                            total_time_spent=time_spent,
+                            first_attempt_at=now
+                        )
+                except IntegrityError:
+                    # Another request created the row first
+                    progress_rows.update(
+                        total_attempts=F('total_attempts') + 1,
+                        total_time_spent=F('total_time_spent') + time_spent
+                    )
+            
+            progress_rows.filter(first_attempt_at__isnull=True).update(first_attempt_at=now)
+            attempt_number = progress_rows.select_for_update().values_list('total_attempts', flat=True).get()
+            ProgressAggregates.record_attempt(topic, user.id, time_spent, first_attempt=attempt_number == 1)
+            
+            attempt = Attempt.objects.create(
+                user=user,
+                topic=topic,
+                attempt_number=attempt_number,
+                canvas_file=canvas.name,
+                canvas_sha256=canvas.sha256,
+                canvas_bytes=canvas.size,
+                canvas_original_bytes=canvas.original_size,
+                pixel_hash=pixel_hash,
+                perceptual_hash=perceptual_hash,
+                perceptual_detail=perceptual_detail,
+                content_version=topic.content_version,
+                time_spent=time_spent,
+                started_at=now - timezone.timedelta(seconds=time_spent)
+            )
+            
+            from .tasks import enqueue_attempt_evaluation
+            enqueue_attempt_evaluation(attempt)
+            return attempt
+    
+    @staticmethod
+    @serialized
+    def record_evaluation(attempt, evaluation_result, extra_fields=()):
+        """Store an evaluation result and complete the topic if correct
+        
+        An incorrect attempt without corrected content gets its correction
+        job in the same transaction. Returns False, with the attempt
+        reloaded, if another run already recorded a result for it.
+        """
+        with transaction.atomic():
+            # A retried job and a request-time reuse may both get here
+            claimed = Attempt.objects.filter(id=attempt.id, evaluation_completed=False).update(
+                evaluation_completed=True
+            )
+            if not claimed:
+                attempt.refresh_from_db()
+                return False
+            
+            attempt.score = evaluation_result.get('score', 0)
+            attempt.is_correct = evaluation_result.get('is_correct', False)
+            attempt.feedback = evaluation_result.get('feedback', '')
+            attempt.evaluation_completed = True
+            attempt.save(update_fields=['score', 'is_correct', 'feedback', 'evaluation_completed', *extra_fields])
+            
+            newly_completed = False
+            if attempt.is_correct:
+                # Mark topic as completed
+                progress_rows = UserTopicProgress.objects.filter(
+                    user_id=attempt.user_id,
+                    topic_id=attempt.topic_id
+                )
+                completion = {
+                    'completed': True,
+                    'final_score': attempt.score,
+                    'completed_at': timezone.now(),
+                }
+                newly_completed = bool(progress_rows.filter(completed=False).update(**completion))
+                if not newly_completed:
+                    progress_rows.update(**completion)
+            
+            ProgressAggregates.record_evaluation(
+                attempt.topic.group_id, attempt.topic_id, attempt.user_id, attempt.score, newly_completed
+            )
+            
+            if attempt.evaluation_status == Attempt.STATUS_CORRECTING:
+                from .tasks import enqueue_correction
+                enqueue_correction(attempt, evaluation_result)
+        return True
+
+
+class EvaluationReuse:
+    """Reuse evaluations of earlier attempts instead of calling the provider"""
+    
+    @staticmethod
+    def find_exact_match(attempt):
+        """Latest finished attempt on the same topic version with identical pixels"""
+        if not attempt.pixel_hash:
+            return None
+        # Incorrect attempts are only reusable once their corrections exist
+        finished = Q(is_correct=True) | ~Q(updated_background_image='') | ~Q(updated_instructional_text='')
+        return Attempt.objects.filter(
+            finished,
+            topic_id=attempt.topic_id,
+            content_version=attempt.content_version,
+            pixel_hash=attempt.pixel_hash,
+            evaluation_completed=True,
+            evaluation_error=''
+        ).exclude(id=attempt.id).defer('canvas_data').order_by('-submitted_at').first()
+    
+    @staticmethod
+    def find_similar_match(attempt):
+        """Closest provider-evaluated attempt within EVALUATION_PHASH_MAX_DISTANCE
+        
+        The in-memory index is searched by the 64-bit key; the closest
+        candidate is only returned if its detail hash is also within
+        EVALUATION_PHASH_VERIFY_DISTANCE of this attempt's.
+        """
+        max_distance = settings.EVALUATION_PHASH_MAX_DISTANCE
+        if attempt.perceptual_hash is None or not attempt.perceptual_detail or max_distance < 0:
+            return None
+        
+        index = PerceptualHashIndex.for_topic(attempt.topic_id, attempt.content_version)
+        match = index.nearest(attempt.perceptual_hash)
+        if match is None or match[1] > max_distance:
+            return None
+        
+        previous = Attempt.objects.filter(
+            id=match[0],
+            evaluation_completed=True,
+            evaluation_error=''
+        ).exclude(id=attempt.id).defer('canvas_data').first()
+        if previous is None or not previous.perceptual_detail:
+            return None
+        distance = detail_distance(previous.perceptual_detail, attempt.perceptual_detail)
+        return previous if distance <= settings.EVALUATION_PHASH_VERIFY_DISTANCE else None
+    
+    @staticmethod
+    def apply(attempt, previous, source):
+        """Copy score, feedback and corrected assets from a previous attempt"""
+        attempt.updated_background_image = previous.updated_background_image.name
+        attempt.updated_instructional_text = previous.updated_instructional_text
+        attempt.evaluation_source = source
+        recorded = SubmissionService.record_evaluation(
+            attempt,
+            {'score': previous.score, 'is_correct': previous.is_correct, 'feedback': previous.feedback},
+            extra_fields=['updated_background_image', 'updated_instructional_text', 'evaluation_source']
+        )
+        if recorded:
+            logger.info(f"Attempt {attempt.id} reused {source} evaluation of attempt {previous.id}")
+    
+    @staticmethod
+    def try_reuse(attempt):
+        """Apply a cached evaluation if one exists; returns True on a hit"""
+        previous = EvaluationReuse.find_exact_match(attempt)
+        if previous is not None:
+            EvaluationReuse.apply(attempt, previous, Attempt.SOURCE_EXACT)
+            return True
+        
+        previous = EvaluationReuse.find_similar_match(attempt)
+        if previous is not None:
+            EvaluationReuse.apply(attempt, previous, Attempt.SOURCE_SIMILAR)
+            return True
+        
+        return False
+    
+    @staticmethod
+    def index(attempt):
+        """Make a finished provider evaluation available to similar canvases"""
+        if attempt.perceptual_hash is None or attempt.evaluation_status != Attempt.STATUS_COMPLETED:
+            return
+        if attempt.evaluation_error:
+            return
+        PerceptualHashIndex.for_topic(attempt.topic_id, attempt.content_version).add(
+            attempt.id, attempt.perceptual_hash
+        )
+
+
+class AttemptEvaluator:
+    """Service for evaluating submitted attempts outside the request cycle"""
+    
+    @staticmethod
+    def evaluate_attempt(attempt, record_failure=True):
+        """Evaluate an attempt, record the result and generate corrections
+        
+        Provider round-trips run outside any transaction; only the final
+        bookkeeping is written atomically. With record_failure False (the
+        job will be retried) a failed evaluation raises and the attempt
+        stays pending.
+        """
+        topic = attempt.topic
+        
+        # An identical canvas may have been evaluated while this one was queued
+        if EvaluationReuse.try_reuse(attempt):
+            return True
+        
+        try:
+            evaluation_result = AIService.evaluate_drawing(
+                canvas_data=f'data:{attempt.canvas_content_type};base64,' + base64.b64encode(attempt.read_canvas()).decode('ascii'),
+                topic_prompt=topic.prompt,
+                instructional_text=topic.instructional_text,
+                background_description=f"Background image for topic: {topic.title}",
+                attempt=attempt
+            )
+        except Exception as e:
+            logger.error(f"Evaluation failed for attempt {attempt.id}: {str(e)}")
+            if not record_failure:
+                raise
+            attempt.evaluation_error = str(e)
+            attempt.save(update_fields=['evaluation_error'])
+            return False
+        
+        # Corrected content is generated as a job of its own, scheduled
+        # with the result
+        SubmissionService.record_evaluation(attempt, evaluation_result)
+        
+        # Incorrect attempts are indexed by the correction task once complete
+        EvaluationReuse.index(attempt)
+        return True
+
+
+class DashboardStats:
+    """Site-wide totals for the admin dashboard
+    
+    Totals are cached for DASHBOARD_TOTALS_TTL seconds and dropped by the
+    user, group and topic save/delete signals.
+    """
+    
+    CACHE_KEY = 'dashboard:totals'
+    
+    @staticmethod
+    def totals():
+        totals = cache.get(DashboardStats.CACHE_KEY)
+        if totals is None:
+            totals = {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'topics': Topic.objects.count(),
+            }
+            # Counts read from the snapshot may predate the write that
+            # invalidated the cache, and nothing would invalidate them again
+            if not reading_snapshot.get():
+                cache.set(DashboardStats.CACHE_KEY, totals, settings.DASHBOARD_TOTALS_TTL)
+        return totals
+    
+    @staticmethod
+    def invalidate():
+        cache.delete(DashboardStats.CACHE_KEY)
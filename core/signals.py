@@ -0,0 +1,107 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .access import TopicAccess
+from .aggregates import ProgressAggregates
+from .job_queue import job_failed
+from .models import AIJob, Attempt, Group, Topic, UserTopicProgress
+from .page_cache import PageCache
+
+
+@receiver(pre_save, sender=Topic)
+def bump_topic_content_version(sender, instance, update_fields=None, **kwargs):
+    """Invalidate cached evaluations when the prompt or instructions change"""
+    if not instance.pk:
+        return
+    if update_fields is not None and not {'prompt', 'instructional_text'} & set(update_fields):
+        return
+    
+    previous = Topic.objects.filter(pk=instance.pk).values('prompt', 'instructional_text', 'content_version').first()
+    if previous is None:
+        return
+    if previous['prompt'] == instance.prompt and previous['instructional_text'] == instance.instructional_text:
+        return
+    
+    instance.content_version = previous['content_version'] + 1
+    if update_fields is not None and 'content_version' not in update_fields:
+        Topic.objects.filter(pk=instance.pk).update(content_version=instance.content_version)
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Group)
+@receiver([post_save, post_delete], sender=Topic)
+def invalidate_dashboard_totals(sender, **kwargs):
+    """Drop cached dashboard totals when users, groups or topics change"""
+    from .services import DashboardStats
+    DashboardStats.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Attempt)
+@receiver([post_save, post_delete], sender=UserTopicProgress)
+def invalidate_user_pages(sender, instance, **kwargs):
+    """A student's attempts and progress only show on their own pages"""
+    PageCache.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_pages_of_user(sender, instance, **kwargs):
+    TopicAccess.invalidate(instance.pk)
+    PageCache.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Group)
+@receiver([post_save, post_delete], sender=Topic)
+def invalidate_content_pages(sender, **kwargs):
+    """Teacher edits to groups and topics can show on every student's pages"""
+    PageCache.invalidate_content()
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def invalidate_member_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    """Group membership decides which groups and topics a student sees and may open"""
+    if action in ('post_add', 'post_remove'):
+        user_ids = [instance.pk] if reverse else pk_set
+    elif action == 'pre_clear':
+        user_ids = [instance.pk] if reverse else list(instance.members.values_list('id', flat=True))
+    else:
+        return
+    for user_id in user_ids:
+        TopicAccess.invalidate(user_id)
+        PageCache.invalidate_user(user_id)
+
+
+@receiver(post_delete, sender=Attempt)
+@receiver(post_delete, sender=UserTopicProgress)
+def recompute_group_aggregates(sender, instance, **kwargs):
+    """Deleted attempts and progress leave the group's aggregates"""
+    if sender is Attempt and (not instance.evaluation_completed or instance.score is None):
+        return
+    if sender is UserTopicProgress and not instance.total_attempts:
+        return
+    group_id = Topic.objects.filter(id=instance.topic_id).values_list('group_id', flat=True).first()
+    if group_id is not None:
+        ProgressAggregates.invalidate(group_id)
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def recompute_member_aggregates(sender, instance, action, reverse, pk_set, **kwargs):
+    """Aggregates only count current members, so joining or leaving changes them"""
+    if action in ('post_add', 'post_remove'):
+        group_ids = pk_set if reverse else [instance.pk]
+    elif action == 'pre_clear':
+        group_ids = list(instance.ta_groups.values_list('id', flat=True)) if reverse else [instance.pk]
+    else:
+        return
+    for group_id in group_ids:
+        ProgressAggregates.invalidate(group_id, force=action == 'post_add')
+
+
+@receiver(job_failed, sender=AIJob)
+def record_attempt_job_failure(sender, job, error, **kwargs):
+    """Show an evaluation or correction as failed once its job gives up"""
+    if job.job_type not in (AIJob.TYPE_EVALUATION, AIJob.TYPE_CORRECTION) or not job.attempt_id:
+        return
+    attempt = Attempt.objects.filter(id=job.attempt_id).first()
+    if attempt is not None:
+        attempt.evaluation_error = error
+        attempt.save(update_fields=['evaluation_error'])
@@ -0,0 +1,108 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+import os
+import threading
+import time
+import zlib
+from django.conf import settings
+from . import metrics
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; only in-process coalescing there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def run_once(name, key, func, cached=None):
+    """Run func once for all concurrent callers that share key
+
+    The first caller in this process (the leader) runs func; callers that
+    arrive while it is in flight wait for its result, or its exception,
+    instead of making the same request. Leaders in different processes on
+    this host take a file lock on key, and one that had to wait for the
+    lock asks cached() for the response the other process just stored
+    before running func itself.
+
+    Counted in metrics as single_flight.<name>.leader, .coalesced and
+    .cross_process.
+    """
+    with _calls_lock:
+        future = _calls.get(key)
+        leader = future is None
+        if leader:
+            future = _calls[key] = Future()
+
+    if not leader:
+        metrics.increment(f'single_flight.{name}.coalesced')
+        try:
+            return future.result(timeout=settings.AI_SINGLE_FLIGHT_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning(f"Gave up waiting for in-flight {name} request {key[:12]}, sending our own")
+            return func()
+
+    try:
+        with process_lock(key) as waited:
+            value = cached() if waited and cached is not None else None
+            if value is not None:
+                metrics.increment(f'single_flight.{name}.cross_process')
+            else:
+                metrics.increment(f'single_flight.{name}.leader')
+                value = func()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        with _calls_lock:
+            del _calls[key]
+
+
+@contextmanager
+def process_lock(key):
+    """Exclusive lock on key between processes on this host
+
+    Yields whether another process held the lock first. After
+    AI_SINGLE_FLIGHT_TIMEOUT seconds the block runs without the lock.
+    Keys share AI_SINGLE_FLIGHT_LOCK_STRIPES lock files, which are never
+    removed (that would let a late process lock a new file while another
+    still holds the old); two keys on one stripe only wait for each other.
+    """
+    if fcntl is None or not settings.AI_SINGLE_FLIGHT_LOCK_DIR:
+        yield False
+        return
+
+    os.makedirs(settings.AI_SINGLE_FLIGHT_LOCK_DIR, exist_ok=True)
+    with open(lock_path(key), 'a') as handle:
+        waited = False
+        locked = False
+        deadline = time.monotonic() + settings.AI_SINGLE_FLIGHT_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Timed out waiting for the single-flight lock on {key[:12]}")
+                    break
+                time.sleep(0.05)
+        try:
+            yield waited
+        finally:
+            if locked:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def lock_path(key):
+    """Lock file of the stripe that key hashes to"""
+    stripe = zlib.crc32(key.encode()) % settings.AI_SINGLE_FLIGHT_LOCK_STRIPES
+    return os.path.join(settings.AI_SINGLE_FLIGHT_LOCK_DIR, f'{stripe:03x}.lock')
@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import os
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ALIAS = 'snapshot'
+
+# Set while a view decorated with use_snapshot runs; read by SnapshotRouter
+reading_snapshot = ContextVar('reading_snapshot', default=False)
+
+
+class SnapshotDatabase:
+    """Read-only copy of the primary SQLite database
+
+    refresh() copies 'default' into the snapshot file with SQLite's online
+    backup API, which reads a consistent image of the primary without
+    blocking its writers. The snapshot file's mtime records the last
+    refresh, so every process sees the same age.
+    """
+
+    _refresh_lock = threading.Lock()
+
+    @staticmethod
+    def path(alias):
+        return str(connections[alias].settings_dict['NAME'])
+
+    @staticmethod
+    def age():
+        """Seconds since the last refresh, or None if there is no snapshot"""
+        try:
+            return time.time() - os.path.getmtime(SnapshotDatabase.path(SNAPSHOT_ALIAS))
+        except OSError:
+            return None
+
+    @staticmethod
+    def is_fresh():
+        age = SnapshotDatabase.age()
+        return age is not None and age <= settings.SNAPSHOT_MAX_STALENESS
+
+    @staticmethod
+    def refresh():
+        """Copy the primary into the snapshot; returns False if a refresh is already running"""
+        if not SnapshotDatabase._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            started = time.monotonic()
+            target_path = SnapshotDatabase.path(SNAPSHOT_ALIAS)
+            source = sqlite3.connect(SnapshotDatabase.path('default'))
+            target = sqlite3.connect(target_path, timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            os.utime(target_path)
+            metrics.increment('snapshot.refreshes')
+            logger.info(f"Refreshed database snapshot in {time.monotonic() - started:.2f}s")
+            return True
+        finally:
+            SnapshotDatabase._refresh_lock.release()
+
+    @staticmethod
+    def refresh_in_background():
+        from .tasks import run_in_background
+        run_in_background(SnapshotDatabase.refresh)
+
+
+@contextmanager
+def snapshot_reads():
+    """Route reads inside the block to the snapshot while it is fresh
+
+    A stale or missing snapshot leaves reads on the primary and starts a
+    refresh in the background.
+    """
+    use = settings.SNAPSHOT_DB_ENABLED and SnapshotDatabase.is_fresh()
+    if settings.SNAPSHOT_DB_ENABLED and not use:
+        metrics.increment('snapshot.stale')
+        SnapshotDatabase.refresh_in_background()
+    token = reading_snapshot.set(use)
+    try:
+        yield use
+    finally:
+        reading_snapshot.reset(token)
+
+
+def use_snapshot(view_func):
+    """Serve a read-only view's queries from the snapshot (see snapshot_reads)"""
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with snapshot_reads():
+            return view_func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from django.conf import settings
+from django.db import connections, transaction
+from .job_queue import AIJobQueue
+from .models import AIJob, Attempt, Topic
+from .services import AttemptEvaluator, EvaluationReuse, FeedbackGenerator, TopicContentGenerator
+from .write_lane import run_after_lane
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared background executor, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.AI_TASK_WORKERS,
+                thread_name_prefix='ai-task'
+            )
+        return _executor
+
+
+def _run_task(func, *args):
+    """Run a task body and release the worker thread's DB connections"""
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"Background task {func.__name__} failed: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args):
+    """Run func off the request thread (inline when AI_TASKS_EAGER is set)"""
+    if settings.AI_TASKS_EAGER:
+        func(*args)
+    else:
+        _get_executor().submit(_run_task, func, *args)
+
+
+def evaluate_attempt_task(attempt_id):
+    """Evaluate an attempt by id"""
+    attempt = Attempt.objects.select_related('topic').get(id=attempt_id)
+    if attempt.evaluation_completed:
+        # A retried or requeued job whose earlier run got this far; an
+        # incorrect result recorded without its correction job gets one now
+        if attempt.evaluation_status == Attempt.STATUS_CORRECTING and queued() and not pending_correction(attempt):
+            enqueue_correction(
+                attempt,
+                {'score': attempt.score, 'is_correct': attempt.is_correct, 'feedback': attempt.feedback}
+            )
+        return True
+    if attempt.evaluation_error:
+        # Back to pending while the evaluation is retried
+        attempt.evaluation_error = ''
+        attempt.save(update_fields=['evaluation_error'])
+    # Queued jobs are retried, so the error is only recorded once they give up
+    return AttemptEvaluator.evaluate_attempt(attempt, record_failure=not queued())
+
+
+def pending_correction(attempt):
+    """Whether a correction job for the attempt is queued or running"""
+    return AIJob.objects.filter(
+        job_type=AIJob.TYPE_CORRECTION,
+        attempt=attempt,
+        status__in=[AIJob.STATUS_QUEUED, AIJob.STATUS_RUNNING]
+    ).exists()
+
+
+def generate_topic_task(topic_id):
+    """Generate a topic's background image and instructional text by id"""
+    topic = Topic.objects.get(id=topic_id)
+    return TopicContentGenerator.generate_topic_content(topic)
+
+
+def generate_correction_task(attempt_id, evaluation_result):
+    """Generate corrected content for an incorrect attempt by id"""
+    attempt = Attempt.objects.select_related('topic').get(id=attempt_id)
+    succeeded = FeedbackGenerator.generate_corrected_content(attempt, evaluation_result, record_failure=not queued())
+    if succeeded:
+        EvaluationReuse.index(attempt)
+    return succeeded
+
+
+# Task run for each AIJob type, called with the job's payload
+JOB_TASKS = {
+    AIJob.TYPE_TOPIC_GENERATION: generate_topic_task,
+    AIJob.TYPE_EVALUATION: evaluate_attempt_task,
+    AIJob.TYPE_CORRECTION: generate_correction_task,
+}
+
+
+def run_job_task(job_type, payload):
+    """Run the task of a job type; returns whether it succeeded"""
+    return JOB_TASKS[job_type](**payload)
+
+
+def execute_job_task(job_type, payload):
+    """Worker pool entry point: run_job_task, then release the DB connections"""
+    try:
+        return run_job_task(job_type, payload)
+    finally:
+        connections.close_all()
+
+
+def job_task_payload(job):
+    """Task keyword arguments of a stored AIJob"""
+    payload = dict(job.payload)
+    if job.topic_id:
+        payload['topic_id'] = job.topic_id
+    if job.attempt_id:
+        payload['attempt_id'] = str(job.attempt_id)
+    return payload
+
+
+def job_payload(topic=None, attempt=None, **payload):
+    """Task keyword arguments for a job, with related objects as ids"""
+    if topic is not None:
+        payload['topic_id'] = topic.id
+    if attempt is not None:
+        payload['attempt_id'] = str(attempt.id)
+    return payload
+
+
+def queued():
+    """Whether tasks run as AIJob rows (retried by the workers) rather than in process"""
+    return settings.AI_TASK_BACKEND == 'db' and not settings.AI_TASKS_EAGER
+
+
+def schedule(job_type, **payload):
+    """Run a job type's task off the request thread
+    
+    With AI_TASK_BACKEND = 'db' the job is written to the AIJob table and
+    run by `manage.py run_ai_workers`; called inside a transaction, the
+    row commits or rolls back with the caller's writes. Otherwise it runs
+    on the in-process executor once the transaction commits (inline with
+    AI_TASKS_EAGER), never on the SQLite write lane's thread.
+    """
+    if queued():
+        return AIJobQueue.enqueue(job_type, **payload)
+    transaction.on_commit(
+        lambda: run_after_lane(lambda: run_in_background(run_job_task, job_type, job_payload(**payload)))
+    )
+
+
+def enqueue_attempt_evaluation(attempt):
+    """Schedule evaluation of an attempt (SubmissionService.reserve_attempt does this)"""
+    schedule(AIJob.TYPE_EVALUATION, attempt=attempt)
+
+
+def enqueue_topic_generation(topic):
+    """Schedule AI content generation for a new topic"""
+    schedule(AIJob.TYPE_TOPIC_GENERATION, topic=topic)
+
+
+def enqueue_correction(attempt, evaluation_result):
+    """Schedule corrected content for an incorrect attempt"""
+    schedule(AIJob.TYPE_CORRECTION, attempt=attempt, evaluation_result=evaluation_result)
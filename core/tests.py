@@ -1,8 +1,53 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Group, Topic, UserTopicProgress, Attempt
+from unittest import mock, skipUnless
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, connections
+import os
+import threading
+import time
+from django.utils import timezone
+from .models import AIJob, Group, Topic, UserTopicProgress, Attempt, AIGenerationLog, CachedAIResponse, ProgressAggregate
+from .http_client import ProviderClient
+import requests
 import json
+import re
+import io
+import base64
+import shutil
+import tempfile
+
+
+# Canvases written by submission tests go here instead of MEDIA_ROOT
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='ta_test_media_')
+
+# Single-flight lock files and the file-based page cache of every test go
+# here instead of AI_SINGLE_FLIGHT_LOCK_DIR and PAGE_CACHE_LOCATION
+TEST_LOCK_DIR = tempfile.mkdtemp(prefix='ta_test_locks_')
+TEST_PAGE_CACHE_DIR = tempfile.mkdtemp(prefix='ta_test_pages_')
+test_dirs = override_settings(
+    AI_SINGLE_FLIGHT_LOCK_DIR=TEST_LOCK_DIR,
+    CACHES={**settings.CACHES, 'pages': {**settings.CACHES['pages'], 'LOCATION': TEST_PAGE_CACHE_DIR}}
+)
+
+# Per-process page cache, whose TTLs are capped at LOCAL_CACHE_MAX_TTL
+LOCAL_PAGE_CACHES = {
+    **settings.CACHES,
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ta-test-pages'}
+}
+
+
+def setUpModule():
+    test_dirs.enable()
+
+
+def tearDownModule():
+    test_dirs.disable()
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+    shutil.rmtree(TEST_LOCK_DIR, ignore_errors=True)
+    shutil.rmtree(TEST_PAGE_CACHE_DIR, ignore_errors=True)
 
 
 class TASystemTestCase(TestCase):
@@ -202,4 +247,2590 @@ class AIServiceTestCase(TestCase):
         
         self.assertEqual(log.generation_type, 'text')
         self.assertTrue(log.success)
-        self.assertEqual(log.topic, self.topic)
\ No newline at end of file
+        self.assertEqual(log.topic, self.topic)
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class SubmissionTestCase(TestCase):
+    """Test cases for the asynchronous submission flow"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            instructional_text='Test instructions',
+            content_generated=True
+        )
+        self.client.login(username='student', password='testpass')
+    
+    def submit(self, canvas_data=None, time_spent=30):
+        return self.client.post(
+            reverse('submit_drawing', args=[self.topic.id]),
+            data=json.dumps({'canvas_data': canvas_data or make_canvas_data(), 'time_spent': time_spent}),
+            content_type='application/json'
+        )
+    
+    def test_submit_returns_accepted_before_evaluation(self):
+        """Test that submission returns 202 without calling the evaluator"""
+        with mock.patch('core.services.AIService.evaluate_drawing') as evaluate:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = self.submit()
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], Attempt.STATUS_PENDING)
+        self.assertEqual(len(callbacks), 1)
+        evaluate.assert_not_called()
+        
+        attempt = Attempt.objects.get(id=response.json()['attempt_id'])
+        self.assertEqual(attempt.attempt_number, 1)
+        self.assertFalse(attempt.evaluation_completed)
+    
+    def test_status_reports_correct_evaluation(self):
+        """Test that the status endpoint reports a finished evaluation"""
+        evaluation = {'score': 18, 'is_correct': True, 'feedback': 'Great'}
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=evaluation):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.submit()
+        
+        status_response = self.client.get(response.json()['status_url'])
+        result = status_response.json()
+        self.assertEqual(result['status'], Attempt.STATUS_COMPLETED)
+        self.assertTrue(result['is_correct'])
+        self.assertEqual(result['score'], 18)
+        
+        progress = UserTopicProgress.objects.get(user=self.student_user, topic=self.topic)
+        self.assertTrue(progress.completed)
+        self.assertEqual(progress.final_score, 18)
+    
+    def test_status_reports_failed_evaluation(self):
+        """Test that evaluator errors surface as a failed status"""
+        with mock.patch('core.services.AIService.evaluate_drawing', side_effect=Exception('boom')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.submit()
+        
+        result = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(result['status'], Attempt.STATUS_FAILED)
+        self.assertFalse(result['success'])
+    
+    def test_status_hidden_from_other_users(self):
+        """Test that users cannot poll attempts they do not own"""
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.submit()
+        
+        User.objects.create_user(username='other', password='testpass')
+        self.client.login(username='other', password='testpass')
+        status_response = self.client.get(response.json()['status_url'])
+        self.assertEqual(status_response.status_code, 404)
+
+
+class InFlight:
+    """Counts calls in progress at once
+    
+    Each call waits (up to timeout seconds) until `overlap` calls have been
+    in flight together, so calls that can overlap always do and calls that
+    are serialized leave peak below overlap, however fast the machine.
+    """
+    
+    def __init__(self, overlap=2, timeout=5):
+        self.overlap = overlap
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.overlapped = threading.Event()
+    
+    def __call__(self, func):
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                self.current += 1
+                self.peak = max(self.peak, self.current)
+                if self.current >= self.overlap:
+                    self.overlapped.set()
+            try:
+                self.overlapped.wait(self.timeout)
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.current -= 1
+        return wrapper
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ConcurrentSubmissionTestCase(TransactionTestCase):
+    """Test parallel submissions against a single topic"""
+    
+    SUBMISSIONS = 8
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+        self.students = []
+        for index in range(2):
+            student = User.objects.create_user(username=f'student{index}', password='testpass')
+            self.group.members.add(student)
+            self.students.append(student)
+    
+    def submit_with(self, client, index):
+        # Distinct canvases, so no submission reuses another's evaluation
+        canvas_data = make_canvas_data(mark=[(index, index)])
+        try:
+            return client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data=json.dumps({'canvas_data': canvas_data, 'time_spent': 10}),
+                content_type='application/json'
+            ).status_code
+        finally:
+            connections.close_all()
+    
+    def evaluation(self, **kwargs):
+        return {'score': 5, 'is_correct': False, 'feedback': 'Try again'}
+    
+    def test_parallel_submissions_keep_counters_consistent(self):
+        """Test that parallel submits get unique attempt numbers and fast locks"""
+        clients = []
+        for index in range(self.SUBMISSIONS):
+            client = Client()
+            client.force_login(self.students[index % 2])
+            clients.append(client)
+        
+        in_flight = InFlight(overlap=2)
+        with mock.patch('core.services.AIService.evaluate_drawing', side_effect=in_flight(self.evaluation)), \
+                mock.patch('core.services.FeedbackGenerator.generate_corrected_content'):
+            with ThreadPoolExecutor(max_workers=self.SUBMISSIONS) as executor:
+                statuses = list(executor.map(self.submit_with, clients, range(self.SUBMISSIONS)))
+        
+        self.assertEqual(statuses, [202] * self.SUBMISSIONS)
+        
+        for student in self.students:
+            progress = UserTopicProgress.objects.get(user=student, topic=self.topic)
+            attempt_numbers = sorted(
+                Attempt.objects.filter(user=student, topic=self.topic).values_list('attempt_number', flat=True)
+            )
+            self.assertEqual(progress.total_attempts, self.SUBMISSIONS // 2)
+            self.assertEqual(progress.total_time_spent, 10 * self.SUBMISSIONS // 2)
+            self.assertEqual(attempt_numbers, list(range(1, self.SUBMISSIONS // 2 + 1)))
+        
+        self.assertEqual(Attempt.objects.filter(evaluation_completed=True).count(), self.SUBMISSIONS)
+        # Evaluations overlap because no transaction is held across them
+        self.assertGreaterEqual(in_flight.peak, 2)
+
+
+def make_response(status_code, payload=None, headers=None):
+    """Build a requests.Response for mocked provider calls"""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload or {}).encode()
+    response.raw = io.BytesIO(response._content)
+    response.headers.update(headers or {})
+    return response
+
+
+@override_settings(AI_HTTP_MAX_RETRIES=2)
+class ProviderClientTestCase(TestCase):
+    """Test cases for the pooled provider HTTP client"""
+    
+    def setUp(self):
+        ProviderClient.reset()
+    
+    def tearDown(self):
+        ProviderClient.reset()
+    
+    def test_client_shared_per_provider(self):
+        """Test that each provider endpoint gets one shared client"""
+        self.assertIs(ProviderClient.for_provider('text'), ProviderClient.for_provider('text'))
+        self.assertIsNot(ProviderClient.for_provider('text'), ProviderClient.for_provider('image'))
+    
+    def test_retry_honors_retry_after(self):
+        """Test that 429 responses are retried after the requested delay"""
+        responses = [make_response(429, headers={'Retry-After': '2'}), make_response(200)]
+        client = ProviderClient.for_provider('text')
+        
+        with mock.patch.object(client.session, 'request', side_effect=responses) as send, \
+                mock.patch('core.http_client.time.sleep') as sleep:
+            response = client.post(json={})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 1)
+        self.assertEqual(send.call_count, 2)
+        sleep.assert_called_once_with(2.0)
+        self.assertIn('timeout', send.call_args.kwargs)
+    
+    def test_retries_exhausted_returns_last_response(self):
+        """Test that retries stop at the configured limit"""
+        client = ProviderClient.for_provider('text')
+        
+        with mock.patch.object(client.session, 'request', side_effect=lambda *a, **k: make_response(503)) as send, \
+                mock.patch('core.http_client.time.sleep'):
+            response = client.post(json={})
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.retries, 2)
+        self.assertEqual(send.call_count, 3)
+    
+    def test_generation_log_records_latency_and_retries(self):
+        """Test that AIService stores call latency and retry count"""
+        from .services import AIService
+        
+        payload = {'choices': [{'message': {'content': 'Generated'}}]}
+        responses = [make_response(500), make_response(200, payload)]
+        client = ProviderClient.for_provider('text')
+        
+        with mock.patch.object(client.session, 'request', side_effect=responses), \
+                mock.patch('core.http_client.time.sleep'):
+            text = AIService.generate_text('Prompt')
+        
+        self.assertEqual(text, 'Generated')
+        log = AIGenerationLog.objects.get()
+        self.assertTrue(log.success)
+        self.assertEqual(log.retry_count, 1)
+        self.assertIsNotNone(log.latency_ms)
+
+
+@override_settings(
+    AI_HTTP_MAX_RETRIES=0,
+    AI_CIRCUIT_FAILURE_THRESHOLD=2,
+    AI_CIRCUIT_RESET_TIMEOUT=60,
+    AI_CIRCUIT_HALF_OPEN_PROBES=1
+)
+class ProviderProtectionTestCase(TestCase):
+    """Test cases for the provider circuit breakers and rate limiters"""
+    
+    def setUp(self):
+        from . import metrics
+        
+        ProviderClient.reset()
+        metrics.reset()
+    
+    def tearDown(self):
+        ProviderClient.reset()
+    
+    def fail_twice(self, client):
+        with mock.patch.object(client.session, 'request', side_effect=lambda *a, **k: make_response(503)):
+            client.post(json={})
+            client.post(json={})
+    
+    def test_circuit_opens_and_fails_fast(self):
+        """Test that consecutive failures open the circuit and later calls are not sent"""
+        from .circuit_breaker import CircuitOpenError
+        from . import metrics
+        
+        client = ProviderClient.for_provider('text')
+        self.fail_twice(client)
+        self.assertEqual(client.breaker.state, 'open')
+        
+        with mock.patch.object(client.session, 'request') as send:
+            with self.assertRaises(CircuitOpenError):
+                client.post(json={})
+        send.assert_not_called()
+        self.assertEqual(metrics.value('circuit.text.opened'), 1)
+        self.assertEqual(metrics.value('circuit.text.rejected'), 1)
+        self.assertEqual(ProviderClient.for_provider('image').breaker.state, 'closed')
+    
+    def test_client_errors_do_not_open_circuit(self):
+        """Test that non-retryable errors count as the provider being up"""
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=lambda *a, **k: make_response(400)):
+            for _ in range(3):
+                client.post(json={})
+        self.assertEqual(client.breaker.state, 'closed')
+    
+    def test_half_open_probe(self):
+        """Test that one probe is let through after the reset timeout and decides the state"""
+        from .circuit_breaker import CircuitOpenError
+        
+        client = ProviderClient.for_provider('text')
+        self.fail_twice(client)
+        
+        with override_settings(AI_CIRCUIT_RESET_TIMEOUT=0):
+            self.assertTrue(client.breaker.allows_calls())
+            with mock.patch.object(client.session, 'request', side_effect=lambda *a, **k: make_response(503)):
+                client.post(json={})
+            self.assertEqual(client.breaker.state, 'open')
+            
+            client.breaker.before_call()  # A probe still in flight
+            self.assertEqual(client.breaker.state, 'half_open')
+            self.assertFalse(client.breaker.allows_calls())
+            with self.assertRaises(CircuitOpenError):
+                client.post(json={})
+            client.breaker.release()
+            self.assertTrue(client.breaker.allows_calls())
+            
+            with mock.patch.object(client.session, 'request', return_value=make_response(200)):
+                client.post(json={})
+        self.assertEqual(client.breaker.state, 'closed')
+        self.assertEqual(client.breaker.failures, 0)
+    
+    def test_generation_fails_fast_while_open(self):
+        """Test that AIService raises without calling the provider while the circuit is open"""
+        from .circuit_breaker import CircuitOpenError
+        from .services import AIService
+        
+        client = ProviderClient.for_provider('text')
+        self.fail_twice(client)
+        
+        with mock.patch.object(client.session, 'request') as send:
+            with self.assertRaises(CircuitOpenError):
+                AIService.generate_text('Prompt', use_cache=False)
+        send.assert_not_called()
+    
+    @override_settings(
+        AI_PROVIDER_RATE_LIMITS={'text': {'requests_per_minute': 2, 'tokens_per_minute': 0}},
+        AI_RATE_LIMIT_MAX_WAIT=0
+    )
+    def test_requests_per_minute_limit(self):
+        """Test that calls beyond the request budget are rejected without being sent"""
+        from .rate_limit import RateLimitExceeded
+        from . import metrics
+        
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=lambda *a, **k: make_response(200)) as send:
+            client.post(json={})
+            client.post(json={})
+            with self.assertRaises(RateLimitExceeded):
+                client.post(json={})
+        
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(metrics.value('rate_limit.text.rejected'), 1)
+        # Rate limiting is not a provider failure
+        self.assertEqual(client.breaker.state, 'closed')
+        self.assertEqual(client.breaker.failures, 0)
+    
+    @override_settings(
+        AI_PROVIDER_RATE_LIMITS={'text': {'requests_per_minute': 0, 'tokens_per_minute': 1000}},
+        AI_RATE_LIMIT_MAX_WAIT=0
+    )
+    def test_tokens_settled_from_usage(self):
+        """Test that token reservations are corrected by the usage the provider reports"""
+        from .rate_limit import estimate_tokens
+        
+        payload = {'messages': [{'role': 'user', 'content': 'x' * 400}], 'max_tokens': 500}
+        self.assertEqual(estimate_tokens(payload), 600)
+        
+        client = ProviderClient.for_provider('text')
+        bucket = client.limiter.buckets['tokens_per_minute']
+        response = make_response(200, {'usage': {'total_tokens': 150}})
+        with mock.patch.object(client.session, 'request', return_value=response):
+            client.post(json=payload)
+        self.assertAlmostEqual(bucket.available(), 850, delta=1)
+    
+    def test_token_bucket_wait(self):
+        """Test that a bucket in debt reports the wait until it refills"""
+        from .rate_limit import TokenBucket
+        
+        bucket = TokenBucket(per_minute=120)
+        self.assertEqual(bucket.reserve(120), 0)
+        self.assertAlmostEqual(bucket.reserve(2), 1.0, delta=0.05)
+        bucket.refund(2)
+        self.assertLess(bucket.reserve(1), 0.55)
+    
+    def test_status_page_and_api(self):
+        """Test that admins see circuit state on the status page and stats endpoint"""
+        self.fail_twice(ProviderClient.for_provider('text'))
+        User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.client.login(username='admin', password='testpass')
+        
+        response = self.client.get(reverse('provider_status'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Open')
+        self.assertContains(response, 'HTTP 503')
+        
+        data = self.client.get(reverse('provider_stats')).json()
+        self.assertEqual(data['providers']['text']['state'], 'open')
+        self.assertEqual(data['providers']['image']['state'], 'closed')
+        self.assertEqual(data['counters']['circuit.text.opened'], 1)
+    
+    def test_status_page_requires_admin(self):
+        """Test that non-admin users cannot see provider status"""
+        User.objects.create_user(username='student', password='testpass')
+        self.client.login(username='student', password='testpass')
+        self.assertEqual(self.client.get(reverse('provider_status')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('provider_stats')).status_code, 403)
+    
+    @override_settings(AI_TASK_BACKEND='db')
+    def test_workers_skip_jobs_for_open_circuit(self):
+        """Test that jobs calling a provider with an open circuit stay queued"""
+        from .job_queue import AIJobQueue
+        
+        AIJobQueue.enqueue(AIJob.TYPE_EVALUATION)
+        self.fail_twice(ProviderClient.for_provider('text'))
+        self.assertIsNone(AIJobQueue.claim('worker'))
+        
+        ProviderClient.for_provider('text').breaker.record_success()
+        self.assertIsNotNone(AIJobQueue.claim('worker'))
+
+
+@override_settings(
+    AI_EVALUATION_HEDGING=True,
+    AI_HEDGE_PERCENTILE=0.5,
+    AI_HEDGE_MIN_SAMPLES=5,
+    AI_HEDGE_MIN_DELAY=0.05,
+    AI_HEDGE_MAX_RATE=1.0
+)
+class HedgingTestCase(TestCase):
+    """Test cases for hedged evaluation requests"""
+    
+    SLOW = 5.0
+    
+    def setUp(self):
+        from .hedging import Hedger
+        from . import metrics
+        
+        Hedger.reset()
+        ProviderClient.reset()
+        metrics.reset()
+        self.calls = 0
+        # The first call stalls until released (or SLOW passes)
+        self.release = threading.Event()
+        self.first_answered = False
+    
+    def tearDown(self):
+        from .hedging import Hedger
+        
+        self.release.set()
+        Hedger.reset()
+        ProviderClient.reset()
+    
+    def make_hedger(self):
+        from .hedging import Hedger
+        
+        hedger = Hedger('test')
+        for _ in range(10):
+            hedger.histogram.record(50)
+        return hedger
+    
+    def slow_then_fast(self, *args, **kwargs):
+        """The first call stalls; later ones answer at once"""
+        self.calls += 1
+        if self.calls == 1:
+            self.release.wait(self.SLOW)
+            self.first_answered = True
+            content = 'slow'
+        else:
+            content = 'fast'
+        response = make_response(200, {'choices': [{'message': {'content': content}}]})
+        response.latency_ms = 1
+        return response
+    
+    def test_histogram_percentiles(self):
+        """Test that the rolling histogram tracks recent percentiles within a bucket"""
+        from .hedging import LatencyHistogram
+        
+        histogram = LatencyHistogram(window=100)
+        self.assertIsNone(histogram.percentile(0.5))
+        for latency in range(1, 101):
+            histogram.record(latency * 10)
+        self.assertAlmostEqual(histogram.percentile(0.5), 500, delta=50)
+        self.assertAlmostEqual(histogram.percentile(0.99), 990, delta=100)
+        
+        # Older samples leave the window
+        for _ in range(100):
+            histogram.record(5000)
+        self.assertEqual(len(histogram), 100)
+        self.assertAlmostEqual(histogram.percentile(0.5), 5000, delta=500)
+    
+    def test_slow_request_hedged(self):
+        """Test that a second request is sent after the hedge delay and the first answer wins"""
+        from . import metrics
+        
+        hedger = self.make_hedger()
+        response = hedger.call(self.slow_then_fast)
+        
+        self.assertEqual(response.json()['choices'][0]['message']['content'], 'fast')
+        # The hedge's answer was returned while the first call was still stalled
+        self.assertFalse(self.first_answered)
+        self.assertGreaterEqual(response.latency_ms, 50)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(metrics.value('hedge.test.sent'), 1)
+        self.assertEqual(metrics.value('hedge.test.won'), 1)
+    
+    @override_settings(AI_HEDGE_MAX_RATE=0)
+    def test_hedge_budget(self):
+        """Test that no hedge is sent once the budget is spent"""
+        from . import metrics
+        
+        hedger = self.make_hedger()
+        spend = hedger.spend
+        
+        def spend_then_release():
+            # The first call stalls until the hedge has been turned down
+            spent = spend()
+            self.release.set()
+            return spent
+        
+        with mock.patch.object(hedger, 'spend', side_effect=spend_then_release):
+            response = hedger.call(self.slow_then_fast)
+        self.assertEqual(response.json()['choices'][0]['message']['content'], 'slow')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(metrics.value('hedge.test.over_budget'), 1)
+    
+    @override_settings(AI_HEDGE_MAX_RATE=0.5)
+    def test_hedge_rate_bounded(self):
+        """Test that hedges are limited to the configured share of requests"""
+        hedger = self.make_hedger()
+        hedger.earn()
+        self.assertFalse(hedger.spend())
+        hedger.earn()
+        self.assertTrue(hedger.spend())
+        self.assertFalse(hedger.spend())
+        hedger.earn()
+        hedger.earn()
+        self.assertTrue(hedger.spend())
+    
+    def test_not_hedged_without_history(self):
+        """Test that requests are not hedged until enough latencies are recorded"""
+        from .hedging import Hedger
+        
+        hedger = Hedger('test')
+        self.assertIsNone(hedger.hedge_delay())
+        self.release.set()
+        hedger.call(self.slow_then_fast)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(hedger.histogram), 1)
+    
+    @override_settings(AI_EVALUATION_HEDGING=False)
+    def test_disabled(self):
+        """Test that hedging is off unless configured"""
+        self.assertIsNone(self.make_hedger().hedge_delay())
+    
+    def test_failed_hedge_waits_for_first_request(self):
+        """Test that a failed hedge does not beat a slow successful request"""
+        def slow_then_error(*args, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                time.sleep(0.3)
+                response = make_response(200, {'choices': [{'message': {'content': 'slow'}}]})
+            else:
+                response = make_response(503)
+            response.latency_ms = 1
+            return response
+        
+        response = self.make_hedger().call(slow_then_error)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.calls, 2)
+    
+    def test_evaluation_hedged(self):
+        """Test that evaluate_drawing hedges a slow provider call"""
+        from .hedging import Hedger
+        from .services import AIService
+        
+        hedger = Hedger.for_operation('evaluation')
+        for _ in range(10):
+            hedger.histogram.record(50)
+        
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=self.slow_then_fast):
+            result = AIService.evaluate_drawing('data:image/png;base64,AAAA', 'Prompt', 'Text', 'Background')
+        
+        self.assertEqual(result['feedback'], 'fast')
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(self.first_answered)
+        log = AIGenerationLog.objects.get()
+        self.assertTrue(log.success)
+        self.assertLess(log.latency_ms, self.SLOW * 1000)
+
+
+class ConcurrentGenerationTestCase(TestCase):
+    """Test concurrent image/text generation in the content generators"""
+    
+    LEG_DELAY = 0.3
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user
+        )
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+    
+    def slow_image(self, *args, **kwargs):
+        time.sleep(self.LEG_DELAY)
+        return b'image-bytes'
+    
+    def slow_text(self, *args, **kwargs):
+        time.sleep(self.LEG_DELAY)
+        return 'Generated instructions'
+    
+    def test_topic_legs_run_concurrently(self):
+        """Test that topic image and text are generated in parallel"""
+        from .services import TopicContentGenerator
+        
+        in_flight = InFlight(overlap=2)
+        image = in_flight(lambda *args, **kwargs: b'image-bytes')
+        text = in_flight(lambda *args, **kwargs: 'Generated instructions')
+        with mock.patch('core.services.AIService.generate_image', side_effect=image), \
+                mock.patch('core.services.AIService.generate_text', side_effect=text):
+            success = TopicContentGenerator.generate_topic_content(self.topic)
+        
+        self.assertTrue(success)
+        self.assertEqual(in_flight.peak, 2)
+        self.topic.refresh_from_db()
+        self.assertTrue(self.topic.content_generated)
+        self.assertTrue(self.topic.background_image)
+        self.assertEqual(self.topic.instructional_text, 'Generated instructions')
+    
+    def test_failed_image_keeps_text(self):
+        """Test that a failed image leg still saves the generated text"""
+        from .services import TopicContentGenerator
+        
+        with mock.patch('core.services.AIService.generate_image', side_effect=Exception('image down')), \
+                mock.patch('core.services.AIService.generate_text', side_effect=self.slow_text):
+            success = TopicContentGenerator.generate_topic_content(self.topic)
+        
+        self.assertFalse(success)
+        self.topic.refresh_from_db()
+        self.assertFalse(self.topic.content_generated)
+        self.assertEqual(self.topic.instructional_text, 'Generated instructions')
+        self.assertIn('image down', self.topic.generation_error)
+    
+    def test_failed_text_keeps_corrected_image(self):
+        """Test that a failed text leg still saves the corrected image"""
+        from .services import FeedbackGenerator
+        
+        attempt = Attempt.objects.create(
+            user=self.admin_user,
+            topic=self.topic,
+            attempt_number=1,
+            canvas_data='data:image/png;base64,AAAA',
+            time_spent=10,
+            started_at=timezone.now(),
+            evaluation_completed=True
+        )
+        evaluation = {'is_correct': False, 'feedback': 'Wrong', 'corrections_needed': 'Fix it'}
+        
+        with mock.patch('core.services.AIService.generate_image', side_effect=self.slow_image), \
+                mock.patch('core.services.AIService.generate_text', side_effect=Exception('text down')):
+            success = FeedbackGenerator.generate_corrected_content(attempt, evaluation)
+        
+        self.assertFalse(success)
+        attempt.refresh_from_db()
+        self.assertTrue(attempt.updated_background_image)
+        self.assertIn('text down', attempt.evaluation_error)
+        self.assertEqual(attempt.evaluation_status, Attempt.STATUS_COMPLETED)
+
+
+class AIResponseCacheTestCase(TestCase):
+    """Test cases for the AI response cache"""
+    
+    def setUp(self):
+        from .ai_cache import AIResponseCache
+        
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, AI_CACHE_ENABLED=True)
+        self.settings_override.enable()
+        ProviderClient.reset()
+        AIResponseCache.reset()
+    
+    def tearDown(self):
+        from .ai_cache import AIResponseCache
+        
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        ProviderClient.reset()
+        AIResponseCache.reset()
+    
+    def text_response(self, content='Generated'):
+        return make_response(200, {'choices': [{'message': {'content': content}}]})
+    
+    def test_repeated_text_prompt_served_from_cache(self):
+        """Test that an identical text request skips the provider"""
+        from .services import AIService
+        
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', return_value=self.text_response()) as send:
+            first = AIService.generate_text('Same prompt')
+            second = AIService.generate_text('Same prompt')
+        
+        self.assertEqual(first, second)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(
+            list(AIGenerationLog.objects.order_by('created_at', 'id').values_list('cache_hit', flat=True)),
+            [False, True]
+        )
+    
+    def test_bypass_flag_skips_cache(self):
+        """Test that use_cache=False always calls the provider"""
+        from .services import AIService
+        
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=lambda *a, **k: self.text_response()) as send:
+            AIService.generate_text('Same prompt', use_cache=False)
+            AIService.generate_text('Same prompt', use_cache=False)
+        
+        self.assertEqual(send.call_count, 2)
+        self.assertFalse(CachedAIResponse.objects.exists())
+    
+    def test_image_blobs_are_content_addressed(self):
+        """Test that identical image bytes share one blob"""
+        from .ai_cache import AIResponseCache
+        
+        AIResponseCache.set('a' * 64, 'image', b'same-image')
+        AIResponseCache.set('b' * 64, 'image', b'same-image')
+        
+        blob_names = set(CachedAIResponse.objects.values_list('blob_name', flat=True))
+        self.assertEqual(len(blob_names), 1)
+        self.assertEqual(AIResponseCache.get('a' * 64), b'same-image')
+    
+    def test_expired_entries_miss(self):
+        """Test that entries older than the TTL are not served"""
+        from .ai_cache import AIResponseCache
+        
+        AIResponseCache.set('c' * 64, 'text', 'old')
+        CachedAIResponse.objects.update(expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertIsNone(AIResponseCache.get('c' * 64))
+    
+    def test_lru_eviction_respects_size_bound(self):
+        """Test that least recently used entries are evicted first"""
+        from .ai_cache import AIResponseCache
+        
+        with override_settings(AI_CACHE_MAX_BYTES=10):
+            AIResponseCache.set('d' * 64, 'text', 'aaaa')
+            AIResponseCache.set('e' * 64, 'text', 'bbbb')
+            CachedAIResponse.objects.filter(key='d' * 64).update(
+                last_accessed_at=timezone.now() - timezone.timedelta(minutes=5)
+            )
+            AIResponseCache.set('f' * 64, 'text', 'cccc')
+        
+        self.assertEqual(
+            set(CachedAIResponse.objects.values_list('key', flat=True)),
+            {'e' * 64, 'f' * 64}
+        )
+    
+    @override_settings(AI_CACHE_EVICT_INTERVAL=3)
+    def test_size_summed_every_interval(self):
+        """Test that inserts under the bound only sum the table every AI_CACHE_EVICT_INTERVAL"""
+        from .ai_cache import AIResponseCache
+        
+        with mock.patch.object(AIResponseCache, 'evict', side_effect=AIResponseCache.evict) as evict:
+            for number in range(7):
+                AIResponseCache.set(f'{number:064d}', 'text', 'small')
+        self.assertEqual(evict.call_count, 3)
+    
+    def test_blob_written_atomically(self):
+        """Test that image blobs are renamed into place and leave no temporary files"""
+        from .ai_cache import AIResponseCache
+        
+        with mock.patch('core.ai_cache.os.replace', side_effect=os.replace) as replace:
+            AIResponseCache.set('a' * 64, 'image', b'image-bytes')
+        
+        replace.assert_called_once()
+        blob_name = CachedAIResponse.objects.get().blob_name
+        blob_directory = os.path.join(self.media_root, os.path.dirname(blob_name))
+        self.assertEqual(os.listdir(blob_directory), [os.path.basename(blob_name)])
+        self.assertEqual(AIResponseCache.get('a' * 64), b'image-bytes')
+
+
+def make_canvas_data(color=(255, 255, 255, 255), size=(80, 60), mark=None, ink=(0, 0, 0, 255)):
+    """Build a PNG data URL like the one sent by the canvas page"""
+    from PIL import Image
+    
+    image = Image.new('RGBA', size, color)
+    if mark:
+        for x, y in mark:
+            image.putpixel((x, y), ink)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, EVALUATION_PHASH_MAX_DISTANCE=-1)
+class EvaluationReuseTestCase(TestCase):
+    """Test cases for reusing evaluations of identical canvases"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            instructional_text='Test instructions',
+            content_generated=True
+        )
+        self.client.force_login(self.student_user)
+        self.evaluation = {'score': 19, 'is_correct': True, 'feedback': 'Well done'}
+    
+    def submit(self, canvas_data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data=json.dumps({'canvas_data': canvas_data, 'time_spent': 5}),
+                content_type='application/json'
+            )
+    
+    def test_identical_resubmission_reuses_evaluation(self):
+        """Test that an unchanged canvas is answered without the provider"""
+        canvas_data = make_canvas_data(mark=[(1, 1)])
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=self.evaluation) as evaluate:
+            first = self.submit(canvas_data)
+            second = self.submit(canvas_data)
+        
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['status'], Attempt.STATUS_COMPLETED)
+        self.assertEqual(second.json()['score'], 19)
+        self.assertEqual(evaluate.call_count, 1)
+        
+        reused = Attempt.objects.get(id=second.json()['attempt_id'])
+        self.assertEqual(reused.evaluation_source, Attempt.SOURCE_EXACT)
+        self.assertEqual(reused.attempt_number, 2)
+    
+    def test_different_canvas_is_evaluated(self):
+        """Test that changed pixels miss the cache"""
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=self.evaluation) as evaluate:
+            self.submit(make_canvas_data(mark=[(1, 1)]))
+            self.submit(make_canvas_data(mark=[(2, 2)]))
+        
+        self.assertEqual(evaluate.call_count, 2)
+    
+    def test_instruction_change_invalidates_cache(self):
+        """Test that editing the topic's instructions bumps its content version"""
+        canvas_data = make_canvas_data(mark=[(1, 1)])
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=self.evaluation) as evaluate:
+            self.submit(canvas_data)
+            
+            self.topic.instructional_text = 'New instructions'
+            self.topic.save()
+            self.assertEqual(self.topic.content_version, 2)
+            
+            response = self.submit(canvas_data)
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(evaluate.call_count, 2)
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, EVALUATION_PHASH_MAX_DISTANCE=3)
+class NearDuplicateReuseTestCase(TestCase):
+    """Test cases for perceptual-hash reuse of near-identical canvases"""
+    
+    TRANSPARENT = (0, 0, 0, 0)
+    
+    def setUp(self):
+        from .phash_index import PerceptualHashIndex
+        
+        PerceptualHashIndex.reset()
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            instructional_text='Test instructions',
+            content_generated=True
+        )
+        self.client.force_login(self.student_user)
+        self.evaluation = {'score': 20, 'is_correct': True, 'feedback': 'Perfect arrow'}
+        self.arrow = [(x, 30) for x in range(10, 70)] + [(69 - d, 30 - d) for d in range(8)]
+    
+    def submit(self, canvas_data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data=json.dumps({'canvas_data': canvas_data, 'time_spent': 5}),
+                content_type='application/json'
+            )
+    
+    def test_near_identical_canvas_reuses_evaluation(self):
+        """Test that a few changed pixels still reuse the earlier evaluation"""
+        first_canvas = make_canvas_data(color=self.TRANSPARENT, mark=self.arrow)
+        second_canvas = make_canvas_data(color=self.TRANSPARENT, mark=self.arrow + [(40, 31), (41, 31)])
+        
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=self.evaluation) as evaluate:
+            self.submit(first_canvas)
+            response = self.submit(second_canvas)
+        
+        self.assertEqual(evaluate.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        reused = Attempt.objects.get(id=response.json()['attempt_id'])
+        self.assertEqual(reused.evaluation_source, Attempt.SOURCE_SIMILAR)
+        self.assertEqual(reused.score, 20)
+    
+    def assert_evaluated(self, first_canvas, second_canvas):
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=self.evaluation) as evaluate:
+            self.submit(first_canvas)
+            response = self.submit(second_canvas)
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(evaluate.call_count, 2)
+    
+    def test_incorrect_attempt_reused_after_correction(self):
+        """Test that an incorrect attempt is indexed with its corrected content"""
+        evaluation = {'score': 5, 'is_correct': False, 'feedback': 'Wrong way round'}
+        first_canvas = make_canvas_data(color=self.TRANSPARENT, mark=self.arrow)
+        second_canvas = make_canvas_data(color=self.TRANSPARENT, mark=self.arrow + [(40, 31), (41, 31)])
+        
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=evaluation) as evaluate, \
+                mock.patch('core.services.AIService.generate_image', return_value=b'corrected'), \
+                mock.patch('core.services.AIService.generate_text', return_value='Point it left'):
+            self.submit(first_canvas)
+            response = self.submit(second_canvas)
+        
+        self.assertEqual(evaluate.call_count, 1)
+        reused = Attempt.objects.get(id=response.json()['attempt_id'])
+        self.assertEqual(reused.evaluation_source, Attempt.SOURCE_SIMILAR)
+        self.assertEqual(reused.updated_instructional_text, 'Point it left')
+    
+    def test_different_drawing_is_evaluated(self):
+        """Test that a different drawing is not treated as a duplicate"""
+        other_drawing = [(20, y) for y in range(5, 55)]
+        self.assert_evaluated(
+            make_canvas_data(color=self.TRANSPARENT, mark=self.arrow),
+            make_canvas_data(color=self.TRANSPARENT, mark=other_drawing)
+        )
+    
+    def test_mirrored_drawing_is_evaluated(self):
+        """Test that an arrow pointing the other way does not reuse the grade"""
+        mirrored = [(79 - x, y) for x, y in self.arrow]
+        self.assert_evaluated(
+            make_canvas_data(color=self.TRANSPARENT, mark=self.arrow),
+            make_canvas_data(color=self.TRANSPARENT, mark=mirrored)
+        )
+    
+    def test_flipped_drawing_is_evaluated(self):
+        """Test that a vertically mirrored drawing does not reuse the grade"""
+        flipped = [(x, 59 - y) for x, y in self.arrow]
+        self.assert_evaluated(
+            make_canvas_data(color=self.TRANSPARENT, mark=self.arrow),
+            make_canvas_data(color=self.TRANSPARENT, mark=flipped)
+        )
+    
+    def test_rotated_drawing_is_evaluated(self):
+        """Test that an arrow rotated by 90 degrees does not reuse the grade"""
+        rotated = [(y + 10, x - 10) for x, y in self.arrow]
+        self.assert_evaluated(
+            make_canvas_data(color=self.TRANSPARENT, mark=self.arrow),
+            make_canvas_data(color=self.TRANSPARENT, mark=rotated)
+        )
+    
+    def test_recoloured_drawing_is_evaluated(self):
+        """Test that the same shape in another ink colour does not reuse the grade"""
+        self.assert_evaluated(
+            make_canvas_data(color=self.TRANSPARENT, mark=self.arrow),
+            make_canvas_data(color=self.TRANSPARENT, mark=self.arrow, ink=(255, 0, 0, 255))
+        )
+    
+    def test_recoloured_drawing_fails_detail_check(self):
+        """Test that a recoloured drawing matches the ink key but not the detail hash"""
+        from django.conf import settings
+        from .canvas import decode_canvas_data, detail_distance, load_canvas_image, perceptual_hashes
+    
+        black, red = (
+            perceptual_hashes(load_canvas_image(decode_canvas_data(
+                make_canvas_data(color=self.TRANSPARENT, mark=self.arrow, ink=ink)
+            )))
+            for ink in ((0, 0, 0, 255), (255, 0, 0, 255))
+        )
+        self.assertEqual(black[0], red[0])
+        self.assertGreater(detail_distance(black[1], red[1]), settings.EVALUATION_PHASH_VERIFY_DISTANCE)
+    
+    def test_distinct_shapes_hash_apart(self):
+        """Test that shapes with the same ink area are far apart in hash space"""
+        from PIL import Image, ImageDraw
+        from .canvas import DETAIL_BITS, detail_distance, perceptual_hashes
+        
+        def draw(shape):
+            image = Image.new('RGBA', (800, 600), self.TRANSPARENT)
+            getattr(ImageDraw.Draw(image), shape)([300, 200, 500, 400], outline=(0, 0, 0, 255), width=6)
+            return perceptual_hashes(image)
+        
+        (circle_key, circle), (square_key, square) = draw('ellipse'), draw('rectangle')
+        self.assertLess(circle_key, 1 << 64)
+        self.assertEqual(len(circle) * 4, DETAIL_BITS)
+        self.assertGreater(detail_distance(circle, square), 100)
+    
+    def test_index_returns_closest_hash(self):
+        """Test the vectorized Hamming-distance lookup"""
+        from .phash_index import PerceptualHashIndex
+        from .canvas import to_signed64
+        
+        index = PerceptualHashIndex()
+        index.add('a', to_signed64(0b1111))
+        index.add('b', to_signed64(0xFFFFFFFFFFFFFFFF))
+        
+        self.assertEqual(index.nearest(to_signed64(0b0111)), ('a', 1))
+        self.assertEqual(index.nearest(to_signed64(0xFFFFFFFFFFFFFFFE)), ('b', 1))
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, CANVAS_NORMALIZE=False)
+class CanvasStorageTestCase(TestCase):
+    """Test cases for content-addressed canvas files"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+    
+    def test_submission_stores_canvas_file(self):
+        """Test that submitted canvases are stored as deduplicated PNG files"""
+        canvas_data = make_canvas_data(mark=[(3, 3)])
+        self.client.force_login(self.student_user)
+        
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=False):
+                self.client.post(
+                    reverse('submit_drawing', args=[self.topic.id]),
+                    data=json.dumps({'canvas_data': canvas_data, 'time_spent': 5}),
+                    content_type='application/json'
+                )
+        
+        attempts = list(Attempt.objects.all())
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(attempts[0].canvas_file.name, attempts[1].canvas_file.name)
+        self.assertEqual(attempts[0].canvas_data, '')
+        self.assertEqual(attempts[0].read_canvas(), base64.b64decode(canvas_data.split(',', 1)[1]))
+        self.assertEqual(attempts[0].canvas_bytes, len(attempts[0].read_canvas()))
+    
+    def test_invalid_canvas_rejected(self):
+        """Test that undecodable canvas data is rejected"""
+        self.client.force_login(self.student_user)
+        response = self.client.post(
+            reverse('submit_drawing', args=[self.topic.id]),
+            data=json.dumps({'canvas_data': 'data:image/png;base64,!!!', 'time_spent': 5}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+    
+    def test_non_image_canvas_rejected(self):
+        """Test that valid base64 that is not an image is rejected"""
+        self.client.force_login(self.student_user)
+        canvas_data = 'data:image/png;base64,' + base64.b64encode(b'not a png').decode('ascii')
+        response = self.client.post(
+            reverse('submit_drawing', args=[self.topic.id]),
+            data=json.dumps({'canvas_data': canvas_data, 'time_spent': 5}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+    
+    @override_settings(CANVAS_MAX_WIDTH=100, CANVAS_MAX_HEIGHT=100)
+    def test_oversized_canvas_rejected(self):
+        """Test that a canvas over the pixel limits is rejected before decoding"""
+        self.client.force_login(self.student_user)
+        with mock.patch('PIL.Image.Image.convert') as convert:
+            response = self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data=json.dumps({'canvas_data': make_canvas_data(size=(101, 10)), 'time_spent': 5}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 400)
+        convert.assert_not_called()
+        self.assertFalse(Attempt.objects.exists())
+    
+    def test_migrate_canvas_storage_command(self):
+        """Test that legacy base64 rows are moved into files in batches"""
+        from django.core.management import call_command
+        
+        canvas_data = make_canvas_data(mark=[(5, 5)])
+        for number in range(1, 6):
+            Attempt.objects.create(
+                user=self.student_user,
+                topic=self.topic,
+                attempt_number=number,
+                canvas_data=canvas_data,
+                time_spent=10,
+                started_at=timezone.now()
+            )
+        
+        call_command('migrate_canvas_storage', batch_size=2, stdout=io.StringIO())
+        
+        self.assertFalse(Attempt.objects.exclude(canvas_data='').exists())
+        self.assertEqual(Attempt.objects.values('canvas_file').distinct().count(), 1)
+        attempt = Attempt.objects.first()
+        self.assertEqual(attempt.read_canvas(), base64.b64decode(canvas_data.split(',', 1)[1]))
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, CANVAS_NORMALIZE=False)
+class BinaryCanvasUploadTestCase(TestCase):
+    """Test cases for multipart and raw image/png canvas submissions"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+        self.canvas_bytes = base64.b64decode(make_canvas_data(mark=[(4, 4)]).split(',', 1)[1])
+        self.client.force_login(self.student_user)
+    
+    def test_multipart_upload(self):
+        """Test that a canvas.toBlob form upload is stored like the JSON path"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data={
+                    'canvas': SimpleUploadedFile('canvas.png', self.canvas_bytes, content_type='image/png'),
+                    'time_spent': '12',
+                }
+            )
+        
+        self.assertEqual(response.status_code, 202)
+        attempt = Attempt.objects.get()
+        self.assertEqual(attempt.time_spent, 12)
+        self.assertEqual(attempt.read_canvas(), self.canvas_bytes)
+        self.assertTrue(attempt.pixel_hash)
+    
+    def test_raw_png_upload(self):
+        """Test that a raw image/png body is accepted with time_spent in the query string"""
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]) + '?time_spent=7',
+                data=self.canvas_bytes,
+                content_type='image/png'
+            )
+        
+        self.assertEqual(response.status_code, 202)
+        attempt = Attempt.objects.get()
+        self.assertEqual(attempt.time_spent, 7)
+        self.assertEqual(attempt.canvas_bytes, len(self.canvas_bytes))
+        self.assertEqual(attempt.read_canvas(), self.canvas_bytes)
+    
+    def test_oversized_upload_rejected(self):
+        """Test that uploads over CANVAS_UPLOAD_MAX_BYTES get 413"""
+        with self.settings(CANVAS_UPLOAD_MAX_BYTES=len(self.canvas_bytes) - 1):
+            response = self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data=self.canvas_bytes,
+                content_type='image/png'
+            )
+        
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Attempt.objects.exists())
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, CANVAS_CROP_MARGIN=4)
+class CanvasNormalizationTestCase(TestCase):
+    """Test cases for cropping and recompressing submitted canvases"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            description='Test description',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+        # Faded background with a short stroke, as drawn on the canvas page
+        self.canvas_data = make_canvas_data(
+            color=(120, 180, 240, 178), size=(200, 150), mark=[(x, 40) for x in range(50, 70)]
+        )
+        self.evaluation = {
+            'score': 18,
+            'is_correct': True,
+            'feedback': 'Great job!',
+            'corrections_needed': ''
+        }
+        self.client.force_login(self.student_user)
+    
+    def submit(self):
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=self.evaluation) as evaluate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    reverse('submit_drawing', args=[self.topic.id]),
+                    data=json.dumps({'canvas_data': self.canvas_data, 'time_spent': 5}),
+                    content_type='application/json'
+                )
+        return Attempt.objects.get(), evaluate
+    
+    def test_canvas_cropped_to_ink(self):
+        """Test that the stored canvas is cropped around the ink and smaller"""
+        from PIL import Image
+        
+        attempt, _ = self.submit()
+        stored = Image.open(io.BytesIO(attempt.read_canvas())).convert('RGBA')
+        
+        self.assertEqual(stored.size, (28, 9))
+        self.assertEqual(stored.getpixel((4, 4)), (0, 0, 0, 255))
+        self.assertEqual(stored.getpixel((0, 0)), (120, 180, 240, 178))
+        self.assertEqual(attempt.canvas_original_bytes, len(base64.b64decode(self.canvas_data.split(',', 1)[1])))
+        self.assertLess(attempt.canvas_bytes, attempt.canvas_original_bytes)
+        self.assertEqual(attempt.canvas_bytes_saved, attempt.canvas_original_bytes - attempt.canvas_bytes)
+    
+    def test_evaluator_receives_normalized_canvas(self):
+        """Test that the evaluator gets the stored (normalized) image"""
+        attempt, evaluate = self.submit()
+        
+        canvas_data = evaluate.call_args.kwargs['canvas_data']
+        self.assertTrue(canvas_data.startswith('data:image/png;base64,'))
+        self.assertEqual(base64.b64decode(canvas_data.split(',', 1)[1]), attempt.read_canvas())
+    
+    @override_settings(CANVAS_STORAGE_FORMAT='webp')
+    def test_webp_storage(self):
+        """Test that canvases can be stored as lossless WebP"""
+        attempt, evaluate = self.submit()
+        
+        self.assertTrue(attempt.canvas_file.name.endswith('.webp'))
+        self.assertEqual(attempt.canvas_content_type, 'image/webp')
+        self.assertTrue(evaluate.call_args.kwargs['canvas_data'].startswith('data:image/webp;base64,'))
+
+
+class HomePageQueryTestCase(TestCase):
+    """Test that the home page query count does not grow with topics"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+    
+    def make_student(self, topic_count):
+        """Create a student in up to five groups sharing topic_count topics"""
+        student = User.objects.create_user(username=f'student{topic_count}', password='testpass')
+        groups = [
+            Group.objects.create(name=f'Group {topic_count}-{number}', created_by=self.admin_user)
+            for number in range(min(topic_count, 5))
+        ]
+        for group in groups:
+            group.members.add(student)
+        Topic.objects.bulk_create([
+            Topic(
+                title=f'Topic {number}',
+                prompt='Test prompt',
+                group=groups[number % len(groups)],
+                created_by=self.admin_user,
+                content_generated=True
+            )
+            for number in range(topic_count)
+        ])
+        return student
+    
+    def test_constant_queries(self):
+        """Test home page queries for users with 1, 10 and 100 topics"""
+        for topic_count in (1, 10, 100):
+            with self.subTest(topic_count=topic_count):
+                student = self.make_student(topic_count)
+                self.client.force_login(student)
+                
+                # session, user, groups, topics, progress, bulk insert
+                with self.assertNumQueries(6):
+                    response = self.client.get(reverse('home'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(UserTopicProgress.objects.filter(user=student).count(), topic_count)
+                
+                # session, user; the page data comes from the page cache
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('home'))
+                self.assertContains(response, 'Topic 0')
+
+
+class GroupProgressMatrixTestCase(TestCase):
+    """Test cases for the aggregated group progress matrix"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.client.force_login(self.admin_user)
+    
+    def populate(self, member_count, topic_count):
+        members = [
+            User.objects.create_user(username=f'student{self.group.members.count() + number}', password='testpass')
+            for number in range(member_count)
+        ]
+        self.group.members.add(*members)
+        topics = Topic.objects.bulk_create([
+            Topic(title=f'Topic {number}', prompt='Test prompt', group=self.group, created_by=self.admin_user)
+            for number in range(topic_count)
+        ])
+        for member in members:
+            for topic in topics:
+                UserTopicProgress.objects.create(user=member, topic=topic, total_attempts=2, total_time_spent=30)
+                for number, score in ((1, 8), (2, 15)):
+                    Attempt.objects.create(
+                        user=member,
+                        topic=topic,
+                        attempt_number=number,
+                        score=score,
+                        time_spent=15,
+                        started_at=timezone.now()
+                    )
+        return members, topics
+    
+    def test_constant_queries(self):
+        """Test that the matrix page query count does not grow with the group"""
+        url = reverse('group_detail_admin', args=[self.group.id])
+        self.populate(2, 2)
+        with self.assertNumQueries(10):
+            self.client.get(url)
+        
+        self.populate(10, 5)
+        with self.assertNumQueries(10):
+            response = self.client.get(url)
+        
+        row = response.context['matrix'][0]
+        self.assertEqual(len(row['cells']), len(response.context['topics']))
+        topic, cell = row['cells'][0]
+        self.assertEqual(cell['attempts'], 2)
+        self.assertEqual(cell['best_score'], 15)
+        self.assertEqual(cell['time_spent'], 30)
+        self.assertEqual(response.context['in_progress_count'], 2 * 2 + 10 * 5)
+    
+    def test_members_paginated(self):
+        """Test that the member axis is paginated"""
+        self.populate(30, 1)
+        response = self.client.get(reverse('group_detail_admin', args=[self.group.id]), {'page': 2})
+        self.assertEqual(len(response.context['matrix']), 5)
+    
+    def test_attempt_history(self):
+        """Test the per-cell attempt history endpoint"""
+        (member,), (topic,) = self.populate(1, 1)
+        response = self.client.get(reverse('attempt_history', args=[self.group.id, member.id, topic.id]))
+        
+        self.assertEqual(response.status_code, 200)
+        attempts = response.json()['attempts']
+        self.assertEqual([attempt['attempt_number'] for attempt in attempts], [1, 2])
+        self.assertEqual(attempts[1]['score'], 15)
+        
+        other_group = Group.objects.create(name='Other Group', created_by=self.admin_user)
+        response = self.client.get(reverse('attempt_history', args=[other_group.id, member.id, topic.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AdminDashboardQueryTestCase(TestCase):
+    """Test cases for annotated counts and cached totals on admin pages"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.client.force_login(self.admin_user)
+    
+    def add_groups(self, count):
+        for number in range(count):
+            group = Group.objects.create(name=f'Group {Group.objects.count()}', created_by=self.admin_user)
+            student = User.objects.create_user(username=f'student-{group.id}', password='testpass')
+            group.members.add(student, self.admin_user)
+            Topic.objects.create(title='Topic', prompt='Test prompt', group=group, created_by=self.admin_user)
+    
+    def test_dashboard_constant_queries(self):
+        """Test that the dashboard query count does not depend on the groups"""
+        self.add_groups(2)
+        # session, user, groups page, pagination count, aggregates, cached totals (3)
+        with self.assertNumQueries(8):
+            self.client.get(reverse('admin_dashboard'))
+        
+        self.add_groups(8)
+        self.client.get(reverse('admin_dashboard'))
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('admin_dashboard'))
+        
+        self.assertContains(response, '<span class="badge bg-info">2</span>', html=True)
+        self.assertEqual(response.context['total_topics'], 10)
+    
+    def test_totals_invalidated_on_write(self):
+        """Test that cached totals are dropped when a user is created"""
+        self.client.get(reverse('admin_dashboard'))
+        User.objects.create_user(username='newcomer', password='testpass')
+        
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_users'], 2)
+    
+    def test_create_topic_group_counts(self):
+        """Test that the create topic form counts members in one query"""
+        self.add_groups(5)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('create_topic'))
+        self.assertContains(response, '(2 members)', count=5)
+
+
+class AdminChangelistQueryTestCase(TestCase):
+    """Test that admin changelists run a constant number of queries"""
+    
+    CHANGELISTS = ['group', 'usertopicprogress', 'attempt', 'aigenerationlog']
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', password='testpass')
+        self.client.force_login(self.admin_user)
+    
+    def add_rows(self, count):
+        for number in range(count):
+            group = Group.objects.create(name=f'Group {Group.objects.count()}', created_by=self.admin_user)
+            student = User.objects.create_user(username=f'student-{group.id}', password='testpass')
+            group.members.add(student)
+            topic = Topic.objects.create(title=f'Topic {group.id}', prompt='Test prompt', group=group, created_by=self.admin_user)
+            UserTopicProgress.objects.create(user=student, topic=topic, total_attempts=1)
+            attempt = Attempt.objects.create(
+                user=student,
+                topic=topic,
+                attempt_number=1,
+                time_spent=30,
+                started_at=timezone.now(),
+                canvas_data='x' * 1000
+            )
+            AIGenerationLog.objects.create(generation_type='evaluation', prompt='Test prompt', topic=topic, attempt=attempt)
+    
+    def changelist_queries(self, model_name, query=''):
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:core_{model_name}_changelist') + query)
+        self.assertEqual(response.status_code, 200)
+        return response, [captured['sql'] for captured in queries]
+    
+    def test_constant_queries(self):
+        """Test that the query count of each changelist does not depend on the rows"""
+        self.add_rows(2)
+        counts = {name: len(self.changelist_queries(name)[1]) for name in self.CHANGELISTS}
+        
+        self.add_rows(10)
+        for name in self.CHANGELISTS:
+            with self.subTest(changelist=name):
+                response, queries = self.changelist_queries(name)
+                self.assertEqual(len(queries), counts[name])
+                self.assertEqual(response.context['cl'].result_count, 12)
+    
+    def test_group_counts_annotated(self):
+        """Test that member and topic counts come from the changelist query"""
+        self.add_rows(3)
+        Group.objects.first().members.add(self.admin_user)
+        
+        response, queries = self.changelist_queries('group')
+        results = response.context['cl'].result_list
+        self.assertEqual(sorted(group.member_count for group in results), [1, 1, 2])
+        self.assertEqual(sum('core_group_members' in sql for sql in queries), 1)
+    
+    def test_heavy_columns_deferred(self):
+        """Test that attempt and log changelists do not load large text columns"""
+        self.add_rows(2)
+        for name, column in (('attempt', 'canvas_data'), ('aigenerationlog', 'response'), ('aigenerationlog', 'prompt')):
+            with self.subTest(changelist=name, column=column):
+                queries = self.changelist_queries(name)[1]
+                self.assertFalse(any(f'."{column}"' in sql for sql in queries))
+        
+        response = self.client.get(reverse('admin:core_attempt_change', args=[Attempt.objects.first().id]))
+        self.assertEqual(response.status_code, 200)
+    
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=5)
+    def test_estimated_count(self):
+        """Test that large unfiltered lists are not counted and filtered lists are"""
+        self.add_rows(6)
+        response, queries = self.changelist_queries('attempt')
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertFalse(any(sql.startswith('SELECT COUNT(*)') for sql in queries))
+        
+        response, queries = self.changelist_queries('attempt', '?is_correct__exact=0')
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertTrue(any(sql.startswith('SELECT COUNT(*)') for sql in queries))
+        
+        Attempt.objects.filter(pk__in=Attempt.objects.values('pk')[:1]).delete()
+        response = self.changelist_queries('attempt', '?is_correct__exact=0')[0]
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+
+class ProgressAggregateTestCase(TestCase):
+    """Test cases for incrementally maintained progress aggregates"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.students = [
+            User.objects.create_user(username=f'student{number}', password='testpass') for number in range(2)
+        ]
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(*self.students)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+    
+    def submit(self, student, score, is_correct, time_spent=30):
+        from .canvas import StoredCanvas
+        from .services import SubmissionService
+        
+        canvas = StoredCanvas('canvases/00/test.png', '0' * 64, 10, 10)
+        attempt = SubmissionService.reserve_attempt(student, self.topic, canvas, time_spent)
+        SubmissionService.record_evaluation(attempt, {'score': score, 'is_correct': is_correct, 'feedback': ''})
+        return attempt
+    
+    def test_incremental_updates(self):
+        """Test that submissions keep topic and group aggregates current"""
+        self.submit(self.students[0], 8, False)
+        self.submit(self.students[0], 18, True)
+        self.submit(self.students[0], 20, True)
+        self.submit(self.students[1], 14, True, time_spent=60)
+        
+        topic_aggregate = ProgressAggregate.objects.get(topic=self.topic)
+        group_aggregate = ProgressAggregate.objects.get(group=self.group, topic__isnull=True)
+        for aggregate in (topic_aggregate, group_aggregate):
+            self.assertEqual(aggregate.learners, 2)
+            self.assertEqual(aggregate.completed_learners, 2)
+            self.assertEqual(aggregate.total_attempts, 4)
+            self.assertEqual(aggregate.total_time_spent, 150)
+            self.assertEqual(aggregate.mean_score, 15)
+            self.assertEqual(aggregate.median_score, 16)
+            self.assertEqual(aggregate.mean_attempts, 2)
+            self.assertEqual(aggregate.score_histogram[18], 1)
+    
+    def test_rebuild_and_drift_check(self):
+        """Test that rebuild_aggregates detects and corrects drift"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        
+        self.submit(self.students[0], 8, False)
+        self.submit(self.students[1], 14, True)
+        call_command('rebuild_aggregates', check=True, batch_size=1, stdout=io.StringIO())
+        
+        ProgressAggregate.objects.filter(topic=self.topic).update(completed_learners=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_aggregates', check=True, stdout=io.StringIO())
+        
+        call_command('rebuild_aggregates', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(ProgressAggregate.objects.get(topic=self.topic).completed_learners, 1)
+        call_command('rebuild_aggregates', check=True, stdout=io.StringIO())
+    
+    def assert_no_drift(self):
+        from django.core.management import call_command
+        
+        call_command('rebuild_aggregates', check=True, stdout=io.StringIO())
+    
+    def test_group_counts_distinct_learners(self):
+        """Test that a learner trying several topics counts once in the group row"""
+        other_topic = Topic.objects.create(
+            title='Other Topic',
+            prompt='Other prompt',
+            group=self.group,
+            created_by=self.admin_user
+        )
+        self.submit(self.students[0], 18, True)
+        self.topic, first_topic = other_topic, self.topic
+        self.submit(self.students[0], 16, True)
+        self.submit(self.students[1], 8, False)
+        
+        group_aggregate = ProgressAggregate.objects.get(group=self.group, topic__isnull=True)
+        self.assertEqual((group_aggregate.learners, group_aggregate.completed_learners), (2, 1))
+        self.assertEqual(group_aggregate.total_attempts, 3)
+        self.assertEqual(ProgressAggregate.objects.get(topic=first_topic).learners, 1)
+        self.assertEqual(ProgressAggregate.objects.get(topic=other_topic).learners, 2)
+        self.assert_no_drift()
+    
+    def test_deletions_decrement(self):
+        """Test that deleting attempts and progress rows takes them out of the aggregates"""
+        self.submit(self.students[0], 8, False)
+        self.submit(self.students[1], 14, True)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Attempt.objects.filter(user=self.students[1]).delete()
+        topic_aggregate = ProgressAggregate.objects.get(topic=self.topic)
+        self.assertEqual((topic_aggregate.scored_attempts, topic_aggregate.score_sum), (1, 8))
+        self.assertFalse(topic_aggregate.stale)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            UserTopicProgress.objects.filter(user=self.students[1]).delete()
+        for aggregate in ProgressAggregate.objects.all():
+            self.assertEqual((aggregate.learners, aggregate.completed_learners, aggregate.total_attempts), (1, 0, 1))
+        self.assert_no_drift()
+    
+    def test_member_changes_recomputed(self):
+        """Test that leaving a group removes a learner and rejoining restores them"""
+        self.submit(self.students[0], 8, False)
+        self.submit(self.students[1], 14, True)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.members.remove(self.students[1])
+        group_aggregate = ProgressAggregate.objects.get(group=self.group, topic__isnull=True)
+        self.assertEqual((group_aggregate.learners, group_aggregate.completed_learners), (1, 0))
+        self.assert_no_drift()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[1].ta_groups.add(self.group)
+        group_aggregate.refresh_from_db()
+        self.assertEqual((group_aggregate.learners, group_aggregate.completed_learners), (2, 1))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.members.clear()
+        self.assertFalse(ProgressAggregate.objects.exists())
+    
+    def test_stats_endpoints(self):
+        """Test the aggregate REST endpoints"""
+        self.submit(self.students[0], 12, True)
+        
+        self.client.force_login(self.students[0])
+        response = self.client.get(reverse('topic_stats', args=[self.topic.id]))
+        self.assertEqual(response.status_code, 403)
+        
+        self.client.force_login(self.admin_user)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('topic_stats', args=[self.topic.id]))
+        self.assertEqual(response.json()['completion_rate'], 1.0)
+        self.assertEqual(response.json()['median_score'], 12)
+        
+        response = self.client.get(reverse('group_stats', args=[self.group.id]))
+        self.assertEqual(response.json()['group']['learners'], 1)
+        self.assertEqual(len(response.json()['topics']), 1)
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, PAGE_CACHE_ENABLED=True)
+class PageCacheTestCase(TestCase):
+    """Test cases for the per-user home and topic page cache"""
+    
+    def setUp(self):
+        from . import metrics
+        
+        metrics.reset()
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            instructional_text='Test instructions',
+            content_generated=True
+        )
+        self.client.force_login(self.student_user)
+    
+    def test_topic_page_hits_and_hit_rate(self):
+        """Test that repeat visits are served from the cache and counted"""
+        from . import metrics
+        
+        url = reverse('topic_detail', args=[self.topic.id])
+        self.client.get(url)
+        self.client.get(url)
+        # session, user; topic and membership are cached
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, 'Test instructions')
+        self.assertEqual(metrics.value('page_cache.topic.hit'), 2)
+        self.assertAlmostEqual(metrics.hit_rate('page_cache.topic'), 2 / 3)
+        
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('cache_stats'))
+        self.assertEqual(response.json()['counters']['page_cache.topic.miss'], 1)
+    
+    def test_submission_invalidates_student_pages(self):
+        """Test that a submission shows on the next visit to the topic"""
+        url = reverse('topic_detail', args=[self.topic.id])
+        self.client.get(url)
+        self.client.get(url)
+        
+        evaluation = {'score': 8, 'is_correct': False, 'feedback': 'Try again'}
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=evaluation):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    reverse('submit_drawing', args=[self.topic.id]),
+                    data=json.dumps({'canvas_data': make_canvas_data((200, 0, 0, 255)), 'time_spent': 30}),
+                    content_type='application/json'
+                )
+        
+        response = self.client.get(url)
+        self.assertEqual(response.context['progress'].total_attempts, 1)
+        self.assertEqual(response.context['latest_attempt'].score, 8)
+    
+    def test_topic_edit_invalidates_pages(self):
+        """Test that a teacher's topic edit reaches cached pages"""
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        
+        self.topic.title = 'Renamed Topic'
+        self.topic.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Renamed Topic')
+        self.assertContains(response, '<div class="card h-100 topic-card">')
+    
+    def test_membership_change_invalidates_pages(self):
+        """Test that removing a student from a group hides it and its topics"""
+        self.client.get(reverse('home'))
+        self.client.get(reverse('topic_detail', args=[self.topic.id]))
+        
+        self.group.members.remove(self.student_user)
+        self.assertNotContains(self.client.get(reverse('home')), 'Test Topic')
+        response = self.client.get(reverse('topic_detail', args=[self.topic.id]))
+        self.assertRedirects(response, reverse('home'))
+    
+    def test_file_cache_shared_between_processes(self):
+        """Test that an invalidation made by another process reaches this one's cache"""
+        from django.core.cache import caches
+        from .page_cache import cache_ttl
+        
+        self.assertEqual(cache_ttl(600), 600)
+        self.client.get(reverse('home'))
+        # Another process: its own cache handle on the same directory
+        Topic.objects.filter(id=self.topic.id).update(title='Renamed Topic')
+        caches.create_connection(settings.PAGE_CACHE_ALIAS).set('pages:content:version', 0, None)
+        self.assertContains(self.client.get(reverse('home')), 'Renamed Topic')
+    
+    @override_settings(PAGE_CACHE_TTL=600, LOCAL_CACHE_MAX_TTL=5, CACHES=LOCAL_PAGE_CACHES)
+    def test_local_cache_expires_quickly(self):
+        """Test that an edit another process made shows within seconds"""
+        import time
+        
+        self.client.get(reverse('home'))
+        # Like an edit handled by another process: no signal reaches this cache
+        Topic.objects.filter(id=self.topic.id).update(title='Renamed Topic')
+        self.assertNotContains(self.client.get(reverse('home')), 'Renamed Topic')
+        
+        later = time.time() + 6
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertContains(self.client.get(reverse('home')), 'Renamed Topic')
+
+
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT)
+class TopicAccessTestCase(TestCase):
+    """Test cases for cached topic authorization"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+        self.client.force_login(self.student_user)
+    
+    def submit(self):
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value={'score': 5, 'is_correct': False}):
+            return self.client.post(
+                reverse('submit_drawing', args=[self.topic.id]),
+                data=json.dumps({'canvas_data': make_canvas_data(), 'time_spent': 30}),
+                content_type='application/json'
+            )
+    
+    def test_warm_check_is_one_query(self):
+        """Test that a warm check only loads the topic and its group"""
+        from .access import TopicAccess
+        
+        user = User.objects.get(id=self.student_user.id)
+        TopicAccess.get_topic(user, self.topic.id)
+        with self.assertNumQueries(1):
+            topic, has_access = TopicAccess.get_topic(user, self.topic.id)
+            self.assertEqual(topic.group.name, 'Test Group')
+        self.assertTrue(has_access)
+    
+    def test_membership_changes_invalidate(self):
+        """Test that removing and re-adding a member takes effect at once"""
+        self.assertEqual(self.submit().status_code, 202)
+        
+        self.group.members.remove(self.student_user)
+        self.assertEqual(self.submit().status_code, 403)
+        
+        self.student_user.ta_groups.add(self.group)
+        self.assertEqual(self.submit().status_code, 202)
+        
+        self.student_user.ta_groups.clear()
+        self.assertEqual(self.submit().status_code, 403)
+    
+    @override_settings(MEMBERSHIP_CACHE_TTL=600, LOCAL_CACHE_MAX_TTL=5, CACHES=LOCAL_PAGE_CACHES)
+    def test_local_cache_expires_quickly(self):
+        """Test that a revocation another process made shows within seconds"""
+        from .access import TopicAccess
+        import time
+        
+        user = User.objects.get(id=self.student_user.id)
+        self.assertTrue(TopicAccess.get_topic(user, self.topic.id)[1])
+        # Like a removal handled by another process: no signal reaches this cache
+        Group.members.through.objects.filter(user=user).delete()
+        self.assertTrue(TopicAccess.get_topic(user, self.topic.id)[1])
+        
+        later = time.time() + 6
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertFalse(TopicAccess.get_topic(user, self.topic.id)[1])
+    
+    @override_settings(MEMBERSHIP_CACHE_TTL=600)
+    def test_shared_cache_keeps_ttl(self):
+        """Test that the default file-based cache keeps the configured TTL"""
+        from .page_cache import cache_ttl
+        
+        self.assertEqual(cache_ttl(600), 600)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+@override_settings(PAGE_CACHE_ENABLED=False)
+class QueryPlanTestCase(TestCase):
+    """Test that the hot view and admin queries are served from indexes
+    
+    Every SELECT/UPDATE a page runs against a seeded dataset is passed
+    through EXPLAIN QUERY PLAN; a bare SCAN of a large table fails the test.
+    """
+    LARGE_TABLES = ('core_attempt', 'core_usertopicprogress', 'core_aigenerationlog')
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(username='admin', password='testpass')
+        cls.students = User.objects.bulk_create([User(username=f'student{number}') for number in range(60)])
+        cls.groups = [Group.objects.create(name=f'Group {number}', created_by=cls.admin_user) for number in range(3)]
+        for number, group in enumerate(cls.groups):
+            group.members.add(*cls.students[number::3])
+        cls.topics = Topic.objects.bulk_create([
+            Topic(
+                title=f'Topic {number}',
+                prompt='Test prompt',
+                group=cls.groups[number % 3],
+                created_by=cls.admin_user,
+                content_generated=True
+            )
+            for number in range(30)
+        ])
+        
+        attempts = []
+        progress = []
+        for number, student in enumerate(cls.students):
+            for topic in cls.topics[number % 3::3]:
+                progress.append(UserTopicProgress(user=student, topic=topic, total_attempts=2))
+                for attempt_number in (1, 2):
+                    attempts.append(Attempt(
+                        user=student,
+                        topic=topic,
+                        attempt_number=attempt_number,
+                        time_spent=30,
+                        started_at=timezone.now(),
+                        content_version=1,
+                        pixel_hash=f'{number:064x}',
+                        score=attempt_number * 8,
+                        evaluation_completed=True
+                    ))
+        UserTopicProgress.objects.bulk_create(progress)
+        Attempt.objects.bulk_create(attempts)
+        AIGenerationLog.objects.bulk_create([
+            AIGenerationLog(generation_type=('image', 'text', 'evaluation')[number % 3], prompt='Test prompt', success=number % 4 > 0)
+            for number in range(600)
+        ])
+    
+    def full_scans(self, url):
+        """Plan lines of the queries behind a page that scan a large table"""
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertIn(response.status_code, (200, 302))
+        
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith(('SELECT', 'UPDATE')):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    match = re.match(r'SCAN (\w+)$', detail)
+                    if match and match.group(1) in self.LARGE_TABLES:
+                        scans.append(f"{detail} <- {query['sql'][:200]}")
+        return scans
+    
+    def assert_indexed(self, *urls):
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.full_scans(url), [])
+    
+    def test_student_pages(self):
+        """Test the home and topic pages of a student"""
+        student = self.students[0]
+        self.client.force_login(student)
+        self.assert_indexed(
+            reverse('home'),
+            reverse('topic_detail', args=[self.topics[0].id]),
+        )
+    
+    def test_admin_views(self):
+        """Test the dashboard, progress matrix and attempt history"""
+        self.client.force_login(self.admin_user)
+        self.assert_indexed(
+            reverse('admin_dashboard'),
+            reverse('group_detail_admin', args=[self.groups[0].id]),
+            reverse('attempt_history', args=[self.groups[0].id, self.students[0].id, self.topics[0].id]),
+        )
+    
+    def test_admin_changelists(self):
+        """Test the default and filtered admin changelists"""
+        self.client.force_login(self.admin_user)
+        self.assert_indexed(
+            reverse('admin:core_attempt_changelist'),
+            reverse('admin:core_attempt_changelist') + f'?topic__group__id__exact={self.groups[0].id}',
+            reverse('admin:core_usertopicprogress_changelist'),
+            reverse('admin:core_usertopicprogress_changelist') + f'?topic__group__id__exact={self.groups[0].id}',
+            reverse('admin:core_aigenerationlog_changelist'),
+            reverse('admin:core_aigenerationlog_changelist') + '?generation_type__exact=image',
+        )
+    
+    def test_evaluation_reuse_lookups(self):
+        """Test the exact and perceptual reuse lookups on one topic version"""
+        from .phash_index import PerceptualHashIndex
+        from .services import EvaluationReuse
+        from django.test.utils import CaptureQueriesContext
+        
+        attempt = Attempt.objects.filter(topic=self.topics[0]).first()
+        with CaptureQueriesContext(connection) as queries:
+            EvaluationReuse.find_exact_match(attempt)
+            PerceptualHashIndex.load(attempt.topic_id, attempt.content_version)
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                details = [row[-1] for row in cursor.fetchall()]
+                self.assertTrue(any('attempt_topic_version_idx' in detail for detail in details), details)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite connection profile')
+@override_settings(AI_TASKS_EAGER=True, MEDIA_ROOT=TEST_MEDIA_ROOT, EVALUATION_PHASH_MAX_DISTANCE=-1, SQLITE_WRITE_LANE=True)
+class SQLiteWriteLaneTestCase(TransactionTestCase):
+    """Test the SQLite connection profile and the serialized write lane"""
+    
+    def test_connection_profile(self):
+        """Test that new connections get WAL, NORMAL sync and a busy timeout"""
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+    
+    def test_writes_run_on_writer_thread(self):
+        """Test that lane writes run on one thread, and inline inside transactions"""
+        import threading
+        from django.db import transaction
+        from .write_lane import run_serialized
+        
+        def writer_thread(name):
+            User.objects.create_user(username=name)
+            return threading.current_thread().name
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            threads = set(executor.map(lambda number: run_serialized(writer_thread, f'user{number}'), range(8)))
+        connections.close_all()
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads.pop().startswith('db-writer'))
+        self.assertEqual(User.objects.count(), 8)
+        
+        with transaction.atomic():
+            self.assertEqual(run_serialized(writer_thread, 'inline'), threading.current_thread().name)
+    
+    def test_parallel_submissions(self):
+        """Test that serialized submissions keep attempt numbers unique"""
+        from . import metrics
+        
+        admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        student = User.objects.create_user(username='student', password='testpass')
+        group = Group.objects.create(name='Test Group', created_by=admin_user)
+        group.members.add(student)
+        topic = Topic.objects.create(title='Test Topic', prompt='Test prompt', group=group, created_by=admin_user)
+        jobs_before = metrics.value('write_lane.jobs')
+        
+        def submit(number):
+            client = Client()
+            client.force_login(student)
+            try:
+                return client.post(
+                    reverse('submit_drawing', args=[topic.id]),
+                    data=json.dumps({'canvas_data': make_canvas_data(mark=[(number, number)]), 'time_spent': 10}),
+                    content_type='application/json'
+                ).status_code
+            finally:
+                connections.close_all()
+        
+        evaluation = {'score': 5, 'is_correct': False, 'feedback': 'Try again'}
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=evaluation), \
+                mock.patch('core.services.FeedbackGenerator.generate_corrected_content'):
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                statuses = list(executor.map(submit, range(6)))
+        
+        self.assertEqual(statuses, [202] * 6)
+        self.assertEqual(
+            sorted(Attempt.objects.filter(user=student).values_list('attempt_number', flat=True)),
+            list(range(1, 7))
+        )
+        self.assertEqual(UserTopicProgress.objects.get(user=student, topic=topic).total_attempts, 6)
+        # reserve_attempt and record_evaluation per submission
+        self.assertGreaterEqual(metrics.value('write_lane.jobs') - jobs_before, 12)
+
+
+@override_settings(AI_TASKS_EAGER=True, SNAPSHOT_DB_ENABLED=True, SNAPSHOT_MAX_STALENESS=60)
+class SnapshotDatabaseTestCase(TransactionTestCase):
+    """Test the read-only snapshot used by admin views"""
+    databases = {'default', 'snapshot'}
+    
+    def setUp(self):
+        from .snapshot import SnapshotDatabase
+        
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.group = Group.objects.create(name='Snapshot Group', created_by=self.admin_user)
+        SnapshotDatabase.refresh()
+        self.client.force_login(self.admin_user)
+    
+    def test_reads_inside_block_use_snapshot(self):
+        """Test that snapshot reads lag the primary until the next refresh"""
+        from .snapshot import SnapshotDatabase, snapshot_reads
+        
+        Group.objects.create(name='Newer Group', created_by=self.admin_user)
+        with snapshot_reads() as using_snapshot:
+            self.assertTrue(using_snapshot)
+            self.assertEqual(Group.objects.count(), 1)
+            # Writes and their read-backs stay on the primary
+            group = Group.objects.get(name='Snapshot Group')
+            group.description = 'Edited'
+            group.save()
+        self.assertEqual(Group.objects.get(id=group.id).description, 'Edited')
+        self.assertEqual(Group.objects.count(), 2)
+        
+        SnapshotDatabase.refresh()
+        with snapshot_reads():
+            self.assertEqual(Group.objects.count(), 2)
+    
+    def test_admin_views_read_snapshot(self):
+        """Test that the progress matrix queries the snapshot"""
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connections['snapshot']) as snapshot_queries:
+            response = self.client.get(reverse('group_detail_admin', args=[self.group.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('core_group' in query['sql'] for query in snapshot_queries))
+    
+    def test_dashboard_shows_own_writes(self):
+        """Test that the dashboard a create form redirects to reads the primary"""
+        from django.core.cache import cache
+        
+        cache.clear()
+        response = self.client.post(reverse('create_group'), {'name': 'Created Group'}, follow=True)
+        
+        self.assertEqual(response.redirect_chain[-1][0], reverse('admin_dashboard'))
+        self.assertContains(response, 'Created Group')
+        self.assertEqual(response.context['total_groups'], 2)
+    
+    def test_snapshot_totals_not_cached(self):
+        """Test that dashboard totals counted on the snapshot are not cached"""
+        from django.core.cache import cache
+        from .services import DashboardStats
+        from .snapshot import snapshot_reads
+        
+        cache.clear()
+        Group.objects.create(name='Newer Group', created_by=self.admin_user)
+        with snapshot_reads():
+            self.assertEqual(DashboardStats.totals()['groups'], 1)
+        self.assertEqual(DashboardStats.totals()['groups'], 2)
+    
+    @override_settings(SNAPSHOT_MAX_STALENESS=0)
+    def test_stale_snapshot_falls_back_to_primary(self):
+        """Test that a stale snapshot is bypassed and refreshed"""
+        import os
+        from .snapshot import SnapshotDatabase, snapshot_reads
+        
+        path = SnapshotDatabase.path('snapshot')
+        os.utime(path, (time.time() - 10, time.time() - 10))
+        Group.objects.create(name='Newer Group', created_by=self.admin_user)
+        
+        with snapshot_reads() as using_snapshot:
+            self.assertFalse(using_snapshot)
+            self.assertEqual(Group.objects.count(), 2)
+        # The eager background refresh brought the snapshot up to date
+        self.assertLess(SnapshotDatabase.age(), 5)
+
+
+@override_settings(AI_TASKS_EAGER=False, AI_TASK_BACKEND='db', MEDIA_ROOT=TEST_MEDIA_ROOT,
+                   EVALUATION_PHASH_MAX_DISTANCE=-1, AI_JOB_BACKOFF_BASE=0, AI_JOB_POLL_INTERVAL=0.05)
+class AIJobQueueTestCase(TransactionTestCase):
+    """Test the database-backed AI job queue and the run_ai_workers command"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+        self.student_user = User.objects.create_user(username='student', password='testpass')
+        self.group = Group.objects.create(name='Test Group', created_by=self.admin_user)
+        self.group.members.add(self.student_user)
+        self.topic = Topic.objects.create(
+            title='Test Topic',
+            prompt='Test prompt',
+            group=self.group,
+            created_by=self.admin_user,
+            content_generated=True
+        )
+        self.client.force_login(self.student_user)
+    
+    def submit(self):
+        return self.client.post(
+            reverse('submit_drawing', args=[self.topic.id]),
+            data=json.dumps({'canvas_data': make_canvas_data(), 'time_spent': 30}),
+            content_type='application/json'
+        )
+    
+    def run_workers(self, concurrency=2):
+        from django.core.management import call_command
+        
+        call_command('run_ai_workers', burst=True, concurrency=concurrency, stdout=io.StringIO())
+    
+    def test_submission_runs_through_queue(self):
+        """Test that evaluation and corrections are queued and run by the workers"""
+        evaluation = {'score': 5, 'is_correct': False, 'feedback': 'Try again'}
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=evaluation) as evaluate, \
+                mock.patch('core.services.FeedbackGenerator.generate_corrected_content', return_value=True) as correct:
+            response = self.submit()
+            self.assertEqual(response.status_code, 202)
+            evaluate.assert_not_called()
+            job = AIJob.objects.get()
+            self.assertEqual((job.job_type, job.status), (AIJob.TYPE_EVALUATION, AIJob.STATUS_QUEUED))
+            self.assertEqual(str(job.attempt_id), response.json()['attempt_id'])
+            
+            self.run_workers()
+        
+        evaluate.assert_called_once()
+        correct.assert_called_once()
+        self.assertEqual(correct.call_args.args[1]['feedback'], 'Try again')
+        self.assertEqual(
+            sorted(AIJob.objects.values_list('job_type', 'status', 'attempts')),
+            [(AIJob.TYPE_CORRECTION, AIJob.STATUS_SUCCEEDED, 1), (AIJob.TYPE_EVALUATION, AIJob.STATUS_SUCCEEDED, 1)]
+        )
+        self.assertTrue(Attempt.objects.get().evaluation_completed)
+    
+    def test_jobs_roll_back_with_their_writes(self):
+        """Test that evaluation and correction jobs are written in the caller's transaction"""
+        from django.db import transaction
+        from .canvas import StoredCanvas
+        from .services import SubmissionService
+    
+        canvas = StoredCanvas('canvases/00/test.png', '0' * 64, 10, 10)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            SubmissionService.reserve_attempt(self.student_user, self.topic, canvas, 30)
+            self.assertEqual(AIJob.objects.get().job_type, AIJob.TYPE_EVALUATION)
+            raise RuntimeError('rolled back')
+        self.assertFalse(Attempt.objects.exists())
+        self.assertFalse(AIJob.objects.exists())
+    
+        attempt = SubmissionService.reserve_attempt(self.student_user, self.topic, canvas, 30)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            SubmissionService.record_evaluation(attempt, {'score': 5, 'is_correct': False, 'feedback': 'Try again'})
+            self.assertTrue(AIJob.objects.filter(job_type=AIJob.TYPE_CORRECTION).exists())
+            raise RuntimeError('rolled back')
+        self.assertFalse(AIJob.objects.filter(job_type=AIJob.TYPE_CORRECTION).exists())
+    
+    def test_rerun_evaluation_schedules_missing_correction(self):
+        """Test that a rerun evaluation job schedules a correction the attempt never got"""
+        from .tasks import evaluate_attempt_task
+    
+        attempt_id = self.submit().json()['attempt_id']
+        Attempt.objects.filter(id=attempt_id).update(evaluation_completed=True, is_correct=False, score=5)
+    
+        with mock.patch('core.services.AIService.evaluate_drawing') as evaluate:
+            self.assertTrue(evaluate_attempt_task(attempt_id))
+            self.assertTrue(evaluate_attempt_task(attempt_id))
+    
+        evaluate.assert_not_called()
+        correction = AIJob.objects.get(job_type=AIJob.TYPE_CORRECTION)
+        self.assertEqual(str(correction.attempt_id), attempt_id)
+        self.assertEqual(correction.payload['evaluation_result']['score'], 5)
+    
+    def test_topic_creation_queues_generation(self):
+        """Test that creating a topic queues its content generation"""
+        self.client.force_login(self.admin_user)
+        response = self.client.post(reverse('create_topic'), {
+            'title': 'New Topic',
+            'description': 'New test topic',
+            'prompt': 'New test prompt',
+            'group': self.group.id
+        })
+        self.assertEqual(response.status_code, 302)
+        
+        topic = Topic.objects.get(title='New Topic')
+        job = AIJob.objects.get()
+        self.assertEqual((job.job_type, job.topic_id), (AIJob.TYPE_TOPIC_GENERATION, topic.id))
+        
+        with mock.patch('core.services.TopicContentGenerator.generate_topic_content', return_value=True) as generate:
+            self.run_workers()
+        self.assertEqual(generate.call_args.args[0].id, topic.id)
+        self.assertEqual(AIJob.objects.get().status, AIJob.STATUS_SUCCEEDED)
+    
+    @override_settings(AI_JOB_MAX_ATTEMPTS=3)
+    def test_failed_job_retried(self):
+        """Test that a failed evaluation is retried and the attempt recovers"""
+        evaluation = {'score': 18, 'is_correct': True, 'feedback': 'Great'}
+        with mock.patch('core.services.AIService.evaluate_drawing', side_effect=[Exception('boom'), evaluation]):
+            attempt_id = self.submit().json()['attempt_id']
+            self.run_workers(concurrency=1)
+        
+        job = AIJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (AIJob.STATUS_SUCCEEDED, 2, 'Exception: boom'))
+        attempt = Attempt.objects.get(id=attempt_id)
+        self.assertEqual(attempt.evaluation_status, Attempt.STATUS_COMPLETED)
+        self.assertEqual(attempt.evaluation_error, '')
+    
+    @override_settings(AI_JOB_MAX_ATTEMPTS=2)
+    def test_job_fails_after_max_attempts(self):
+        """Test that a job is given up after its last attempt"""
+        with mock.patch('core.services.AIService.evaluate_drawing', side_effect=Exception('boom')) as evaluate:
+            attempt_id = self.submit().json()['attempt_id']
+            self.run_workers()
+        
+        self.assertEqual(evaluate.call_count, 2)
+        self.assertEqual(AIJob.objects.get().status, AIJob.STATUS_FAILED)
+        self.assertEqual(Attempt.objects.get(id=attempt_id).evaluation_status, Attempt.STATUS_FAILED)
+    
+    @override_settings(AI_JOB_MAX_ATTEMPTS=2)
+    def test_error_recorded_once_retries_exhausted(self):
+        """Test that a failing evaluation stays pending until its job gives up"""
+        errors_seen = []
+        
+        def evaluate(*args, **kwargs):
+            errors_seen.append(Attempt.objects.get().evaluation_error)
+            raise Exception('boom')
+        
+        with mock.patch('core.services.AIService.evaluate_drawing', side_effect=evaluate):
+            attempt_id = self.submit().json()['attempt_id']
+            self.run_workers(concurrency=1)
+        
+        self.assertEqual(errors_seen, ['', ''])
+        attempt = Attempt.objects.get(id=attempt_id)
+        self.assertEqual(attempt.evaluation_error, 'Exception: boom')
+        self.assertEqual(attempt.evaluation_status, Attempt.STATUS_FAILED)
+    
+    @override_settings(AI_JOB_MAX_ATTEMPTS=3)
+    def test_correction_retry_clears_error(self):
+        """Test that a correction that succeeds on retry leaves no error behind"""
+        evaluation = {'score': 5, 'is_correct': False, 'feedback': 'Try again'}
+        with mock.patch('core.services.AIService.evaluate_drawing', return_value=evaluation), \
+                mock.patch('core.services.AIService.generate_image', return_value=b'corrected'), \
+                mock.patch('core.services.AIService.generate_text', side_effect=[Exception('text down'), 'Fixed']):
+            attempt_id = self.submit().json()['attempt_id']
+            self.run_workers(concurrency=1)
+        
+        correction = AIJob.objects.get(job_type=AIJob.TYPE_CORRECTION)
+        self.assertEqual((correction.status, correction.attempts), (AIJob.STATUS_SUCCEEDED, 2))
+        attempt = Attempt.objects.get(id=attempt_id)
+        self.assertEqual(attempt.evaluation_error, '')
+        self.assertEqual(attempt.updated_instructional_text, 'Fixed')
+    
+    @override_settings(AI_JOB_BACKOFF_BASE=10)
+    def test_retry_backs_off(self):
+        """Test that a retried job is not due again until its backoff has passed"""
+        from .job_queue import AIJobQueue
+        
+        AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        job = AIJobQueue.claim('worker-1')
+        AIJobQueue.fail(job, 'boom')
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, AIJob.STATUS_QUEUED)
+        self.assertGreaterEqual((job.run_after - timezone.now()).total_seconds(), 4)
+        self.assertIsNone(AIJobQueue.claim('worker-1'))
+    
+    @override_settings(AI_PROVIDER_CONCURRENCY={'image': 100, 'text': 100})
+    def test_claims_are_exclusive(self):
+        """Test that concurrent workers never claim the same job"""
+        from .job_queue import AIJobQueue
+        
+        for _ in range(20):
+            AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        
+        def claim_all(owner):
+            try:
+                claimed = []
+                while (job := AIJobQueue.claim(owner)) is not None:
+                    claimed.append(job.id)
+                return claimed
+            finally:
+                connections.close_all()
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(claim_all, [f'worker-{number}' for number in range(4)]))
+        claimed = [job_id for result in results for job_id in result]
+        self.assertEqual(sorted(claimed), sorted(AIJob.objects.values_list('id', flat=True)))
+        self.assertEqual(AIJob.objects.filter(status=AIJob.STATUS_RUNNING, attempts=1).count(), 20)
+    
+    def test_expired_lease_requeued(self):
+        """Test that jobs of a crashed worker go back in the queue"""
+        from .job_queue import AIJobQueue
+        from django.db.models import F
+        
+        AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        spent = AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        AIJob.objects.filter(id=spent.id).update(attempts=F('max_attempts') - 1)
+        AIJobQueue.claim('crashed')
+        AIJobQueue.claim('crashed')
+        self.assertEqual(AIJobQueue.requeue_expired(), 0)
+        
+        AIJob.objects.update(lease_expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertEqual(AIJobQueue.requeue_expired(), 2)
+        self.assertEqual(AIJob.objects.get(id=spent.id).status, AIJob.STATUS_FAILED)
+        
+        job = AIJobQueue.claim('worker-1')
+        self.assertNotEqual(job.id, spent.id)
+        self.assertEqual((job.attempts, job.last_error), (2, 'Lease expired'))
+        # The crashed worker can no longer record an outcome
+        self.assertFalse(AIJobQueue.complete(AIJob(id=job.id, lease_owner='crashed')))
+        self.assertTrue(AIJobQueue.complete(job))
+
+
+@override_settings(AI_PROVIDER_CONCURRENCY={'image': 100, 'text': 100})
+class AIJobSchedulingTestCase(TestCase):
+    """Test priority classes, fair share and provider caps of the AI job queue"""
+    
+    def setUp(self):
+        from .job_queue import AIJobQueue, FairShareScheduler
+        
+        # Fresh deficit rotation for every test
+        patcher = mock.patch.object(AIJobQueue, 'scheduler', FairShareScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.teacher = User.objects.create_user(username='teacher', password='testpass', is_staff=True)
+        self.group = Group.objects.create(name='Test Group', created_by=self.teacher)
+        self.topic = Topic.objects.create(title='Test Topic', prompt='Test prompt', group=self.group, created_by=self.teacher)
+        self.students = [User.objects.create_user(username=name, password='testpass') for name in ('alice', 'bob')]
+    
+    def evaluation(self, student, count=1):
+        from .job_queue import AIJobQueue
+        
+        for _ in range(count):
+            attempt = Attempt.objects.create(
+                user=student,
+                topic=self.topic,
+                attempt_number=Attempt.objects.filter(user=student).count() + 1,
+                time_spent=30,
+                started_at=timezone.now()
+            )
+            AIJobQueue.enqueue(AIJob.TYPE_EVALUATION, attempt=attempt)
+    
+    def claim_users(self, count):
+        from .job_queue import AIJobQueue
+        
+        claimed = []
+        for _ in range(count):
+            job = AIJobQueue.claim('worker-1')
+            claimed.append(job.user.username if job else None)
+        return claimed
+    
+    def test_interactive_before_batch(self):
+        """Test that a student's evaluation overtakes queued topic generation"""
+        from .job_queue import AIJobQueue
+        
+        for _ in range(3):
+            AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        self.evaluation(self.students[0])
+        
+        job = AIJobQueue.claim('worker-1')
+        self.assertEqual((job.job_type, job.priority, job.user), (AIJob.TYPE_EVALUATION, AIJob.PRIORITY_INTERACTIVE, self.students[0]))
+        self.assertEqual(AIJobQueue.claim('worker-1').job_type, AIJob.TYPE_TOPIC_GENERATION)
+    
+    def test_users_take_turns(self):
+        """Test that one user's backlog does not hold up another user"""
+        self.evaluation(self.students[0], count=6)
+        self.evaluation(self.students[1], count=2)
+        
+        claimed = self.claim_users(9)
+        self.assertEqual(claimed[:4], ['alice', 'bob', 'alice', 'bob'])
+        self.assertEqual(claimed[4:], ['alice'] * 4 + [None])
+    
+    @override_settings(AI_JOB_USER_WEIGHTS={'alice': 2})
+    def test_weighted_share(self):
+        """Test that a user with twice the weight gets twice the jobs"""
+        self.evaluation(self.students[0], count=6)
+        self.evaluation(self.students[1], count=6)
+        
+        claimed = self.claim_users(9)
+        self.assertEqual(claimed.count('alice'), 6)
+        self.assertEqual(claimed.count('bob'), 3)
+    
+    @override_settings(AI_PROVIDER_CONCURRENCY={'image': 1, 'text': 2})
+    def test_provider_cap(self):
+        """Test that jobs wait while a provider they call is at its cap"""
+        from .job_queue import AIJobQueue
+        
+        self.evaluation(self.students[0], count=3)
+        AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        
+        first = AIJobQueue.claim('worker-1')
+        second = AIJobQueue.claim('worker-2')
+        self.assertEqual([first.job_type, second.job_type], [AIJob.TYPE_EVALUATION] * 2)
+        # Text is full: neither the third evaluation nor topic generation may start
+        self.assertIsNone(AIJobQueue.claim('worker-3'))
+        
+        AIJobQueue.complete(first)
+        self.assertEqual(AIJobQueue.claim('worker-3').job_type, AIJob.TYPE_EVALUATION)
+    
+    def test_stats(self):
+        """Test queue depth and wait percentiles per class"""
+        from .job_queue import AIJobQueue
+        
+        self.evaluation(self.students[0], count=3)
+        AIJobQueue.enqueue(AIJob.TYPE_TOPIC_GENERATION, topic=self.topic)
+        AIJob.objects.update(run_after=timezone.now() - timezone.timedelta(seconds=2))
+        AIJobQueue.claim('worker-1')
+        
+        stats = AIJobQueue.stats()
+        self.assertEqual((stats['interactive']['queued'], stats['interactive']['running']), (2, 1))
+        self.assertEqual(stats['interactive']['wait_ms']['samples'], 1)
+        self.assertGreaterEqual(stats['interactive']['wait_ms']['p95'], 2000)
+        self.assertEqual(stats['batch']['queued'], 1)
+        self.assertGreaterEqual(stats['batch']['oldest_due_age_s'], 2)
+        self.assertEqual(stats['correction'], {
+            'queued': 0, 'running': 0, 'oldest_due_age_s': None,
+            'wait_ms': {'samples': 0, 'p50': None, 'p95': None, 'p99': None},
+        })
+        
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get(reverse('job_stats')).json()['interactive']['running'], 1)
+
+
+class SingleFlightTestCase(TransactionTestCase):
+    """Test coalescing of identical in-flight AI requests"""
+    
+    CALLERS = 4
+    PROVIDER_DELAY = 0.3
+    
+    def setUp(self):
+        from . import metrics
+        
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            AI_CACHE_ENABLED=True,
+            AI_SINGLE_FLIGHT_LOCK_DIR=os.path.join(self.media_root, 'locks')
+        )
+        self.settings_override.enable()
+        ProviderClient.reset()
+        metrics.reset()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        ProviderClient.reset()
+    
+    def slow_response(self, status_code=200, content='Generated'):
+        def send(*args, **kwargs):
+            time.sleep(self.PROVIDER_DELAY)
+            return make_response(status_code, {'choices': [{'message': {'content': content}}]})
+        return send
+    
+    def generate_text(self, prompt):
+        from .services import AIService
+        
+        try:
+            return AIService.generate_text(prompt)
+        except Exception as e:
+            return e
+        finally:
+            connections.close_all()
+    
+    def test_concurrent_identical_requests_sent_once(self):
+        """Test that concurrent callers share one provider request"""
+        from . import metrics
+        
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=self.slow_response()) as send:
+            with ThreadPoolExecutor(max_workers=self.CALLERS) as executor:
+                results = list(executor.map(self.generate_text, ['Same prompt'] * self.CALLERS))
+        
+        self.assertEqual(results, ['Generated'] * self.CALLERS)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(metrics.value('single_flight.text.leader'), 1)
+        self.assertEqual(metrics.value('single_flight.text.coalesced'), self.CALLERS - 1)
+        self.assertEqual(AIGenerationLog.objects.filter(cache_hit=False).count(), 1)
+    
+    def test_different_prompts_not_coalesced(self):
+        """Test that only identical requests are coalesced"""
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=self.slow_response()) as send:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = list(executor.map(self.generate_text, ['First prompt', 'Second prompt']))
+        self.assertEqual(results, ['Generated', 'Generated'])
+        self.assertEqual(send.call_count, 2)
+    
+    def test_failure_shared_then_forgotten(self):
+        """Test that waiting callers get the leader's error and a later call retries"""
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=self.slow_response(status_code=400)) as send:
+            with ThreadPoolExecutor(max_workers=self.CALLERS) as executor:
+                results = list(executor.map(self.generate_text, ['Same prompt'] * self.CALLERS))
+            self.assertEqual(send.call_count, 1)
+            self.assertTrue(all(isinstance(result, Exception) and '400' in str(result) for result in results))
+            
+            self.assertIsInstance(self.generate_text('Same prompt'), Exception)
+            self.assertEqual(send.call_count, 2)
+    
+    def test_other_process_result_read_from_cache(self):
+        """Test that a caller waiting on another process's lock uses its cached response"""
+        import fcntl
+        from . import metrics
+        from .ai_cache import AIResponseCache
+        from .single_flight import lock_path
+        
+        client = ProviderClient.for_provider('text')
+        with mock.patch.object(client.session, 'request', side_effect=self.slow_response()):
+            self.generate_text('Same prompt')
+        key = CachedAIResponse.objects.get().key
+        CachedAIResponse.objects.all().delete()
+        
+        # Stand in for another process holding the lock while it calls the provider
+        with open(lock_path(key), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            with mock.patch.object(client.session, 'request', side_effect=self.slow_response()) as send:
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    future = executor.submit(self.generate_text, 'Same prompt')
+                    time.sleep(0.2)
+                    AIResponseCache.set(key, 'text', 'From the other process')
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+                    result = future.result()
+        
+        self.assertEqual(result, 'From the other process')
+        send.assert_not_called()
+        self.assertEqual(metrics.value('single_flight.text.cross_process'), 1)
+    
+    @override_settings(AI_SINGLE_FLIGHT_LOCK_STRIPES=4)
+    def test_lock_files_bounded(self):
+        """Test that any number of request keys share a fixed set of lock files"""
+        from .single_flight import process_lock
+        
+        for number in range(50):
+            with process_lock(f'{number:064x}') as waited:
+                self.assertFalse(waited)
+        self.assertLessEqual(len(os.listdir(os.path.join(self.media_root, 'locks'))), 4)
@@ -8,11 +8,19 @@ urlpatterns = [
     
     # API endpoints
     path('api/topic/<int:topic_id>/submit/', views.submit_drawing, name='submit_drawing'),
+    path('api/attempt/<uuid:attempt_id>/status/', views.attempt_status, name='attempt_status'),
+    path('api/stats/group/<int:group_id>/', views.group_stats, name='group_stats'),
+    path('api/stats/topic/<int:topic_id>/', views.topic_stats, name='topic_stats'),
+    path('api/stats/cache/', views.cache_stats, name='cache_stats'),
+    path('api/stats/jobs/', views.job_stats, name='job_stats'),
+    path('api/stats/providers/', views.provider_stats, name='provider_stats'),
     
     # Admin pages
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('dashboard/group/<int:group_id>/', views.group_detail_admin, name='group_detail_admin'),
+    path('dashboard/group/<int:group_id>/attempts/<int:user_id>/<int:topic_id>/', views.attempt_history, name='attempt_history'),
     path('dashboard/create-user/', views.create_user, name='create_user'),
     path('dashboard/create-group/', views.create_group, name='create_group'),
     path('dashboard/create-topic/', views.create_topic, name='create_topic'),
+    path('dashboard/providers/', views.provider_status, name='provider_status'),
 ]
\ No newline at end of file
@@ -3,19 +3,36 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.http import JsonResponse
+from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Count, Max, Q
 from django.core.paginator import Paginator
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from django.urls import reverse
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 import json
 import base64
-from .models import Group, Topic, UserTopicProgress, Attempt
-from .services import TopicContentGenerator, AIService, FeedbackGenerator
+import binascii
+from .models import Group, Topic, UserTopicProgress, Attempt, ProgressAggregate
+from .serializers import ProgressAggregateSerializer
+from .canvas import InvalidCanvas, decode_canvas_data, prepare_canvas, store_canvas
+from . import metrics
+from .access import TopicAccess
+from .hedging import Hedger
+from .http_client import ProviderClient
+from .job_queue import AIJobQueue
+from .page_cache import PageCache
+from .parsers import CanvasMultiPartParser, PNGUploadParser
+from .snapshot import use_snapshot
+from .services import DashboardStats, SubmissionService, EvaluationReuse
+from .tasks import enqueue_topic_generation
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,56 +45,105 @@ def is_admin(user):
 
 @login_required
 def home(request):
-    """Home page showing user's groups and topics"""
-    user_groups = request.user.ta_groups.all()
-    
-    # Get topics for each group with progress
-    groups_data = []
-    for group in user_groups:
-        topics = group.topics.filter(content_generated=True)
-        topics_with_progress = []
-        
-        for topic in topics:
-            progress, created = UserTopicProgress.objects.get_or_create(
-                user=request.user,
-                topic=topic
-            )
-            topics_with_progress.append({
-                'topic': topic,
-                'progress': progress
-            })
-        
-        groups_data.append({
-            'group': group,
-            'topics': topics_with_progress
+    """Home page showing user's groups and topics
+    
+    The rendered groups fragment is cached per user (see PageCache) and
+    rebuilt after the student submits or a teacher changes groups or topics.
+    """
+    cache_key = PageCache.key('home', request.user.id)
+    groups_html = PageCache.get('home', cache_key)
+    if groups_html is None:
+        groups_html = render_to_string('core/home_groups.html', {
+            'groups_data': _home_groups_data(request.user)
         })
+        PageCache.set(cache_key, groups_html)
     
     return render(request, 'core/home.html', {
-        'groups_data': groups_data
+        'groups_html': groups_html
     })
 
 
+def _home_groups_data(user):
+    """Groups with their topics and the user's progress
+    
+    Built from one query each for groups, topics and progress, however many
+    topics the user can see. Missing progress rows are created in bulk.
+    """
+    user_groups = list(user.ta_groups.all())
+    topics = list(Topic.objects.filter(group__in=user_groups, content_generated=True))
+    
+    progress_by_topic = {
+        progress.topic_id: progress
+        for progress in UserTopicProgress.objects.filter(
+            user=user, topic__in=[topic.id for topic in topics]
+        ).order_by()
+    }
+    missing = [
+        UserTopicProgress(user=user, topic=topic)
+        for topic in topics if topic.id not in progress_by_topic
+    ]
+    if missing:
+        # A concurrent visit may create some of these first; the in-memory
+        # defaults are what would have been stored either way
+        UserTopicProgress.objects.bulk_create(missing, ignore_conflicts=True)
+        progress_by_topic.update((progress.topic_id, progress) for progress in missing)
+    
+    # Group topics with progress under their groups
+    topics_by_group = {}
+    for topic in topics:
+        topics_by_group.setdefault(topic.group_id, []).append({
+            'topic': topic,
+            'progress': progress_by_topic[topic.id]
+        })
+    
+    return [
+        {
+            'group': group,
+            'topics': topics_by_group.get(group.id, [])
+        }
+        for group in user_groups
+    ]
+
+
 @login_required
 def topic_detail(request, topic_id):
-    """Topic page with interactive canvas"""
-    topic = get_object_or_404(Topic, id=topic_id)
+    """Topic page with interactive canvas
+    
+    Everything but the access check is served from the per-user page cache.
+    """
+    cache_key = PageCache.key('topic', request.user.id, topic_id)
+    context = PageCache.get('topic', cache_key)
+    if context:
+        topic, has_access = context['topic'], TopicAccess.can_access(request.user, context['topic'])
+    else:
+        topic, has_access = TopicAccess.get_topic(request.user, topic_id)
     
     # Check if user has access to this topic
-    if not request.user.ta_groups.filter(id=topic.group.id).exists():
+    if not has_access:
         messages.error(request, "You don't have access to this topic.")
         return redirect('home')
     
-    # Get or create progress
-    progress, created = UserTopicProgress.objects.get_or_create(
-        user=request.user,
-        topic=topic
-    )
+    if context is None:
+        context = _topic_page_context(request.user, topic)
+        PageCache.set(cache_key, context)
+    
+    return render(request, 'core/topic_detail.html', context)
+
+
+def _topic_page_context(user, topic):
+    """Progress, latest attempt and the content to show on a topic page"""
+    # Get or create progress; bulk_create sends no post_save, so a first
+    # visit does not invalidate the entry it is about to cache
+    progress = UserTopicProgress.objects.filter(user=user, topic=topic).first()
+    if progress is None:
+        progress = UserTopicProgress(user=user, topic=topic)
+        UserTopicProgress.objects.bulk_create([progress], ignore_conflicts=True)
     
     # Get latest attempt for this user/topic
     latest_attempt = Attempt.objects.filter(
-        user=request.user,
+        user=user,
         topic=topic
-    ).order_by('-attempt_number').first()
+    ).defer('canvas_data').order_by('-attempt_number').first()
     
     # Determine what content to show
     background_image_url = topic.background_image.url if topic.background_image else None
@@ -90,115 +156,90 @@ def topic_detail(request, topic_id):
         if latest_attempt.updated_instructional_text:
             instructional_text = latest_attempt.updated_instructional_text
     
-    return render(request, 'core/topic_detail.html', {
+    return {
         'topic': topic,
         'progress': progress,
         'latest_attempt': latest_attempt,
         'background_image_url': background_image_url,
         'instructional_text': instructional_text,
-    })
+    }
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@parser_classes([JSONParser, CanvasMultiPartParser, PNGUploadParser])
 def submit_drawing(request, topic_id):
-    """API endpoint for submitting canvas drawings"""
+    """API endpoint for submitting canvas drawings
+    
+    Accepts a multipart upload with a ``canvas`` file, a raw image/png body
+    (time_spent in the query string) or the legacy JSON body with a
+    ``canvas_data`` data URL. Binary uploads are streamed to a temp file.
+    
+    The attempt is stored and 202 Accepted is returned straight away;
+    evaluation runs in the background and is tracked via attempt_status.
+    Resubmitting an identical (or near-identical) canvas is answered at once
+    with the earlier evaluation.
+    """
     try:
-        topic = get_object_or_404(Topic, id=topic_id)
+        topic, has_access = TopicAccess.get_topic(request.user, topic_id)
         
         # Check access
-        if not request.user.ta_groups.filter(id=topic.group.id).exists():
+        if not has_access:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        data = request.data
-        canvas_data = data.get('canvas_data')
-        time_spent = data.get('time_spent', 0)
+        try:
+            canvas = request.FILES.get('canvas')
+            data = request.data
+        except APIException as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         
-        if not canvas_data:
-            return Response({'error': 'Canvas data required'}, status=status.HTTP_400_BAD_REQUEST)
+        time_spent = data.get('time_spent', request.query_params.get('time_spent', 0))
+        try:
+            time_spent = int(time_spent)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid time spent'}, status=status.HTTP_400_BAD_REQUEST)
         
-        with transaction.atomic():
-            # Get or create progress
-            progress, created = UserTopicProgress.objects.get_or_create(
-                user=request.user,
-                topic=topic
-            )
-            
-            if created or not progress.first_attempt_at:
-                progress.first_attempt_at = timezone.now()
-            
-            # Create new attempt
-            attempt_number = progress.total_attempts + 1
-            attempt = Attempt.objects.create(
-                user=request.user,
-                topic=topic,
-                attempt_number=attempt_number,
-                canvas_data=canvas_data,
-                time_spent=time_spent,
-                started_at=timezone.now() - timezone.timedelta(seconds=time_spent)
-            )
+        if canvas is None:
+            canvas_data = data.get('canvas_data')
+            if not canvas_data:
+                return Response({'error': 'Canvas data required'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Update progress
-            progress.total_attempts += 1
-            progress.total_time_spent += time_spent
-            progress.save()
-            
-            # Evaluate drawing asynchronously (in a real app, use Celery)
             try:
-                evaluation_result = AIService.evaluate_drawing(
-                    canvas_data=canvas_data,
-                    topic_prompt=topic.prompt,
-                    instructional_text=topic.instructional_text,
-                    background_description=f"Background image for topic: {topic.title}",
-                    attempt=attempt
-                )
-                
-                # Update attempt with evaluation
-                attempt.score = evaluation_result.get('score', 0)
-                attempt.is_correct = evaluation_result.get('is_correct', False)
-                attempt.feedback = evaluation_result.get('feedback', '')
-                attempt.evaluation_completed = True
-                
-                if attempt.is_correct:
-                    # Mark topic as completed
-                    progress.completed = True
-                    progress.final_score = attempt.score
-                    progress.completed_at = timezone.now()
-                    progress.save()
-                    
-                    response_data = {
-                        'success': True,
-                        'is_correct': True,
-                        'message': 'Everything is correct!',
-                        'score': attempt.score,
-                        'completed': True
-                    }
-                else:
-                    # Generate corrected content
-                    FeedbackGenerator.generate_corrected_content(attempt, evaluation_result)
-                    
-                    response_data = {
-                        'success': True,
-                        'is_correct': False,
-                        'feedback': attempt.feedback,
-                        'score': attempt.score,
-                        'updated_background': attempt.updated_background_image.url if attempt.updated_background_image else None,
-                        'updated_instructions': attempt.updated_instructional_text,
-                        'completed': False
-                    }
-                
-                attempt.save()
-                return Response(response_data)
-                
-            except Exception as e:
-                attempt.evaluation_error = str(e)
-                attempt.save()
-                logger.error(f"Evaluation failed for attempt {attempt.id}: {str(e)}")
-                
-                return Response({
-                    'success': False,
-                    'error': 'Evaluation failed. Please try again.'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                canvas = decode_canvas_data(canvas_data)
+            except (binascii.Error, ValueError):
+                return Response({'error': 'Invalid canvas data'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # File and image work happens before the reservation transaction
+        try:
+            pixel_hash, perceptual_hash, perceptual_detail, normalized = prepare_canvas(canvas)
+        except InvalidCanvas:
+            return Response({'error': 'Invalid canvas data'}, status=status.HTTP_400_BAD_REQUEST)
+        stored_canvas = store_canvas(
+            normalized.content,
+            extension=normalized.extension,
+            original_size=normalized.original_size
+        )
+        attempt = SubmissionService.reserve_attempt(
+            request.user, topic, stored_canvas, time_spent,
+            pixel_hash=pixel_hash,
+            perceptual_hash=perceptual_hash,
+            perceptual_detail=perceptual_detail
+        )
+        
+        # The evaluation job was scheduled with the attempt; identical or
+        # near-identical canvases on the same topic version are answered
+        # now with the stored result
+        if EvaluationReuse.try_reuse(attempt):
+            result = _attempt_result(attempt)
+            result['status_url'] = reverse('attempt_status', args=[attempt.id])
+            return Response(result)
+        
+        return Response({
+            'success': True,
+            'attempt_id': str(attempt.id),
+            'status': attempt.evaluation_status,
+            'status_url': reverse('attempt_status', args=[attempt.id]),
+        }, status=status.HTTP_202_ACCEPTED)
     
     except Exception as e:
         logger.error(f"Submit drawing error: {str(e)}")
@@ -208,62 +249,272 @@ def submit_drawing(request, topic_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _attempt_result(attempt):
+    """Serialize an attempt's evaluation state for the canvas page"""
+    attempt_status = attempt.evaluation_status
+    result = {
+        'success': attempt_status != Attempt.STATUS_FAILED,
+        'attempt_id': str(attempt.id),
+        'status': attempt_status,
+    }
+    
+    if attempt_status == Attempt.STATUS_FAILED:
+        result['error'] = 'Evaluation failed. Please try again.'
+    elif attempt_status != Attempt.STATUS_PENDING:
+        result.update({
+            'is_correct': attempt.is_correct,
+            'score': attempt.score,
+            'completed': attempt.is_correct,
+        })
+        if attempt.is_correct:
+            result['message'] = 'Everything is correct!'
+        else:
+            result.update({
+                'feedback': attempt.feedback,
+                'updated_background': attempt.updated_background_image.url if attempt.updated_background_image else None,
+                'updated_instructions': attempt.updated_instructional_text,
+            })
+    
+    return result
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def attempt_status(request, attempt_id):
+    """API endpoint polled by the canvas page while an attempt is evaluated"""
+    attempt = get_object_or_404(
+        Attempt.objects.only(
+            'id', 'user_id', 'score', 'is_correct', 'feedback',
+            'updated_background_image', 'updated_instructional_text',
+            'evaluation_completed', 'evaluation_error'
+        ),
+        id=attempt_id,
+        user=request.user
+    )
+    return Response(_attempt_result(attempt))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@use_snapshot
+def group_stats(request, group_id):
+    """API endpoint with the progress aggregates of a group and its topics"""
+    group = get_object_or_404(Group.objects.only('id'), id=group_id)
+    aggregates = list(ProgressAggregate.objects.filter(group=group).order_by('topic_id'))
+    group_aggregate = next(
+        (aggregate for aggregate in aggregates if aggregate.topic_id is None),
+        ProgressAggregate(group=group)
+    )
+    return Response({
+        'group': ProgressAggregateSerializer(group_aggregate).data,
+        'topics': ProgressAggregateSerializer(
+            [aggregate for aggregate in aggregates if aggregate.topic_id is not None], many=True
+        ).data,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@use_snapshot
+def topic_stats(request, topic_id):
+    """API endpoint with the progress aggregate of one topic"""
+    topic = get_object_or_404(Topic.objects.only('id', 'group_id'), id=topic_id)
+    aggregate = ProgressAggregate.objects.filter(topic=topic).first()
+    if aggregate is None:
+        aggregate = ProgressAggregate(group_id=topic.group_id, topic=topic)
+    return Response(ProgressAggregateSerializer(aggregate).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """API endpoint with this process's page cache and AI request coalescing counters"""
+    counters = metrics.snapshot()
+    return Response({
+        'counters': {name: count for name, count in counters.items() if name.startswith('page_cache.')},
+        'hit_rates': {page: metrics.hit_rate(f'page_cache.{page}') for page in ('home', 'topic')},
+        'single_flight': {name: count for name, count in counters.items() if name.startswith('single_flight.')},
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def job_stats(request):
+    """API endpoint with AI job queue depth and wait times per scheduling class"""
+    return Response(AIJobQueue.stats())
+
+
+PROVIDER_METRIC_PREFIXES = ('circuit.', 'rate_limit.', 'hedge.')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def provider_stats(request):
+    """API endpoint with this process's AI provider circuit, rate limit and hedging state"""
+    return Response({
+        'providers': ProviderClient.status(),
+        'evaluation_hedging': Hedger.for_operation('evaluation').status(),
+        'counters': {name: count for name, count in metrics.snapshot().items() if name.startswith(PROVIDER_METRIC_PREFIXES)},
+    })
+
+
+@user_passes_test(is_admin)
+def provider_status(request):
+    """Admin page showing the AI provider circuits and rate limits"""
+    counters = metrics.snapshot()
+    providers = []
+    for name, status in ProviderClient.status().items():
+        status['name'] = name
+        status['opened'] = counters.get(f'circuit.{name}.opened', 0)
+        status['rejected'] = counters.get(f'circuit.{name}.rejected', 0)
+        status['rate_limited'] = counters.get(f'rate_limit.{name}.delayed', 0)
+        status['rate_limit_rejected'] = counters.get(f'rate_limit.{name}.rejected', 0)
+        providers.append(status)
+    hedging = Hedger.for_operation('evaluation').status()
+    hedging['sent'] = counters.get('hedge.evaluation.sent', 0)
+    hedging['won'] = counters.get('hedge.evaluation.won', 0)
+    hedging['over_budget'] = counters.get('hedge.evaluation.over_budget', 0)
+    return render(request, 'core/provider_status.html', {'providers': providers, 'hedging': hedging})
+
+
 @user_passes_test(is_admin)
 def admin_dashboard(request):
-    """Admin dashboard for monitoring groups and progress"""
-    groups = Group.objects.all().prefetch_related('members', 'topics')
+    """Admin dashboard for monitoring groups and progress
+    
+    Read from the primary, not the snapshot: the create user/group/topic
+    forms redirect here and must show what was just created.
+    """
+    groups = Group.objects.select_related('created_by').annotate(
+        member_count=Count('members', distinct=True),
+        topic_count=Count('topics', distinct=True)
+    ).order_by('name')
     
     # Pagination
     paginator = Paginator(groups, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    # Per-group progress from the denormalized aggregates
+    aggregates = ProgressAggregate.objects.filter(group__in=[group.id for group in page_obj], topic__isnull=True)
+    progress_by_group = {aggregate.group_id: aggregate for aggregate in aggregates}
+    for group in page_obj:
+        group.progress = progress_by_group.get(group.id)
+    
     # Statistics
-    total_users = User.objects.count()
-    total_topics = Topic.objects.count()
+    totals = DashboardStats.totals()
     
     return render(request, 'core/admin_dashboard.html', {
         'page_obj': page_obj,
-        'total_users': total_users,
-        'total_topics': total_topics,
+        'total_users': totals['users'],
+        'total_groups': totals['groups'],
+        'total_topics': totals['topics'],
     })
 
 
 @user_passes_test(is_admin)
+@use_snapshot
 def group_detail_admin(request, group_id):
-    """Detailed view of group progress for admins"""
-    group = get_object_or_404(Group, id=group_id)
+    """Detailed view of group progress for admins
+    
+    Progress is shown as a member x topic matrix for one page of members,
+    built from one aggregated query per table. Attempt history is loaded
+    per cell from attempt_history.
+    """
+    group = get_object_or_404(
+        Group.objects.select_related('created_by').annotate(
+            member_count=Count('members', distinct=True),
+            topic_count=Count('topics', distinct=True)
+        ),
+        id=group_id
+    )
+    topics = list(group.topics.only('id', 'title', 'description', 'group_id'))
+    progress_by_topic = {
+        aggregate.topic_id: aggregate
+        for aggregate in ProgressAggregate.objects.filter(group=group, topic__isnull=False)
+    }
+    for topic in topics:
+        topic.progress = progress_by_topic.get(topic.id)
+    
+    paginator = Paginator(group.members.order_by('username'), 25)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    members = list(page_obj)
+    member_ids = [member.id for member in members]
+    
+    progress_rows = UserTopicProgress.objects.filter(
+        topic__group=group,
+        user_id__in=member_ids
+    ).order_by().values_list('user_id', 'topic_id', 'completed', 'total_attempts', 'final_score', 'total_time_spent')
+    attempt_rows = Attempt.objects.filter(
+        topic__group=group,
+        user_id__in=member_ids
+    ).values('user_id', 'topic_id').annotate(
+        attempt_count=Count('id'),
+        best_score=Max('score')
+    ).values_list('user_id', 'topic_id', 'attempt_count', 'best_score')
     
-    # Get all progress data for this group
-    progress_data = []
-    for member in group.members.all():
-        member_data = {
+    cells = {}
+    for user_id, topic_id, completed, total_attempts, final_score, total_time_spent in progress_rows:
+        cells[user_id, topic_id] = {
+            'completed': completed,
+            'attempts': total_attempts,
+            'final_score': final_score,
+            'best_score': None,
+            'time_spent': total_time_spent,
+        }
+    for user_id, topic_id, attempt_count, best_score in attempt_rows:
+        cell = cells.setdefault((user_id, topic_id), {
+            'completed': False,
+            'attempts': attempt_count,
+            'final_score': None,
+            'best_score': None,
+            'time_spent': 0,
+        })
+        cell['best_score'] = best_score
+    
+    # Matrix rows follow the member page; cells are (topic, progress or None)
+    matrix = [
+        {
             'user': member,
-            'topics': []
+            'cells': [(topic, cells.get((member.id, topic.id))) for topic in topics]
         }
-        
-        for topic in group.topics.all():
-            try:
-                progress = UserTopicProgress.objects.get(user=member, topic=topic)
-                attempts = Attempt.objects.filter(user=member, topic=topic).order_by('attempt_number')
-                
-                member_data['topics'].append({
-                    'topic': topic,
-                    'progress': progress,
-                    'attempts': attempts
-                })
-            except UserTopicProgress.DoesNotExist:
-                member_data['topics'].append({
-                    'topic': topic,
-                    'progress': None,
-                    'attempts': []
-                })
-        
-        progress_data.append(member_data)
+        for member in members
+    ]
+    
+    totals = UserTopicProgress.objects.filter(topic__group=group, user__ta_groups=group).aggregate(
+        completed_count=Count('id', filter=Q(completed=True)),
+        in_progress_count=Count('id', filter=Q(completed=False, total_attempts__gt=0))
+    )
     
     return render(request, 'core/group_detail_admin.html', {
         'group': group,
-        'progress_data': progress_data
+        'topics': topics,
+        'matrix': matrix,
+        'page_obj': page_obj,
+        'completed_count': totals['completed_count'],
+        'in_progress_count': totals['in_progress_count'],
+    })
+
+
+@user_passes_test(is_admin)
+@use_snapshot
+def attempt_history(request, group_id, user_id, topic_id):
+    """JSON attempt history for one cell of the group progress matrix"""
+    topic = get_object_or_404(Topic.objects.only('id', 'group_id'), id=topic_id, group_id=group_id)
+    attempts = Attempt.objects.filter(user_id=user_id, topic=topic).order_by('attempt_number').only(
+        'id', 'attempt_number', 'is_correct', 'score', 'time_spent', 'submitted_at', 'feedback'
+    )
+    return JsonResponse({
+        'attempts': [
+            {
+                'attempt_number': attempt.attempt_number,
+                'is_correct': attempt.is_correct,
+                'score': attempt.score,
+                'time_spent': attempt.time_spent,
+                'submitted_at': attempt.submitted_at.isoformat(),
+                'feedback': attempt.feedback,
+            }
+            for attempt in attempts
+        ]
     })
 
 
@@ -337,15 +588,12 @@ def create_topic(request):
             created_by=request.user
         )
         
-        # Generate AI content
-        success = TopicContentGenerator.generate_topic_content(topic)
+        # AI content is generated in the background
+        enqueue_topic_generation(topic)
         
-        if success:
-            messages.success(request, f'Topic {title} created successfully with AI content')
-        else:
-            messages.warning(request, f'Topic {title} created but AI content generation failed')
+        messages.success(request, f'Topic {title} created; AI content is being generated')
         
         return redirect('admin_dashboard')
     
-    groups = Group.objects.all()
+    groups = Group.objects.annotate(member_count=Count('members', distinct=True))
     return render(request, 'core/create_topic.html', {'groups': groups})
\ No newline at end of file
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+from django.conf import settings
+from django.db import connection, connections
+from . import metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_executor():
+    """Return the single writer thread, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        return _executor
+
+
+def _run_in_lane(func, args, kwargs):
+    _local.in_lane = True
+    _local.deferred = []
+    try:
+        return func(*args, **kwargs), _local.deferred
+    finally:
+        _local.in_lane = False
+        connections['default'].close_if_unusable_or_obsolete()
+
+
+def run_after_lane(callback):
+    """Run callback now, or on the submitting thread once the current lane job returns
+
+    Keeps slow work scheduled from a lane transaction's on_commit hooks
+    (e.g. eager AI tasks) off the writer thread.
+    """
+    if getattr(_local, 'in_lane', False):
+        _local.deferred.append(callback)
+    else:
+        callback()
+
+
+def run_serialized(func, *args, **kwargs):
+    """Run a short write transaction on the writer thread and wait for it
+
+    With SQLITE_WRITE_LANE off the function runs inline. It also runs inline
+    when the caller is already inside a transaction, whose locks and
+    uncommitted rows the writer thread's connection could not see.
+    """
+    if not settings.SQLITE_WRITE_LANE or connection.in_atomic_block or getattr(_local, 'in_lane', False):
+        return func(*args, **kwargs)
+    metrics.increment('write_lane.jobs')
+    result, deferred = _get_executor().submit(_run_in_lane, func, args, kwargs).result()
+    for callback in deferred:
+        callback()
+    return result
+
+
+def serialized(func):
+    """Decorator form of run_serialized"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_serialized(func, *args, **kwargs)
+    return wrapper
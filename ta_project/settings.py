@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -77,8 +78,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # File-backed test database so concurrency tests use real SQLite
+        # locking instead of shared-cache in-memory table locks
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Read-only copy of 'default' for admin and analytics views, refreshed
+    # with SQLite's online backup API (see core/snapshot.py). Only used
+    # when SNAPSHOT_DB_ENABLED is set
+    'snapshot': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SNAPSHOT_DB_PATH', BASE_DIR / 'db_snapshot.sqlite3'),
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_snapshot.sqlite3',
+        },
+    },
 }
+DATABASE_ROUTERS = ['core.routers.SnapshotRouter']
+
+# Snapshot reads: views fall back to 'default' (and a refresh is started)
+# once the snapshot is older than SNAPSHOT_MAX_STALENESS seconds
+SNAPSHOT_DB_ENABLED = os.getenv('SNAPSHOT_DB_ENABLED', 'False').lower() == 'true'
+SNAPSHOT_MAX_STALENESS = int(os.getenv('SNAPSHOT_MAX_STALENESS', '60'))  # seconds
+
+# SQLite connection profile, applied to every new connection (core/db.py).
+# WAL lets readers run alongside the writer; NORMAL sync is durable across
+# application crashes in WAL mode. Set a value to '' to leave the default
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', str(64 * 1024)))
+# Run hot-path write transactions (attempt reservation, evaluation results,
+# generation log inserts) one at a time on a dedicated thread per process
+SQLITE_WRITE_LANE = os.getenv('SQLITE_WRITE_LANE', 'False').lower() == 'true'
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -113,6 +147,20 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Largest canvas accepted by the binary (multipart / image/png) submit path
+CANVAS_UPLOAD_MAX_BYTES = int(os.getenv('CANVAS_UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+# Largest canvas dimensions decoded (twice the 800x600 drawing canvas);
+# a small PNG can expand to gigabytes of pixels, so larger ones get 400
+CANVAS_MAX_WIDTH = int(os.getenv('CANVAS_MAX_WIDTH', '1600'))  # pixels
+CANVAS_MAX_HEIGHT = int(os.getenv('CANVAS_MAX_HEIGHT', '1200'))  # pixels
+
+# Submitted canvases are cropped to the ink (plus a margin), quantized to a
+# palette and re-encoded before they are stored and sent for evaluation
+CANVAS_NORMALIZE = os.getenv('CANVAS_NORMALIZE', 'True').lower() == 'true'
+CANVAS_CROP_MARGIN = int(os.getenv('CANVAS_CROP_MARGIN', '32'))  # pixels
+CANVAS_PALETTE_COLORS = int(os.getenv('CANVAS_PALETTE_COLORS', '256'))
+CANVAS_STORAGE_FORMAT = os.getenv('CANVAS_STORAGE_FORMAT', 'png')  # 'png' or 'webp'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -144,6 +192,130 @@ IMAGE_MODEL = os.getenv('IMAGE_MODEL', 'dall-e-3')
 TEXT_API_URL = os.getenv('TEXT_API_URL', 'https://api.openai.com/v1/chat/completions')
 TEXT_MODEL = os.getenv('TEXT_MODEL', 'gpt-4')
 
+# AI provider HTTP client (pooled keep-alive sessions per endpoint)
+AI_HTTP_CONNECT_TIMEOUT = float(os.getenv('AI_HTTP_CONNECT_TIMEOUT', '5'))
+AI_HTTP_READ_TIMEOUT = float(os.getenv('AI_HTTP_READ_TIMEOUT', '90'))
+AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', '10'))
+AI_HTTP_MAX_RETRIES = int(os.getenv('AI_HTTP_MAX_RETRIES', '3'))
+AI_HTTP_BACKOFF_BASE = float(os.getenv('AI_HTTP_BACKOFF_BASE', '0.5'))
+AI_HTTP_BACKOFF_MAX = float(os.getenv('AI_HTTP_BACKOFF_MAX', '30'))
+# Client-side rate limits per provider endpoint (0 = unlimited). Buckets are
+# per process, so split the provider's quota between the processes calling
+# it. Calls that would wait longer than AI_RATE_LIMIT_MAX_WAIT fail instead
+AI_PROVIDER_RATE_LIMITS = {
+    'image': {
+        'requests_per_minute': int(os.getenv('AI_IMAGE_REQUESTS_PER_MINUTE', '0')),
+        'tokens_per_minute': int(os.getenv('AI_IMAGE_TOKENS_PER_MINUTE', '0')),
+    },
+    'text': {
+        'requests_per_minute': int(os.getenv('AI_TEXT_REQUESTS_PER_MINUTE', '0')),
+        'tokens_per_minute': int(os.getenv('AI_TEXT_TOKENS_PER_MINUTE', '0')),
+    },
+}
+AI_RATE_LIMIT_MAX_WAIT = float(os.getenv('AI_RATE_LIMIT_MAX_WAIT', '30'))  # seconds
+# Circuit breaker per provider: opens after this many consecutive failed
+# calls (connection errors, or 429/5xx once retries are used up), fails
+# fast for AI_CIRCUIT_RESET_TIMEOUT seconds, then lets probe calls through
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '5'))
+AI_CIRCUIT_RESET_TIMEOUT = float(os.getenv('AI_CIRCUIT_RESET_TIMEOUT', '30'))  # seconds
+AI_CIRCUIT_HALF_OPEN_PROBES = int(os.getenv('AI_CIRCUIT_HALF_OPEN_PROBES', '1'))
+# Hedged evaluation requests: an evaluation that has not answered by the
+# AI_HEDGE_PERCENTILE latency of the last AI_HEDGE_WINDOW evaluations (and
+# at least AI_HEDGE_MIN_DELAY) gets a second identical request; the first
+# answer wins. Hedges are capped at AI_HEDGE_MAX_RATE of evaluations
+AI_EVALUATION_HEDGING = os.getenv('AI_EVALUATION_HEDGING', 'False').lower() == 'true'
+AI_HEDGE_PERCENTILE = float(os.getenv('AI_HEDGE_PERCENTILE', '0.95'))
+AI_HEDGE_WINDOW = int(os.getenv('AI_HEDGE_WINDOW', '1000'))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv('AI_HEDGE_MIN_SAMPLES', '50'))
+AI_HEDGE_MIN_DELAY = float(os.getenv('AI_HEDGE_MIN_DELAY', '1'))  # seconds
+AI_HEDGE_MAX_RATE = float(os.getenv('AI_HEDGE_MAX_RATE', '0.05'))
+AI_HEDGE_WORKERS = int(os.getenv('AI_HEDGE_WORKERS', '16'))
+
+# AI response cache (text in the database, image blobs under MEDIA_ROOT)
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'True').lower() == 'true'
+AI_CACHE_DIR = os.getenv('AI_CACHE_DIR', 'ai_cache')
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(30 * 24 * 3600)))  # seconds
+AI_CACHE_MAX_BYTES = int(os.getenv('AI_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# The cache's total size is summed every this many inserts per process;
+# in between each process only adds up its own inserts
+AI_CACHE_EVICT_INTERVAL = int(os.getenv('AI_CACHE_EVICT_INTERVAL', '100'))
+# Identical image/text requests in flight are sent once; other callers in
+# this process wait for the result, and other processes on this host wait
+# on a lock file in AI_SINGLE_FLIGHT_LOCK_DIR and then read the AI cache
+# (empty disables the lock). Requests are hashed onto a fixed set of
+# AI_SINGLE_FLIGHT_LOCK_STRIPES lock files, so the directory never grows
+AI_SINGLE_FLIGHT_LOCK_DIR = os.getenv('AI_SINGLE_FLIGHT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'ta_ai_locks'))
+AI_SINGLE_FLIGHT_LOCK_STRIPES = int(os.getenv('AI_SINGLE_FLIGHT_LOCK_STRIPES', '256'))
+AI_SINGLE_FLIGHT_TIMEOUT = float(os.getenv('AI_SINGLE_FLIGHT_TIMEOUT', '300'))  # seconds
+
+# Evaluation reuse for near-duplicate canvases (core/canvas.py). The closest
+# attempt by 64-bit ink key (Hamming distance; negative disables the lookup)
+# is reused only if its 1536-bit detail hash is also close: a few stray
+# pixels move the detail hash by ~6 bits, while mirrored, rotated or
+# recoloured drawings are 30+ bits apart
+EVALUATION_PHASH_MAX_DISTANCE = int(os.getenv('EVALUATION_PHASH_MAX_DISTANCE', '3'))
+EVALUATION_PHASH_VERIFY_DISTANCE = int(os.getenv('EVALUATION_PHASH_VERIFY_DISTANCE', '12'))
+PHASH_INDEX_TTL = int(os.getenv('PHASH_INDEX_TTL', '300'))  # seconds
+
+# Background AI work (evaluation runs off the request thread)
+AI_TASKS_EAGER = os.getenv('AI_TASKS_EAGER', 'False').lower() == 'true'
+AI_TASK_WORKERS = int(os.getenv('AI_TASK_WORKERS', '4'))
+# 'thread' runs AI work on an executor inside the web process; 'db' writes
+# it to the AIJob table for `manage.py run_ai_workers` to pick up
+AI_TASK_BACKEND = os.getenv('AI_TASK_BACKEND', 'thread')
+AI_JOB_MAX_ATTEMPTS = int(os.getenv('AI_JOB_MAX_ATTEMPTS', '5'))
+AI_JOB_LEASE_SECONDS = int(os.getenv('AI_JOB_LEASE_SECONDS', '300'))
+AI_JOB_BACKOFF_BASE = float(os.getenv('AI_JOB_BACKOFF_BASE', '10'))  # seconds
+AI_JOB_BACKOFF_MAX = float(os.getenv('AI_JOB_BACKOFF_MAX', '600'))  # seconds
+AI_JOB_POLL_INTERVAL = float(os.getenv('AI_JOB_POLL_INTERVAL', '1'))  # seconds
+# Fair share between users within a scheduling class, e.g. "teacher:0.5,alice:2"
+# (username:weight; everyone else has weight 1)
+AI_JOB_USER_WEIGHTS = {
+    username: float(weight)
+    for username, weight in (item.split(':') for item in os.getenv('AI_JOB_USER_WEIGHTS', '').split(',') if item)
+}
+# Jobs running against each provider at once, across all workers
+AI_PROVIDER_CONCURRENCY = {
+    'image': int(os.getenv('AI_IMAGE_CONCURRENCY', '4')),
+    'text': int(os.getenv('AI_TEXT_CONCURRENCY', '8')),
+}
+# Wait-time percentiles cover this many recently started jobs per class
+AI_JOB_STATS_SAMPLE = int(os.getenv('AI_JOB_STATS_SAMPLE', '1000'))
+# Bound on concurrent image/text provider calls within this process
+AI_GENERATION_WORKERS = int(os.getenv('AI_GENERATION_WORKERS', '8'))
+
+# Caches. The page cache holds per-user data for the home and topic pages
+# and the group memberships behind access checks. It is a file cache that
+# every worker process on this host shares, so invalidations made by one
+# process reach the others and entries keep their full TTLs. A per-process
+# PAGE_CACHE_BACKEND (django.core.cache.backends.locmem.LocMemCache) never
+# sees other processes' invalidations, so its entries are kept for at most
+# LOCAL_CACHE_MAX_TTL
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': os.getenv('PAGE_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('PAGE_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'ta_page_cache')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('PAGE_CACHE_MAX_ENTRIES', '10000'))},
+    },
+}
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'True').lower() == 'true'
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', '600'))  # seconds
+# Per-user group memberships used for topic access checks
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', '600'))  # seconds
+# Fallback for a per-process (LocMem) page cache: revocations only reach
+# the process that made them, so its entries live at most this long
+LOCAL_CACHE_MAX_TTL = int(os.getenv('LOCAL_CACHE_MAX_TTL', '5'))  # seconds
+
+# Admin dashboard totals (users/groups/topics) are cached this many seconds
+DASHBOARD_TOTALS_TTL = int(os.getenv('DASHBOARD_TOTALS_TTL', '60'))
+# Unfiltered admin changelists of tables at least this large show the
+# database's row estimate instead of running COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', '10000'))
+
 # Login/Logout URLs
 LOGIN_URL = '/admin/login/'
 LOGIN_REDIRECT_URL = '/'